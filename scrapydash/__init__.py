@@ -15,7 +15,7 @@ import traceback
 from .common import handle_metadata
 # Removed Flask-SQLAlchemy import
 # from .models import Metadata, db
-from .vars import PYTHON_VERSION, SCRAPY_VERSION, SCRAPYD_VERSION, SQLALCHEMY_BINDS, SQLALCHEMY_DATABASE_URI
+from .vars import PYTHON_VERSION
 # from .utils.scheduler import scheduler
 
 # Configure logging for FastAPI
@@ -38,8 +38,16 @@ dictConfig({
 # This file is kept for backward compatibility but Flask functionality moved to app.py
 # The create_app function is now in app.py for FastAPI
 
+def __getattr__(name):
+    # Resolved on first access without I/O on import, see vars.py
+    if name in ['SCRAPY_VERSION', 'SCRAPYD_VERSION', 'SQLALCHEMY_BINDS', 'SQLALCHEMY_DATABASE_URI']:
+        from . import vars
+        return getattr(vars, name)
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
 def internal_server_error(error):
     """Legacy function - moved to FastAPI exception handler in app.py"""
+    from .vars import SCRAPY_VERSION, SCRAPYD_VERSION
     kwargs = dict(
         error=error,
         traceback=traceback.format_exc(),
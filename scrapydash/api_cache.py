@@ -0,0 +1,135 @@
+# coding: utf-8
+"""
+In-process cache for read-only Scrapyd API calls
+"""
+import asyncio
+from collections import OrderedDict
+import json
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Seconds to cache each read-only opt, 0 to disable
+DEFAULT_API_CACHE_TTL = dict(listprojects=10, listversions=10, listspiders=10, daemonstatus=3)
+DEFAULT_API_CACHE_MAX_BYTES = 8 * 1024 * 1024
+# Calls that change what the read-only opts above would return
+MUTATING_OPTS = ['addversion', 'delproject', 'delversion', 'schedule', 'cancel']
+
+CacheKey = Tuple[int, str, Optional[str], Optional[str]]  # (node, opt, project, version)
+
+
+class ApiCache:
+    """
+    TTL + LRU cache keyed by (node, opt, project, version), capped by the approximate size
+    of the cached JSON, with single-flight coalescing of concurrent misses on the same key.
+    """
+
+    def __init__(self, ttl: Optional[Dict[str, int]] = None, max_bytes: int = DEFAULT_API_CACHE_MAX_BYTES):
+        self.ttl = dict(DEFAULT_API_CACHE_TTL)
+        self.ttl.update(ttl or {})
+        self.max_bytes = max_bytes
+        self._entries: 'OrderedDict[CacheKey, Tuple[float, int, Any]]' = OrderedDict()  # (expire_at, size, value)
+        self._inflight: Dict[CacheKey, asyncio.Future] = {}
+        self._generation: Dict[int, int] = {}  # node -> bumped on every invalidation
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict[str, Any]] = None) -> 'ApiCache':
+        config = config or {}
+        return cls(config.get('SCRAPYD_API_CACHE_TTL'),
+                   config.get('SCRAPYD_API_CACHE_MAX_BYTES', DEFAULT_API_CACHE_MAX_BYTES))
+
+    def cacheable(self, opt: str) -> bool:
+        return self.ttl.get(opt, 0) > 0 and self.max_bytes > 0
+
+    def get(self, key: CacheKey) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expire_at, __, value = entry
+        if expire_at < time.monotonic():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: CacheKey, value: Any, generation: Optional[int] = None):
+        node, opt = key[0], key[1]
+        if generation is not None and generation != self._generation.get(node, 0):
+            return  # Invalidated while fetching
+        size = len(json.dumps(value, default=str))
+        if size > self.max_bytes:
+            return
+        self._remove(key)
+        self._entries[key] = (time.monotonic() + self.ttl.get(opt, 0), size, value)
+        self.size += size
+        while self.size > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: CacheKey):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[1]
+
+    def invalidate(self, node: int, project: Optional[str] = None):
+        """Drop cached results of a node affected by a change of project (or of the whole node)"""
+        self._generation[node] = self._generation.get(node, 0) + 1
+        for key in list(self._entries):
+            if key[0] == node and (project is None or key[2] in (None, project)):
+                self._remove(key)
+        # Later callers should not join a call which started before the change
+        for key in list(self._inflight):
+            if key[0] == node and (project is None or key[2] in (None, project)):
+                self._inflight.pop(key)
+        logger.debug("Invalidated cache of node %s, project %s", node, project)
+
+    def clear(self):
+        self._entries.clear()
+        self.size = 0
+
+    async def get_or_fetch(self, key: CacheKey, fetch: Callable[[], Awaitable[Tuple[int, Any]]],
+                           ok: Callable[[int, Any], bool] = lambda status_code, js: status_code == 200):
+        """
+        Return (status_code, js) of key from the cache, or via fetch() on a miss.
+        Concurrent misses on the same key share one call of fetch().
+        Only results accepted by ok() are cached.
+        """
+        value = self.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+        future = self._inflight.get(key)
+        if future is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            generation = self._generation.get(key[0], 0)
+
+            async def leader():
+                try:
+                    result = await fetch()
+                    if ok(*result):
+                        self.set(key, result, generation)
+                    return result
+                finally:
+                    if self._inflight.get(key) is future:
+                        self._inflight.pop(key)
+
+            # A task, so that a disconnected caller would not cancel the call for other waiters
+            future = asyncio.ensure_future(leader())
+            self._inflight[key] = future
+        return await asyncio.shield(future)
+
+
+def get_api_cache(app) -> ApiCache:
+    """Return the cache created in lifespan, or a fresh one if lifespan has not run (e.g. in tests)"""
+    cache = getattr(app.state, 'api_cache', None)
+    if cache is None:
+        cache = ApiCache.from_config(getattr(app.state, 'config', None))
+        app.state.api_cache = cache
+    return cache
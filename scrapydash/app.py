@@ -1,5 +1,6 @@
 # coding: utf-8
 import argparse
+import asyncio
 import logging
 import os
 import sys
@@ -16,9 +17,22 @@ from fastapi.responses import HTMLResponse, RedirectResponse
 from .routers import api, system
 from .auth import get_current_user_optional
 from .scheduler import scheduler_manager
+from .api_cache import ApiCache
+from .artifact_store import get_artifact_store
+from .egg_cache import get_egg_cache
+from .project_index import get_project_index
+from .engines import registry as engine_registry
+from .jobs_migrate import backfill_job_rollups, migrate_legacy_jobs_tables
+from .jobs_snapshot import JobsSnapshotWorker
+from .metadata_store import metadata_store
+from .models import init_db
+from .report_store import ReportStore
+from .scrapyd_client import ScrapydClient
+from .task_executor import task_runner
 from .__version__ import __description__, __version__
 from .common import find_scrapydash_settings_py, handle_metadata
-from .vars import ROOT_DIR, SCRAPYDASH_SETTINGS_PY
+from .vars import ROOT_DIR, SCRAPYDASH_SETTINGS_PY, STATE_PAUSED
+from .vars import init as init_vars
 
 logger = logging.getLogger(__name__)
 
@@ -28,14 +42,48 @@ async def lifespan(app: FastAPI):
     """FastAPI lifespan context manager"""
     # Startup
     print(f"Starting ScrapydWeb FastAPI v{__version__}")
+    # Create the data directories and databases, which is no longer done on import, see vars.py
+    timings = await asyncio.to_thread(init_vars)
+    config = app.state.config
+    engine_registry.configure(pool_size=config.get('DATABASE_POOL_SIZE'),
+                              max_overflow=config.get('DATABASE_MAX_OVERFLOW'),
+                              pool_recycle=config.get('DATABASE_POOL_RECYCLE'),
+                              busy_timeout=config.get('DATABASE_BUSY_TIMEOUT'))
+    await asyncio.to_thread(init_db)
+    try:
+        await asyncio.to_thread(migrate_legacy_jobs_tables, engine_registry.get_engine('jobs'),
+                                config.get('SCRAPYD_SERVERS', []))
+        await asyncio.to_thread(backfill_job_rollups, engine_registry.get_engine('jobs'))
+    except Exception as err:
+        logger.error("Fail to migrate the legacy Job tables: %s", err)
+    logger.info("Init phases took: %s", ', '.join('%s %.3fs' % (k, v) for k, v in timings.items()))
     try:
         scheduler_manager.start()
         print("Scheduler started successfully")
     except Exception as e:
         print(f"Warning: Could not start scheduler: {e}")
+    # Serve metadata from memory, flushing writes and picking up those of other workers in the background
+    metadata_store.start(app.state.config.get('METADATA_SYNC_INTERVAL', 5))
+    # Shared by all requests to Scrapyd servers, see routers/api.py
+    app.state.scrapyd_client = ScrapydClient(app.state.config)
+    app.state.api_cache = ApiCache.from_config(app.state.config)
+    app.state.report_store = ReportStore.from_config(app.state.config)
+    await asyncio.to_thread(app.state.report_store.compact)
+    # Keep the Job tables up to date off the request path, paused along with the scheduler for timer tasks
+    app.state.jobs_snapshot_worker = JobsSnapshotWorker(
+        app.state.config, app.state.scrapyd_client,
+        is_paused=lambda: handle_metadata().get('scheduler_state') == STATE_PAUSED)
+    app.state.jobs_snapshot_worker.start()
+    # Timer tasks fired by the threads of APScheduler run in this loop, see task_executor.py
+    task_runner.attach(asyncio.get_running_loop(), app.state.scrapyd_client, app.state.config)
     
     yield
     
+    task_runner.detach()
+    await app.state.jobs_snapshot_worker.stop()
+    await app.state.scrapyd_client.aclose()
+    await metadata_store.stop()
+    await asyncio.to_thread(engine_registry.dispose)
     # Shutdown
     try:
         scheduler_manager.shutdown()
@@ -118,12 +166,39 @@ def create_app(test_config=None):
         'PASSWORD': '',
         'ENABLE_HTTPS': False,
         'SCRAPY_PROJECTS_DIR': '/path/to/projects',
+        'PROJECT_INDEX_REFRESH_INTERVAL': 5,
+        'EGG_CACHE_MAX_BYTES': 256 * 1024 * 1024,
+        'EGG_CACHE_MAX_AGE': 30,
+        'DEPLOY_RETRIES': 2,
+        'DEPLOY_UPLOAD_MAX_BYTES': 100 * 1024 * 1024,
+        'DEPLOY_EXTRACT_MAX_BYTES': 500 * 1024 * 1024,
+        'ARTIFACTS_MAX_VERSIONS': 20,
         'SCRAPYD_LOGS_DIR': '/path/to/logs',
         'SCRAPYD_ITEMS_DIR': '/path/to/items',
         'SCRAPYD_SERVERS': ["127.0.0.1:6800", "127.0.0.1:6801", "127.0.0.1:6802"],
         'SCRAPYD_SERVERS_GROUPS': ["Group 1"],
         'SCRAPYD_SERVERS_AUTHS': [None, None, None],
         'CHECK_SCRAPYD_SERVERS': True,
+        'SCRAPYD_CONNECT_TIMEOUT': 5,
+        'SCRAPYD_READ_TIMEOUT': 30,
+        'SCRAPYD_MAX_CONNECTIONS_PER_NODE': 20,
+        'SCRAPYD_MAX_KEEPALIVE_PER_NODE': 10,
+        'SCRAPYD_FANOUT_CONCURRENCY': 20,
+        'SCRAPYD_API_CACHE_TTL': dict(listprojects=10, listversions=10, listspiders=10, daemonstatus=3),
+        'SCRAPYD_API_CACHE_MAX_BYTES': 8 * 1024 * 1024,
+        'SCRAPYD_LOG_EXTENSIONS': ['.log', '.log.gz', '.txt'],
+        'LOCAL_SCRAPYD_SERVER': '',
+        'LOCAL_SCRAPYD_LOGS_DIR': '',
+        'LOG_FOLLOW_INTERVAL': 2,
+        'LOG_FOLLOW_TIMEOUT': 3600,
+        'STATS_REPORTS_LIMIT': 10000,
+        'STATS_REPORTS_MAX_AGE': 90,
+        'JOBS_SNAPSHOT_INTERVAL': 300,
+        'METADATA_SYNC_INTERVAL': 5,
+        'DATABASE_POOL_SIZE': 10,
+        'DATABASE_MAX_OVERFLOW': 20,
+        'DATABASE_POOL_RECYCLE': 3600,
+        'DATABASE_BUSY_TIMEOUT': 30,
         'ENABLE_LOGPARSER': False,
         'JOBS_TO_KEEP': 100,
         'LOGS_TO_KEEP': 100,
@@ -318,6 +393,9 @@ def create_app(test_config=None):
     @app.get("/1/deploy/", response_class=HTMLResponse)
     async def deploy_page(request: Request, user=get_current_user_optional):
         """Deploy project page"""
+        index = get_project_index(request.app)
+        projects = await asyncio.to_thread(index.list_projects)
+        all_nodes = list(range(1, len(request.app.state.config.get('SCRAPYD_SERVERS', [])) + 1))
         g_context = FlaskG(
             IS_MOBILE=False,
             url_menu_servers="/1/servers/",
@@ -336,15 +414,17 @@ def create_app(test_config=None):
             "ENABLE_AUTH": False,
             "SCRAPYDASH_VERSION": __version__,
             "node": 1,
-            "SCRAPY_PROJECTS_DIR": "/path/to/projects",
-            "folders": ["project1", "project2", "project3"],
-            "projects": ["project1", "project2", "project3"],
-            "modification_times": ["2024-01-01_12-00-00", "2024-01-02_13-00-00", "2024-01-03_14-00-00"],
-            "latest_folder": "project1",
+            "SCRAPY_PROJECTS_DIR": index.projects_dir,
+            "folders": [p['folder'] for p in projects],
+            "projects": [p['project'] for p in projects],
+            "modification_times": [p['modification_time_str'] for p in projects],
+            "latest_folder": max(projects, key=lambda p: p['modification_time'])['folder'] if projects else '',
             "url": "https://scrapyd.readthedocs.io/en/stable/api.html#addversion-json",
             "url_projects": "/1/projects/",
             "url_deploy_upload": "/1/deploy/upload/",
             "selected_nodes": [],
+            "egg_cache_stats": await asyncio.to_thread(get_egg_cache(request.app).get_stats),
+            "version_drift": await asyncio.to_thread(get_artifact_store(request.app).drift, all_nodes),
         }
         
         return templates.TemplateResponse("deploy.html", {
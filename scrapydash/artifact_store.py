@@ -0,0 +1,247 @@
+# coding: utf-8
+"""
+Artifact store module for keeping the eggs deployed, by (project, version), under DEPLOY_PATH/artifacts,
+as blobs named by the sha256 of the egg so that the versions with the same egg share a blob.
+Along with the versions received by each node, so that any version can be redeployed, or rolled back to,
+without a rebuild, and the version drift across the cluster is known without requesting listversions.json.
+"""
+from datetime import datetime
+import hashlib
+import logging
+import os
+import shutil
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .deploy import Egg
+
+logger = logging.getLogger(__name__)
+
+ARTIFACTS_DIR_NAME = 'artifacts'
+DEFAULT_ARTIFACTS_MAX_VERSIONS = 20  # Per project
+CHUNK_SIZE = 1024 * 1024
+
+
+def get_default_session_factory():
+    from .models import db
+    return db.Session
+
+
+def hash_egg(egg: Egg) -> Tuple[str, int]:
+    """Return (sha256, size) of the content of an egg, or of the egg file at the path, read in chunks"""
+    if isinstance(egg, bytes):
+        return hashlib.sha256(egg).hexdigest(), len(egg)
+    h = hashlib.sha256()
+    size = 0
+    with open(egg, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            h.update(chunk)
+            size += len(chunk)
+    return h.hexdigest(), size
+
+
+class ArtifactStore:
+    """
+    The eggs deployed lately, at most max_versions per project, 0 for no limit, as <digest>.egg in path,
+    indexed by the EggArtifact table, and the versions deployed to each node in the EggDeployment table.
+    The versions still current on any node are never dropped.
+    """
+
+    def __init__(self, path: str, session_factory: Optional[Callable] = None,
+                 max_versions: int = DEFAULT_ARTIFACTS_MAX_VERSIONS):
+        self.path = path
+        self.session_factory = session_factory
+        self.max_versions = max_versions
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, path: str, config: Optional[Dict[str, Any]] = None,
+                    session_factory: Optional[Callable] = None) -> 'ArtifactStore':
+        config = config or {}
+        return cls(path, session_factory, config.get('ARTIFACTS_MAX_VERSIONS', DEFAULT_ARTIFACTS_MAX_VERSIONS))
+
+    def get_session(self):
+        from .models import EggArtifact, EggDeployment, ensure_table
+        if self.session_factory is None:
+            self.session_factory = get_default_session_factory()
+        session = self.session_factory()
+        for model in [EggArtifact, EggDeployment]:
+            ensure_table(model.__table__, session.get_bind(model))
+        return session
+
+    def get_path(self, digest: str) -> str:
+        return os.path.join(self.path, digest + '.egg')
+
+    def save_blob(self, egg: Egg, digest: str) -> bool:
+        """Save the egg as the blob of digest unless saved before, return whether it was saved now"""
+        path = self.get_path(digest)
+        if os.path.exists(path):
+            return False
+        os.makedirs(self.path, exist_ok=True)
+        tmp_path = '%s.%s.tmp' % (path, os.getpid())
+        if isinstance(egg, bytes):
+            with open(tmp_path, 'wb') as f:
+                f.write(egg)
+        else:
+            shutil.copyfile(egg, tmp_path)
+        os.replace(tmp_path, path)  # Never leave a partial blob behind
+        return True
+
+    def remove_blobs(self, session, digests: List[str]):
+        """Remove the blobs of digests no longer referred to by any version"""
+        from .models import EggArtifact
+        for digest in set(digests):
+            if session.query(EggArtifact.id).filter(EggArtifact.digest == digest).first() is None:
+                try:
+                    os.remove(self.get_path(digest))
+                except OSError as err:
+                    logger.warning("Fail to remove egg blob %s: %s", digest, err)
+
+    def put(self, project: str, version: str, egg: Egg) -> Dict[str, Any]:
+        """Keep the egg of a version, replacing the one kept before if any, return dict(digest, size, new)"""
+        from .models import EggArtifact
+        digest, size = hash_egg(egg)
+        with self._lock:
+            new = self.save_blob(egg, digest)
+            session = self.get_session()
+            try:
+                row = session.query(EggArtifact).filter_by(project=project, version=version).first()
+                replaced = []
+                if row is None:
+                    session.add(EggArtifact(project=project, version=version, digest=digest, size=size))
+                elif row.digest != digest:
+                    replaced.append(row.digest)
+                    row.digest, row.size, row.create_time = digest, size, datetime.now()
+                session.commit()
+                self.remove_blobs(session, replaced)
+            except Exception:
+                session.rollback()
+                raise
+            finally:
+                session.close()
+            self.prune(project)
+        logger.debug("Kept egg of %s %s as %s, new blob: %s", project, version, digest, new)
+        return dict(project=project, version=version, digest=digest, size=size, new=new)
+
+    def get(self, project: str, version: str) -> Optional[Dict[str, Any]]:
+        """Return dict(path, digest, size, create_time) of the egg of a version, or None if not kept"""
+        from .models import EggArtifact
+        session = self.get_session()
+        try:
+            row = session.query(EggArtifact).filter_by(project=project, version=version).first()
+        finally:
+            session.close()
+        if row is None or not os.path.exists(self.get_path(row.digest)):
+            return None
+        return dict(path=self.get_path(row.digest), digest=row.digest, size=row.size,
+                    create_time=str(row.create_time))
+
+    def record_deployment(self, node: int, project: str, version: str, digest: str):
+        """Record that a node has received a version, which becomes the current version of the node"""
+        from .models import EggDeployment
+        session = self.get_session()
+        try:
+            row = session.query(EggDeployment).filter_by(node=node, project=project, version=version).first()
+            if row is None:
+                row = EggDeployment(node=node, project=project, version=version)
+                session.add(row)
+            row.digest = digest
+            row.deploy_time = datetime.now()
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    def get_current_versions(self, project: Optional[str] = None, session=None) -> Dict[str, Dict[int, Any]]:
+        """Return {project: {node: dict(version, digest, deploy_time)}} of the versions deployed last"""
+        from .models import EggDeployment
+        own_session = session is None
+        session = session or self.get_session()
+        try:
+            query = session.query(EggDeployment)
+            if project:
+                query = query.filter(EggDeployment.project == project)
+            rows = query.order_by(EggDeployment.deploy_time, EggDeployment.id).all()
+        finally:
+            if own_session:
+                session.close()
+        current: Dict[str, Dict[int, Any]] = {}
+        for row in rows:  # The latest one wins
+            current.setdefault(row.project, {})[row.node] = dict(version=row.version, digest=row.digest,
+                                                                 deploy_time=str(row.deploy_time))
+        return current
+
+    def list_versions(self, project: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Return the versions kept, most recent first, with the nodes on which each one is current"""
+        from .models import EggArtifact
+        session = self.get_session()
+        try:
+            query = session.query(EggArtifact)
+            if project:
+                query = query.filter(EggArtifact.project == project)
+            rows = query.order_by(EggArtifact.create_time.desc(), EggArtifact.id.desc()).all()
+            current = self.get_current_versions(project, session)
+        finally:
+            session.close()
+        return [dict(project=row.project, version=row.version, digest=row.digest, size=row.size,
+                     create_time=str(row.create_time),
+                     nodes=sorted(node for node, v in current.get(row.project, {}).items()
+                                  if v['version'] == row.version))
+                for row in rows]
+
+    def drift(self, nodes: List[int], project: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+        """
+        Return {project: dict(latest, nodes, behind, missing)} for the nodes given, where latest is the version
+        deployed last, nodes is {node: current version or None}, behind the nodes on another version
+        and missing the nodes to which the project has never been deployed.
+        """
+        result = {}
+        for name, versions in sorted(self.get_current_versions(project).items()):
+            latest = max(versions.values(), key=lambda x: x['deploy_time'])['version']
+            on_nodes = dict((node, versions[node]['version'] if node in versions else None) for node in nodes)
+            result[name] = dict(latest=latest, nodes=on_nodes,
+                                behind=[node for node, v in on_nodes.items() if v is not None and v != latest],
+                                missing=[node for node, v in on_nodes.items() if v is None])
+        return result
+
+    def prune(self, project: str) -> int:
+        """Drop the oldest versions of a project beyond max_versions, except the current ones, return how many"""
+        from .models import EggArtifact, EggDeployment
+        if self.max_versions <= 0:
+            return 0
+        session = self.get_session()
+        try:
+            rows = (session.query(EggArtifact).filter(EggArtifact.project == project)
+                    .order_by(EggArtifact.create_time.desc(), EggArtifact.id.desc()).all())
+            if len(rows) <= self.max_versions:
+                return 0
+            current = set(v['version'] for v in self.get_current_versions(project, session).get(project, {}).values())
+            dropped = [row for row in rows[self.max_versions:] if row.version not in current]
+            digests = [row.digest for row in dropped]
+            for row in dropped:
+                session.query(EggDeployment).filter_by(project=project, version=row.version).delete(
+                    synchronize_session=False)
+                session.delete(row)
+            session.commit()
+            self.remove_blobs(session, digests)
+        except Exception as err:
+            session.rollback()
+            logger.error("Fail to prune the eggs of %s: %s", project, err)
+            return 0
+        finally:
+            session.close()
+        if dropped:
+            logger.info("Dropped %s eggs of %s beyond %s versions", len(dropped), project, self.max_versions)
+        return len(dropped)
+
+
+def get_artifact_store(app) -> ArtifactStore:
+    """Return the store of the app, created on first use under DEPLOY_PATH"""
+    store = getattr(app.state, 'artifact_store', None)
+    if store is None:
+        from . import vars
+        store = app.state.artifact_store = ArtifactStore.from_config(
+            os.path.join(vars.DEPLOY_PATH, ARTIFACTS_DIR_NAME), getattr(app.state, 'config', None))
+    return store
@@ -12,7 +12,6 @@ import requests
 from requests.adapters import HTTPAdapter
 from w3lib.http import basic_auth_header
 
-from .__version__ import __version__
 from .models import Metadata, db
 
 logger = logging.getLogger(__name__)
@@ -102,51 +101,17 @@ def get_response_from_view(url, auth=None, data=None, as_json=False):
 
 
 def handle_metadata(key=None, value=None):
-    """Handle metadata operations with graceful error handling"""
-    try:
-        # Import models locally to avoid circular imports
-        from .models import Metadata, db
-        
-        # Ensure database tables exist
-        try:
-            db.create_all()
-        except Exception:
-            pass  # Tables might already exist
-        
-        # Perform database operation
-        try:
-            metadata = db.session.query(Metadata).filter_by(version=__version__).first()
-            
-            if key is None:
-                # Return all metadata as dict
-                if metadata:
-                    return dict((k, v) for (k, v) in metadata.__dict__.items() if not k.startswith('_'))
-                else:
-                    return {}
-            else:
-                # Set or update metadata value
-                if not metadata:
-                    # Create new metadata record
-                    metadata = Metadata(version=__version__)
-                    db.session.add(metadata)
-                
-                if value is not None:
-                    setattr(metadata, key, value)
-                
-                db.session.commit()
-                return metadata
-                
-        except Exception as e:
-            print(f"Database operation failed: {e}")
-            try:
-                db.session.rollback()
-            except:
-                pass
-            return {} if key is None else None
-            
-    except Exception as e:
-        print(f"Error in handle_metadata: {e}")
-        return {} if key is None else None
+    """
+    Return all metadata as a dict if key is None, else set metadata[key] to value.
+    Served from memory by metadata_store, see metadata_store.py
+    """
+    # Import locally to avoid circular imports
+    from .metadata_store import metadata_store
+    if key is None:
+        return metadata_store.get_all()
+    if value is not None:
+        metadata_store.set(key, value)
+    return metadata_store.get_all()
 
 
 def handle_slash(string):
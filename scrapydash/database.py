@@ -1,18 +1,12 @@
 # coding: utf-8
-from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
 from typing import Generator
 
-# Database configuration
-SQLALCHEMY_DATABASE_URL = "sqlite:///./scrapydash.db"
+from .engines import RoutingSession, registry
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, 
-    connect_args={"check_same_thread": False}
-)
-
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Database configuration: the engines are shared with models.py, see engines.py
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, class_=RoutingSession)
 Base = declarative_base()
 
 def get_db() -> Generator[Session, None, None]:
@@ -29,4 +23,4 @@ def get_db_session() -> Generator[Session, None, None]:
 
 def init_db():
     """Initialize database tables"""
-    Base.metadata.create_all(bind=engine)
+    Base.metadata.create_all(bind=registry.get_engine())
@@ -98,6 +98,32 @@ PRIVATEKEY_FILEPATH = ''
 # so that you can simply select a project to deploy, instead of packaging it in advance.
 # e.g. 'C:/Users/username/myprojects' or '/home/username/myprojects'
 SCRAPY_PROJECTS_DIR = ''
+# The projects found are indexed in memory, and the index is refreshed at most once every
+# PROJECT_INDEX_REFRESH_INTERVAL seconds, rescanning only the directories which have changed.
+PROJECT_INDEX_REFRESH_INTERVAL = 5
+
+# The eggs built for the projects above are cached in DEPLOY_PATH/egg_cache, named by a hash of the files
+# of a project, so that deploying a project which has not changed reuses its egg instead of building it again.
+# The eggs unused for EGG_CACHE_MAX_AGE days are dropped, then the least recently used ones
+# once all eggs take more than EGG_CACHE_MAX_BYTES. Set either to 0 for no limit.
+EGG_CACHE_MAX_BYTES = 256 * 1024 * 1024
+EGG_CACHE_MAX_AGE = 30
+
+# When deploying to multiple nodes, the egg is uploaded to SCRAPYD_FANOUT_CONCURRENCY nodes at a time,
+# and the nodes which are unreachable or answer with a 5xx status are retried up to DEPLOY_RETRIES times.
+DEPLOY_RETRIES = 2
+
+# An egg or a zip or tar archive of a project uploaded on the Deploy page is streamed to disk, and rejected
+# once beyond DEPLOY_UPLOAD_MAX_BYTES. Only the files needed to build the egg are extracted from an archive,
+# DEPLOY_EXTRACT_MAX_BYTES in total at most.
+DEPLOY_UPLOAD_MAX_BYTES = 100 * 1024 * 1024
+DEPLOY_EXTRACT_MAX_BYTES = 500 * 1024 * 1024
+
+# The eggs deployed are kept in DEPLOY_PATH/artifacts by project and version, deduplicated by content,
+# so that any version can be redeployed or rolled back to without a rebuild, along with the versions
+# received by each node. At most ARTIFACTS_MAX_VERSIONS versions are kept per project, besides those
+# still deployed on any node. Set it to 0 for no limit.
+ARTIFACTS_MAX_VERSIONS = 20
 
 
 ############################## Scrapyd ########################################
@@ -115,6 +141,34 @@ SCRAPYD_LOG_EXTENSIONS = ['.log', '.log.gz', '.txt']
 # See https://github.com/EmanueleCannizzaro0/scrapydash/issues/94 for more info.
 SCRAPYD_SERVERS_PUBLIC_URLS = None
 
+# Requests to Scrapyd servers share a long-lived connection pool per server.
+# A connection attempt fails after SCRAPYD_CONNECT_TIMEOUT seconds, the default is 5,
+# while waiting for the response fails after SCRAPYD_READ_TIMEOUT seconds, the default is 30.
+SCRAPYD_CONNECT_TIMEOUT = 5
+SCRAPYD_READ_TIMEOUT = 30
+# The maximum number of concurrent connections and idle keep-alive connections to each Scrapyd server.
+# The defaults are 20 and 10.
+SCRAPYD_MAX_CONNECTIONS_PER_NODE = 20
+SCRAPYD_MAX_KEEPALIVE_PER_NODE = 10
+
+# Cluster-wide API calls (e.g. /cluster/api/daemonstatus?group=xxx) are sent to
+# at most N Scrapyd servers at the same time. The default is 20.
+SCRAPYD_FANOUT_CONCURRENCY = 20
+
+# Results of the read-only Scrapyd APIs below are cached in memory for N seconds, so that
+# all open pages polling the same Scrapyd server share one request. Set the value to 0 to disable caching.
+# Cached results of a Scrapyd server are dropped right away after deploying, deleting, scheduling or cancelling.
+SCRAPYD_API_CACHE_TTL = dict(listprojects=10, listversions=10, listspiders=10, daemonstatus=3)
+# The maximum memory used by the cache above, in bytes. The default is 8 * 1024 * 1024 (8 MB).
+SCRAPYD_API_CACHE_MAX_BYTES = 8 * 1024 * 1024
+
+# Scrapy logfiles are streamed in chunks, read from LOCAL_SCRAPYD_LOGS_DIR or requested with HTTP Range headers,
+# so that even a logfile of several GB can be viewed, e.g. the last 1000 lines: /api/1/log/demo/test/job?lines=1000
+# With ?follow=true, the new lines of a running job are pushed every LOG_FOLLOW_INTERVAL seconds,
+# until the browser disconnects or LOG_FOLLOW_TIMEOUT seconds have passed.
+LOG_FOLLOW_INTERVAL = 2
+LOG_FOLLOW_TIMEOUT = 3600
+
 
 ############################## LogParser ######################################
 # Whether to backup the stats json files locally after you visit the Stats page of a job
@@ -122,6 +176,14 @@ SCRAPYD_SERVERS_PUBLIC_URLS = None
 # The default is True, set it to False to disable this behavior.
 BACKUP_STATS_JSON_FILE = True
 
+# The reports of finished jobs (pages, items, runtime, finish reason and the counts of log categories)
+# are kept in the database, so that the Node Reports and Cluster Reports pages are served at once,
+# even after a restart, without requesting the logfiles again.
+# The oldest reports are dropped once there are more than STATS_REPORTS_LIMIT reports,
+# or once they have not been updated for STATS_REPORTS_MAX_AGE days. Set either to 0 for no limit.
+STATS_REPORTS_LIMIT = 10000
+STATS_REPORTS_MAX_AGE = 90
+
 
 ############################## Timer Tasks ####################################
 # Run ScrapydWeb with argument '-sw' or '--switch_scheduler_state', or click the ENABLED|DISABLED button
@@ -129,6 +191,8 @@ BACKUP_STATS_JSON_FILE = True
 
 # The default is 300, which means ScrapydWeb would automatically create a snapshot of the Jobs page
 # and save the jobs info in the database in the background every 300 seconds.
+# Each node is synced on its own, with a jitter of 10% of the interval,
+# and the time and duration of the last sync of each node is available at /api/jobs/snapshot.
 # Note that this behavior would be paused if the scheduler for timer tasks is disabled.
 # Set it to 0 to disable this behavior.
 JOBS_SNAPSHOT_INTERVAL = 300
@@ -286,10 +350,15 @@ ENABLE_MONITOR = False
 # you can reduce the value of POLL_ROUND_INTERVAL and POLL_REQUEST_INTERVAL,
 # at the cost of burdening both CPU and bandwidth of your servers.
 
+# All nodes are polled in parallel, and the time taken by each round is logged,
+# which can help to tune the options below.
 # Sleep N seconds before starting next round of poll, the default is 300.
 POLL_ROUND_INTERVAL = 300
-# Sleep N seconds between each request to the Scrapyd server while polling, the default is 10.
+# Wait at least N seconds between the starts of two requests for the same Scrapyd server
+# while polling, the default is 10. Set it to 0 to rely on POLL_REQUEST_CONCURRENCY only.
 POLL_REQUEST_INTERVAL = 10
+# The maximum number of concurrent requests for the same Scrapyd server while polling, the default is 1.
+POLL_REQUEST_CONCURRENCY = 1
 
 ########## alert switcher ##########
 # Tip: Set the SCRAPYDASH_BIND option the in "QUICK SETUP" section to the actual IP of your host,
@@ -385,3 +454,19 @@ DATA_PATH = os.environ.get('DATA_PATH', '')
 # 'sqlite:///C:/Users/username'
 # 'sqlite:////home/username'
 DATABASE_URL = os.environ.get('DATABASE_URL', '')
+
+# One pooled engine is shared per database by all requests, timer tasks and the scheduler.
+# DATABASE_POOL_SIZE connections are kept open, and up to DATABASE_MAX_OVERFLOW more could be opened meanwhile.
+# Connections are checked before use and recycled after DATABASE_POOL_RECYCLE seconds.
+DATABASE_POOL_SIZE = 10
+DATABASE_MAX_OVERFLOW = 20
+DATABASE_POOL_RECYCLE = 3600
+# SQLite only: the databases are in WAL mode, and a write waits up to DATABASE_BUSY_TIMEOUT seconds
+# for a lock held by another thread or process, instead of failing with 'database is locked'.
+DATABASE_BUSY_TIMEOUT = 30
+
+# The default is 5, which means the metadata (e.g. the state of the scheduler for timer tasks) is read from memory,
+# while the changes are written to the database and the changes made by other workers are picked up
+# every 5 seconds in the background. The pending changes are also written on shutdown.
+# Set it to 0 to write every change at once, in which case the changes of other workers would not be picked up.
+METADATA_SYNC_INTERVAL = 5
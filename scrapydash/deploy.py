@@ -0,0 +1,111 @@
+# coding: utf-8
+"""
+Deploy module for adding versions of the Scrapy projects in SCRAPY_PROJECTS_DIR to Scrapyd servers,
+with the eggs built via the egg cache, see egg_cache.py
+"""
+import asyncio
+from contextlib import nullcontext
+import logging
+import os
+import re
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple, Union
+
+import httpx
+
+from .common import get_now_string
+from .scrapyd_client import ScrapydClient, get_scrapyd_server
+from .vars import LEGAL_NAME_PATTERN, STRICT_NAME_PATTERN
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DEPLOY_RETRIES = 2
+# Seconds before the first retry, doubled for each of the next ones
+RETRY_DELAY = 1
+
+Egg = Union[bytes, str]  # The content of an egg, or the path of the egg file
+
+
+def clean_project_name(project: Optional[str]) -> str:
+    # Error: Project names must begin with a letter and contain only letters, numbers and underscores
+    return re.sub(STRICT_NAME_PATTERN, '_', project or '') or get_now_string()
+
+
+def clean_version(version: Optional[str]) -> str:
+    return re.sub(LEGAL_NAME_PATTERN, '-', version or '') or get_now_string()
+
+
+def find_scrapy_cfg(search_path: str) -> str:
+    """Return the directory of the first scrapy.cfg found in search_path, or '' if not found"""
+    for dirpath, dirnames, filenames in os.walk(search_path):
+        if 'scrapy.cfg' in filenames:
+            return os.path.abspath(dirpath)
+    logger.error("scrapy.cfg not found in: %s", search_path)
+    return ''
+
+
+async def add_version(client: ScrapydClient, config: Dict[str, Any], node: int, project: str, version: str,
+                      egg: Egg) -> Tuple[int, Dict[str, Any]]:
+    """
+    Upload an egg via addversion.json of a Scrapyd server, returning (status_code, js) instead of raising.
+    egg is either the content of the egg or the path of the egg file, which is opened for each upload
+    and streamed in chunks, so that concurrent uploads neither share a file position nor load the egg in memory.
+    """
+    base_url, auth = get_scrapyd_server(config, node)
+    url = '%s/addversion.json' % base_url
+    try:
+        with (open(egg, 'rb') if isinstance(egg, str) else nullcontext(egg)) as content:
+            r = await client.post(url, auth=auth, data=dict(project=project, version=version),
+                                  files=dict(egg=('%s_%s.egg' % (project, version), content)))
+        r.raise_for_status()
+        return r.status_code, r.json()
+    except httpx.HTTPStatusError as err:
+        return err.response.status_code, dict(status='error', message=str(err), server=base_url)
+    except httpx.HTTPError as err:
+        return 500, dict(status='error', message="Failed to connect to Scrapyd server: %s" % err, server=base_url)
+    except ValueError as err:
+        return 500, dict(status='error', message="Invalid response of %s: %s" % (url, err), server=base_url)
+    except OSError as err:
+        return 500, dict(status='error', message="Fail to read the egg: %s" % err, server=base_url)
+
+
+async def add_version_with_retries(client: ScrapydClient, config: Dict[str, Any], node: int, project: str,
+                                   version: str, egg: Egg, retries: int = DEFAULT_DEPLOY_RETRIES,
+                                   retry_delay: Optional[float] = None) -> Tuple[int, Dict[str, Any]]:
+    """
+    Like add_version(), retrying up to retries times with exponential backoff if the node is unreachable
+    or answers 5xx, but not if Scrapyd rejects the egg. The number of attempts is added to js.
+    """
+    retry_delay = RETRY_DELAY if retry_delay is None else retry_delay
+    attempt = 0
+    while True:
+        attempt += 1
+        status_code, js = await add_version(client, config, node, project, version, egg)
+        if js.get('status') == 'ok' or status_code < 500 or attempt > retries:
+            return status_code, dict(js, attempts=attempt)
+        logger.warning("[node %s] Retry deploying %s %s in %ss: %s", node, project, version,
+                       retry_delay * 2 ** (attempt - 1), js.get('message'))
+        await asyncio.sleep(retry_delay * 2 ** (attempt - 1))
+
+
+async def deploy_to_nodes(client: ScrapydClient, config: Dict[str, Any], nodes: List[int], project: str,
+                          version: str, egg: Egg, concurrency: int = 20, retries: int = DEFAULT_DEPLOY_RETRIES,
+                          retry_delay: Optional[float] = None) -> AsyncIterator[Tuple[int, int, Dict[str, Any]]]:
+    """
+    Upload the egg to all nodes concurrently, at most concurrency at a time, all from the same buffer or file,
+    yielding (node, status_code, js) as each node answers. The uploads left are cancelled on exit.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def deploy(node):
+        async with semaphore:
+            status_code, js = await add_version_with_retries(client, config, node, project, version, egg,
+                                                             retries, retry_delay)
+        return node, status_code, js
+
+    tasks = [asyncio.ensure_future(deploy(node)) for node in nodes]
+    try:
+        for future in asyncio.as_completed(tasks):
+            yield await future
+    finally:
+        for task in tasks:
+            task.cancel()
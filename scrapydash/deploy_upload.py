@@ -0,0 +1,200 @@
+# coding: utf-8
+"""
+Deploy upload module for the eggs and project archives uploaded on the Deploy page:
+the request body is streamed to disk in chunks and rejected once beyond the size limit,
+and only the files needed to build the egg are extracted from an archive, never outside the target directory.
+"""
+import logging
+import os
+import re
+import stat
+import tarfile
+from typing import IO, Any, AsyncIterator, Callable, List, Optional, Tuple
+import zipfile
+import zlib
+
+from starlette.datastructures import FormData, UploadFile
+from starlette.formparsers import MultiPartException, MultiPartParser
+
+from .egg_cache import is_project_file
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+DEFAULT_UPLOAD_MAX_BYTES = 100 * 1024 * 1024
+DEFAULT_EXTRACT_MAX_BYTES = 500 * 1024 * 1024
+MAX_MEMBERS = 10000
+ARCHIVE_EXTENSIONS = ('.egg', '.zip', '.tar.gz', '.tgz', '.tar.bz2', '.tar.xz', '.tar')
+DRIVE_PATTERN = re.compile(r'^[A-Za-z]:')
+
+Member = Tuple[str, int, Any]  # (name with '/', size, ZipInfo or TarInfo)
+
+
+class UploadError(Exception):
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+async def limit_stream(stream: AsyncIterator[bytes], max_bytes: int) -> AsyncIterator[bytes]:
+    """Pass the chunks of a request body through, raising UploadError once more than max_bytes are received"""
+    received = 0
+    async for chunk in stream:
+        received += len(chunk)
+        if received > max_bytes:
+            raise UploadError("The upload exceeds %s bytes" % max_bytes, 413)
+        yield chunk
+
+
+async def parse_upload(request, max_bytes: int = DEFAULT_UPLOAD_MAX_BYTES) -> FormData:
+    """
+    Parse a multipart request with one file, whose content is spooled to a temporary file in chunks,
+    so that at most a chunk and the spool threshold of Starlette are held in memory.
+    """
+    length = request.headers.get('content-length', '')
+    if length.isdigit() and int(length) > max_bytes:
+        raise UploadError("The upload exceeds %s bytes" % max_bytes, 413)
+    if not request.headers.get('content-type', '').startswith('multipart/form-data'):
+        raise UploadError("Content-Type multipart/form-data expected")
+    parser = MultiPartParser(request.headers, limit_stream(request.stream(), max_bytes), max_files=1, max_fields=10)
+    try:
+        return await parser.parse()
+    except MultiPartException as err:
+        raise UploadError(str(err))
+
+
+def get_upload_file(form: FormData, field: str = 'file') -> UploadFile:
+    upload = form.get(field)
+    if not isinstance(upload, UploadFile):
+        raise UploadError("No file uploaded")
+    return upload
+
+
+def copy_limited(src: IO[bytes], dst: IO[bytes], max_bytes: int) -> int:
+    """Copy src to dst in chunks, raising UploadError once more than max_bytes are read, return the size"""
+    copied = 0
+    for chunk in iter(lambda: src.read(CHUNK_SIZE), b''):
+        copied += len(chunk)
+        if copied > max_bytes:
+            raise UploadError("More than %s bytes to write" % max_bytes, 413)
+        dst.write(chunk)
+    return copied
+
+
+def save_egg(fileobj: IO[bytes], egg_path: str, max_bytes: int = DEFAULT_UPLOAD_MAX_BYTES) -> int:
+    """Save an uploaded egg as egg_path in chunks, once checked to be a zip file, return the size"""
+    fileobj.seek(0)
+    if not zipfile.is_zipfile(fileobj):
+        raise UploadError("The uploaded egg is not a valid zip file")
+    fileobj.seek(0)
+    with open(egg_path, 'wb') as f:
+        return copy_limited(fileobj, f, max_bytes)
+
+
+def check_member_name(name: str) -> str:
+    """Return the name of an archive member with '/', raising UploadError if it points outside the archive"""
+    name = name.replace('\\', '/')
+    parts = name.split('/')
+    if name.startswith('/') or DRIVE_PATTERN.match(name) or '..' in parts:
+        raise UploadError("Illegal path in the archive: %s" % name)
+    return '/'.join(part for part in parts if part not in ('', '.'))
+
+
+def list_zip_members(f: zipfile.ZipFile, max_members: int) -> List[Member]:
+    if len(f.infolist()) > max_members:
+        raise UploadError("The archive contains more than %s members" % max_members, 413)
+    members = []
+    for info in f.infolist():
+        name = check_member_name(info.filename)
+        # Neither directories nor symlinks are extracted, directories are created for the files inside
+        if not info.is_dir() and not stat.S_ISLNK(info.external_attr >> 16) and name:
+            members.append((name, info.file_size, info))
+    return members
+
+
+def list_tar_members(f: tarfile.TarFile, max_members: int) -> List[Member]:
+    members = []
+    # Iterating reads the headers one by one, instead of loading them all up front like getmembers()
+    for index, info in enumerate(f, 1):
+        if index > max_members:
+            raise UploadError("The archive contains more than %s members" % max_members, 413)
+        name = check_member_name(info.name)
+        if info.isfile() and name:  # Links, devices and fifos are never extracted
+            members.append((name, info.size, info))
+    return members
+
+
+def select_members(members: List[Member]) -> List[Tuple[str, Member]]:
+    """
+    Return [(path relative to the directory of scrapy.cfg, member)] of the members to build the egg from,
+    the scrapy.cfg nearest to the top of the archive being taken. Raise UploadError if there is none.
+    """
+    cfgs = [name for name, __, __ in members if name.split('/')[-1] == 'scrapy.cfg']
+    if not cfgs:
+        raise UploadError("scrapy.cfg not found in the archive", 404)
+    cfg = min(cfgs, key=lambda name: (name.count('/'), name))
+    prefix = cfg[:-len('scrapy.cfg')]
+    selected = []
+    for member in members:
+        relpath = member[0][len(prefix):]
+        if member[0].startswith(prefix) and is_project_file(relpath):
+            selected.append((relpath, member))
+    return selected
+
+
+def extract_members(selected: List[Tuple[str, Member]], open_member: Callable[[Any], IO[bytes]], dest: str,
+                    max_bytes: int):
+    real_dest = os.path.realpath(dest)
+    declared = sum(member[1] for __, member in selected)
+    if declared > max_bytes:
+        raise UploadError("The extracted files would take %s bytes, over %s" % (declared, max_bytes), 413)
+    remaining = max_bytes
+    for relpath, (__, __, info) in selected:
+        path = os.path.realpath(os.path.join(real_dest, *relpath.split('/')))
+        if not path.startswith(real_dest + os.sep):
+            raise UploadError("Illegal path in the archive: %s" % relpath)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        src = open_member(info)
+        try:
+            with open(path, 'wb') as dst:
+                # The sizes in the headers are not trusted, in case of a crafted archive
+                remaining -= copy_limited(src, dst, remaining)
+        finally:
+            src.close()
+
+
+def extract_project(fileobj: IO[bytes], dest: str, max_bytes: int = DEFAULT_EXTRACT_MAX_BYTES,
+                    max_members: int = MAX_MEMBERS) -> int:
+    """
+    Extract the Scrapy project in an uploaded zip or tar archive, i.e. the files needed to build the egg
+    under the scrapy.cfg nearest to the top, so that scrapy.cfg ends up right in dest.
+    Raise UploadError for an invalid archive, a path outside dest or files beyond the limits.
+    Return the number of files extracted.
+    """
+    fileobj.seek(0)
+    try:
+        if zipfile.is_zipfile(fileobj):
+            fileobj.seek(0)
+            with zipfile.ZipFile(fileobj) as f:
+                selected = select_members(list_zip_members(f, max_members))
+                extract_members(selected, f.open, dest, max_bytes)
+        else:
+            fileobj.seek(0)
+            with tarfile.open(fileobj=fileobj, mode='r:*') as f:
+                selected = select_members(list_tar_members(f, max_members))
+                extract_members(selected, f.extractfile, dest, max_bytes)
+    except (zipfile.BadZipFile, tarfile.TarError, EOFError, NotImplementedError, zlib.error) as err:
+        raise UploadError("Fail to extract the archive: %s" % err)
+    logger.debug("Extracted %s files to %s", len(selected), dest)
+    return len(selected)
+
+
+def get_upload_extension(filename: Optional[str]) -> str:
+    """The extension of an uploaded file among ARCHIVE_EXTENSIONS, raising UploadError if unsupported"""
+    filename = (filename or '').lower()
+    for extension in ARCHIVE_EXTENSIONS:
+        if filename.endswith(extension):
+            return extension
+    raise UploadError("Only %s files are supported" % ', '.join(ARCHIVE_EXTENSIONS))
+
@@ -0,0 +1,244 @@
+# coding: utf-8
+"""
+Egg cache module for building the egg of a Scrapy project once per content:
+eggs are saved under DEPLOY_PATH/egg_cache, named by a hash of the file tree of the project,
+so that deploying an unchanged project again, e.g. to another group of nodes, skips the build.
+"""
+import asyncio
+from collections import OrderedDict
+from configparser import ConfigParser, Error as ScrapyCfgParseError
+import hashlib
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional, Tuple
+import weakref
+
+logger = logging.getLogger(__name__)
+
+# Change it along with the way eggs are built, so that the eggs built before are not used any more
+CACHE_VERSION = 1
+CACHE_DIR_NAME = 'egg_cache'
+DEFAULT_EGG_CACHE_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_EGG_CACHE_MAX_AGE = 30  # Days
+# Not part of the project, or written by the builds
+IGNORED_DIRS = {'build', 'project.egg-info', '__pycache__'}
+IGNORED_TOP_FILES = {'setup.py', 'setup_backup.py'}
+IGNORED_EXTENSIONS = ('.egg', '.pyc', '.pyo')
+# {(path, size, mtime_ns): sha256} of the files hashed lately, so that unchanged files are not read again
+FILE_DIGESTS_LIMIT = 10000
+file_digests: 'OrderedDict[Tuple[str, int, int], str]' = OrderedDict()
+
+SETUP_PY_TEMPLATE = """# Automatically created by: scrapydash x scrapyd-client
+
+from setuptools import setup, find_packages
+
+setup(
+    name         = 'project',
+    version      = '1.0',
+    packages     = find_packages(),
+    entry_points = {'scrapy': ['settings = %(settings)s']},
+)
+"""
+
+
+class BuildError(Exception):
+    pass
+
+
+def list_project_files(project_path: str) -> List[Tuple[str, str]]:
+    """Return [(relative path with '/', path)] of the files to build the egg from, sorted"""
+    files = []
+    for dirpath, dirnames, filenames in os.walk(project_path):
+        dirnames[:] = [d for d in dirnames if d not in IGNORED_DIRS]
+        top = os.path.samefile(dirpath, project_path)
+        for filename in filenames:
+            if filename.endswith(IGNORED_EXTENSIONS) or (top and filename in IGNORED_TOP_FILES):
+                continue
+            path = os.path.join(dirpath, filename)
+            files.append((os.path.relpath(path, project_path).replace(os.sep, '/'), path))
+    files.sort()
+    return files
+
+
+def is_project_file(relpath: str) -> bool:
+    """Whether the file at relpath, with '/', relative to the directory of scrapy.cfg, goes into the egg"""
+    parts = relpath.split('/')
+    if any(part in IGNORED_DIRS for part in parts[:-1]):
+        return False
+    return not (relpath.endswith(IGNORED_EXTENSIONS) or (len(parts) == 1 and relpath in IGNORED_TOP_FILES))
+
+
+def get_file_digest(path: str) -> str:
+    st = os.stat(path)
+    key = (path, st.st_size, st.st_mtime_ns)
+    digest = file_digests.get(key)
+    if digest is None:
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                h.update(chunk)
+        digest = file_digests[key] = h.hexdigest()
+        if len(file_digests) > FILE_DIGESTS_LIMIT:
+            file_digests.popitem(last=False)
+    return digest
+
+
+def hash_project(files: List[Tuple[str, str]]) -> str:
+    """The cache key of a project: the paths and contents of its files, scrapy.cfg included"""
+    h = hashlib.sha256(('%s|%s.%s' % ((CACHE_VERSION,) + sys.version_info[:2])).encode('utf-8'))
+    for relpath, path in files:
+        h.update(('\0%s\0%s' % (relpath, get_file_digest(path))).encode('utf-8'))
+    return h.hexdigest()
+
+
+def build_egg(project_path: str, files: List[Tuple[str, str]], egg_path: str):
+    """
+    Build the egg of a project with 'setup.py bdist_egg' like scrapyd-deploy, from a copy of its files,
+    so that neither setup.py nor the build directories of the project are touched. Save it as egg_path.
+    """
+    config = ConfigParser()
+    try:
+        config.read(os.path.join(project_path, 'scrapy.cfg'))
+        settings = config.get('settings', 'default')  # e.g. demo.settings
+    except ScrapyCfgParseError as err:
+        raise BuildError("scrapy.cfg parse error: %s" % err)
+    tmpdir = tempfile.mkdtemp(prefix='scrapydash-deploy-')
+    try:
+        src = os.path.join(tmpdir, 'project')
+        for relpath, path in files:
+            dst = os.path.join(src, *relpath.split('/'))
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            shutil.copy2(path, dst)
+        with open(os.path.join(src, 'setup.py'), 'w') as f:
+            f.write(SETUP_PY_TEMPLATE % dict(settings=settings))
+        dist = os.path.join(tmpdir, 'dist')
+        try:
+            subprocess.run([sys.executable, 'setup.py', 'clean', '-a', 'bdist_egg', '-d', dist], cwd=src,
+                           stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+        except subprocess.CalledProcessError as err:
+            raise BuildError("Fail to build egg: %s\n%s" % (err, err.stderr.decode('utf-8', 'replace')[-2000:]))
+        egg = [name for name in os.listdir(dist) if name.endswith('.egg')][0]
+        tmp_path = '%s.%s.tmp' % (egg_path, os.getpid())
+        shutil.copyfile(os.path.join(dist, egg), tmp_path)
+        os.replace(tmp_path, egg_path)  # Never leave a partial egg behind
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+class EggCache:
+    """
+    The eggs built lately, as <key>.egg in cache_path, where the mtime of an egg is the time it was last used.
+    Eggs unused for max_age days are dropped, then the least recently used ones beyond max_bytes in total.
+    """
+
+    def __init__(self, cache_path: str, max_bytes: int = DEFAULT_EGG_CACHE_MAX_BYTES,
+                 max_age: int = DEFAULT_EGG_CACHE_MAX_AGE):
+        self.cache_path = cache_path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.stats = dict(hits=0, misses=0, builds=0, build_seconds=0.0, evictions=0)
+        self._locks: 'weakref.WeakValueDictionary[str, asyncio.Lock]' = weakref.WeakValueDictionary()
+
+    @classmethod
+    def from_config(cls, cache_path: str, config: Optional[Dict[str, Any]] = None) -> 'EggCache':
+        config = config or {}
+        return cls(cache_path, config.get('EGG_CACHE_MAX_BYTES', DEFAULT_EGG_CACHE_MAX_BYTES),
+                   config.get('EGG_CACHE_MAX_AGE', DEFAULT_EGG_CACHE_MAX_AGE))
+
+    def get_path(self, key: str) -> str:
+        return os.path.join(self.cache_path, key + '.egg')
+
+    async def get_egg(self, project_path: str) -> Dict[str, Any]:
+        """
+        Return dict(path, key, hit, size) of the egg of the project in project_path (where scrapy.cfg is),
+        building it unless an egg of the same content is cached. Raise BuildError if the build fails.
+        """
+        files = await asyncio.to_thread(list_project_files, project_path)
+        key = await asyncio.to_thread(hash_project, files)
+        path = self.get_path(key)
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        # Deploying the same project at once builds it only once
+        async with lock:
+            hit = await asyncio.to_thread(self.touch, path)
+            if hit:
+                self.stats['hits'] += 1
+                logger.debug("Hit egg cache %s for %s", key, project_path)
+            else:
+                self.stats['misses'] += 1
+                start = time.monotonic()
+                await asyncio.to_thread(os.makedirs, self.cache_path, exist_ok=True)
+                await asyncio.to_thread(build_egg, project_path, files, path)
+                self.stats['builds'] += 1
+                self.stats['build_seconds'] += time.monotonic() - start
+                logger.info("Built egg %s for %s in %.3fs", key, project_path, time.monotonic() - start)
+                await asyncio.to_thread(self.evict, keep=path)
+        return dict(path=path, key=key, hit=hit, size=os.path.getsize(path))
+
+    @staticmethod
+    def touch(path: str) -> bool:
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def list_entries(self) -> List[Tuple[str, int, float]]:
+        """Return [(path, size, last used time)] of the cached eggs, least recently used first"""
+        entries = []
+        try:
+            with os.scandir(self.cache_path) as it:
+                for entry in it:
+                    if entry.name.endswith('.egg') and entry.is_file():
+                        st = entry.stat()
+                        entries.append((entry.path, st.st_size, st.st_mtime))
+        except FileNotFoundError:
+            pass
+        entries.sort(key=lambda x: x[2])
+        return entries
+
+    def evict(self, now: Optional[float] = None, keep: Optional[str] = None) -> int:
+        """Drop the eggs beyond the limits of age and size except keep, return the number dropped"""
+        now = time.time() if now is None else now
+        entries = self.list_entries()
+        total = sum(size for __, size, __ in entries)
+        dropped = 0
+        for path, size, used in entries:
+            expired = self.max_age > 0 and used < now - self.max_age * 86400
+            if path == keep or not (expired or (self.max_bytes > 0 and total > self.max_bytes)):
+                continue
+            try:
+                os.remove(path)
+            except OSError as err:
+                logger.warning("Fail to remove cached egg %s: %s", path, err)
+                continue
+            total -= size
+            dropped += 1
+        self.stats['evictions'] += dropped
+        if dropped:
+            logger.info("Dropped %s cached eggs, %s bytes left", dropped, total)
+        return dropped
+
+    def get_stats(self) -> Dict[str, Any]:
+        entries = self.list_entries()
+        requests = self.stats['hits'] + self.stats['misses']
+        return dict(self.stats, build_seconds=round(self.stats['build_seconds'], 3),
+                    hit_ratio=round(self.stats['hits'] / requests, 3) if requests else None,
+                    eggs=len(entries), bytes=sum(size for __, size, __ in entries),
+                    max_bytes=self.max_bytes, max_age=self.max_age)
+
+
+def get_egg_cache(app) -> EggCache:
+    """Return the cache of the app, created on first use under DEPLOY_PATH"""
+    cache = getattr(app.state, 'egg_cache', None)
+    if cache is None:
+        from . import vars
+        cache = app.state.egg_cache = EggCache.from_config(os.path.join(vars.DEPLOY_PATH, CACHE_DIR_NAME),
+                                                           getattr(app.state, 'config', None))
+    return cache
@@ -0,0 +1,155 @@
+# coding: utf-8
+"""
+Engine registry module: one pooled engine per database, shared by all sessions and APScheduler
+"""
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import QueuePool, StaticPool
+
+logger = logging.getLogger(__name__)
+
+# The bind key of APSCHEDULER_DATABASE_URI, besides those of SQLALCHEMY_BINDS
+BIND_APSCHEDULER = 'apscheduler'
+DEFAULT_ENGINE_OPTIONS = dict(
+    pool_size=10,
+    max_overflow=20,
+    pool_recycle=3600,  # In seconds
+    busy_timeout=30,  # In seconds, SQLite only
+)
+# Declarative bases, to find the bind key of a table in Core statements
+declarative_bases: List[Any] = []
+_table_bind_keys: Dict[Any, Optional[str]] = {}
+
+
+def is_memory_sqlite(url) -> bool:
+    return url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')
+
+
+def set_sqlite_pragmas(engine: Engine, busy_timeout: float):
+    """WAL lets readers go on while a writer commits, and NORMAL is durable enough in WAL mode"""
+    @event.listens_for(engine, 'connect')
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute('PRAGMA journal_mode=WAL')
+            cursor.execute('PRAGMA synchronous=NORMAL')
+            cursor.execute('PRAGMA busy_timeout=%d' % int(busy_timeout * 1000))
+        finally:
+            cursor.close()
+
+
+def create_pooled_engine(uri: str, pool_size: int = 10, max_overflow: int = 20, pool_recycle: int = 3600,
+                         busy_timeout: float = 30) -> Engine:
+    url = make_url(uri)
+    if url.get_backend_name() != 'sqlite':
+        return create_engine(url, pool_size=pool_size, max_overflow=max_overflow,
+                             pool_pre_ping=True, pool_recycle=pool_recycle)
+    # Connections are handed over between the threads of the scheduler and of FastAPI
+    connect_args = dict(check_same_thread=False, timeout=busy_timeout)
+    if is_memory_sqlite(url):
+        return create_engine(url, connect_args=connect_args, poolclass=StaticPool)
+    # Given explicitly, as pysqlite defaults to NullPool for a file before SQLAlchemy 2.0
+    engine = create_engine(url, connect_args=connect_args, poolclass=QueuePool, pool_size=pool_size,
+                           max_overflow=max_overflow, pool_pre_ping=True, pool_recycle=pool_recycle)
+    set_sqlite_pragmas(engine, busy_timeout)
+    return engine
+
+
+class EngineRegistry:
+    """
+    {bind_key: uri} taken from SQLALCHEMY_DATABASE_URI (bind_key None), SQLALCHEMY_BINDS and
+    APSCHEDULER_DATABASE_URI, with one engine per distinct uri, created on first use.
+    """
+
+    def __init__(self, uris: Optional[Dict[Optional[str], str]] = None):
+        self.uris = dict(uris) if uris is not None else None
+        self.options: Dict[str, Any] = dict(DEFAULT_ENGINE_OPTIONS)
+        self.engines: Dict[str, Engine] = {}
+        self._lock = threading.RLock()
+
+    def configure(self, uris: Optional[Dict[Optional[str], str]] = None, **options):
+        """Set the uris and the engine options, which apply to the engines created afterwards"""
+        with self._lock:
+            if uris is not None:
+                self.uris = dict(uris)
+            self.options.update((k, v) for k, v in options.items() if v is not None)
+            if self.engines:
+                logger.warning("Engines of %s have been created before configure()", list(self.engines))
+
+    def load_uris(self) -> Dict[Optional[str], str]:
+        from . import vars
+        uris: Dict[Optional[str], str] = dict(vars.SQLALCHEMY_BINDS)
+        uris[None] = vars.SQLALCHEMY_DATABASE_URI
+        uris[BIND_APSCHEDULER] = vars.APSCHEDULER_DATABASE_URI
+        return uris
+
+    def get_uri(self, bind_key: Optional[str] = None) -> str:
+        if self.uris is None:
+            with self._lock:
+                if self.uris is None:
+                    self.uris = self.load_uris()
+        return self.uris.get(bind_key) or self.uris[None]
+
+    def get_engine(self, bind_key: Optional[str] = None) -> Engine:
+        uri = self.get_uri(bind_key)
+        engine = self.engines.get(uri)
+        if engine is None:
+            with self._lock:
+                engine = self.engines.get(uri)
+                if engine is None:
+                    engine = self.engines[uri] = create_pooled_engine(uri, **self.options)
+                    logger.debug("Created engine for bind %s: %s", bind_key, engine.url)
+        return engine
+
+    def dispose(self):
+        with self._lock:
+            for engine in self.engines.values():
+                engine.dispose()
+            self.engines.clear()
+
+
+registry = EngineRegistry()
+
+
+def register_base(base):
+    declarative_bases.append(base)
+
+
+def get_table_bind_key(table) -> Optional[str]:
+    if table not in _table_bind_keys:
+        # Models may be defined after the first lookup
+        for base in declarative_bases:
+            for mapper in base.registry.mappers:
+                for t in mapper.tables:
+                    _table_bind_keys[t] = getattr(mapper.class_, '__bind_key__', None)
+    return _table_bind_keys.get(table)
+
+
+def get_bind_key(mapper=None, clause=None) -> Optional[str]:
+    if mapper is not None:
+        # A Mapper, or a mapped class as in session.get_bind(Job)
+        return getattr(getattr(mapper, 'class_', mapper), '__bind_key__', None)
+    # Core statements, e.g. session.execute(insert(Job.__table__), rows)
+    table = getattr(clause, 'table', None)
+    if table is None and hasattr(clause, 'get_final_froms'):
+        froms = clause.get_final_froms()
+        table = froms[0] if froms else None
+    return get_table_bind_key(table) if table is not None else None
+
+
+class RoutingSession(Session):
+    """A session which routes each model to the engine of its __bind_key__, unless bound explicitly"""
+
+    def __init__(self, *args, engine_registry: Optional[EngineRegistry] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.engine_registry = engine_registry or registry
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if self.bind is not None:
+            return super().get_bind(mapper, clause=clause, **kwargs)
+        return self.engine_registry.get_engine(get_bind_key(mapper, clause))
@@ -0,0 +1,74 @@
+# coding: utf-8
+"""
+Jobs migrate module for moving the legacy Job tables, one per Scrapyd server, into the Job table keyed by node,
+and for building the JobRollup table of the existing jobs
+"""
+import logging
+import re
+from typing import Dict, List
+from urllib.parse import urlsplit
+
+from sqlalchemy import MetaData, Table, and_, exists, insert, inspect, literal, select, text
+from sqlalchemy.orm import Session
+
+from .jobs_sync import query_finished_jobs, rebuild_job_rollups
+from .models import Job, JobRollup, ensure_table
+from .scrapyd_client import parse_scrapyd_server
+from .vars import STRICT_NAME_PATTERN
+
+logger = logging.getLogger(__name__)
+
+# A migrated legacy table is renamed, e.g. '127_0_0_1_6800' => '127_0_0_1_6800_migrated'
+MIGRATED_SUFFIX = '_migrated'
+LEGACY_COLUMNS = ['project', 'spider', 'job', 'status', 'deleted', 'create_time', 'update_time',
+                  'pages', 'items', 'pid', 'start', 'runtime', 'finish', 'href_log', 'href_items']
+
+
+def get_legacy_tablename(server: str) -> str:
+    """e.g. '127_0_0_1_6800' for 'username:password@127.0.0.1:6800#group'"""
+    base_url, __ = parse_scrapyd_server(server.split('#')[0].strip())
+    return re.sub(STRICT_NAME_PATTERN, '_', urlsplit(base_url).netloc)
+
+
+def migrate_legacy_jobs_table(conn, node: int, tablename: str) -> int:
+    """Copy the rows which are not in the Job table yet with a single INSERT ... SELECT"""
+    legacy = Table(tablename, MetaData(), autoload_with=conn)
+    columns = [c for c in LEGACY_COLUMNS if c in legacy.c]
+    job = Job.__table__
+    not_migrated = ~exists().where(and_(job.c.node == node, job.c.project == legacy.c.project,
+                                        job.c.spider == legacy.c.spider, job.c.job == legacy.c.job))
+    query = select(literal(node).label('node'), *[legacy.c[c] for c in columns]).where(not_migrated)
+    result = conn.execute(insert(job).from_select(['node'] + columns, query))
+    preparer = conn.dialect.identifier_preparer
+    conn.execute(text('ALTER TABLE %s RENAME TO %s' % (preparer.quote(tablename),
+                                                      preparer.quote(tablename + MIGRATED_SUFFIX))))
+    return result.rowcount
+
+
+def migrate_legacy_jobs_tables(engine, servers: List[str]) -> Dict[int, int]:
+    """
+    Move the legacy table of each node of SCRAPYD_SERVERS into the Job table, each in one transaction,
+    and return {node: number of rows copied}. Nodes without a legacy table are skipped.
+    """
+    ensure_table(Job.__table__, engine)
+    tablenames = set(inspect(engine).get_table_names())
+    migrated = {}
+    for node, server in enumerate(servers, 1):
+        tablename = get_legacy_tablename(server)
+        if tablename not in tablenames or tablename == Job.__tablename__:
+            continue
+        with engine.begin() as conn:
+            migrated[node] = migrate_legacy_jobs_table(conn, node, tablename)
+        # The same server may have been configured under another node
+        tablenames.discard(tablename)
+        logger.info("Migrated %s jobs of node %s from legacy table %s", migrated[node], node, tablename)
+    return migrated
+
+
+def backfill_job_rollups(engine) -> int:
+    """Build JobRollup from the Job table if it is empty, e.g. after migrating the legacy Job tables"""
+    ensure_table(JobRollup.__table__, engine)
+    with Session(bind=engine) as session:
+        if session.query(JobRollup.id).first() is not None or query_finished_jobs(session).first() is None:
+            return 0
+        return rebuild_job_rollups(session)
@@ -0,0 +1,128 @@
+# coding: utf-8
+"""
+Jobs query module for searching the job history of all nodes in the Job table,
+and for aggregating it by node, spider and time from the pre-aggregated JobRollup table.
+"""
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import func
+
+from .jobs_sync import NOT_DELETED, STATUS_FINISHED, STATUS_PENDING, STATUS_RUNNING, get_hour
+from .models import Job, JobRollup
+
+STATUS_NAMES = dict(pending=STATUS_PENDING, running=STATUS_RUNNING, finished=STATUS_FINISHED)
+# See pagination.SortKey, the columns of the time sorts are NOT NULL in the results
+SEARCH_SORTS = dict(
+    id=[(Job.id, True)],  # Newest first
+    finish=[(Job.finish, True), (Job.id, True)],  # Latest finished first
+    start=[(Job.start, False), (Job.id, False)],  # Earliest started first, e.g. the longest-running jobs
+)
+TIME_FIELDS = dict(start=Job.start, finish=Job.finish)
+ROLLUP_GROUPS = dict(node=JobRollup.node, project=JobRollup.project, spider=JobRollup.spider,
+                     hour=JobRollup.hour, day=JobRollup.day)
+ROLLUP_METRICS = dict(
+    jobs=func.sum(JobRollup.jobs),
+    pages=func.sum(JobRollup.pages),
+    items=func.sum(JobRollup.items),
+    runtime=func.sum(JobRollup.runtime),
+    max_runtime=func.max(JobRollup.max_runtime),
+)
+
+
+def parse_statuses(values: Optional[List[str]]) -> List[str]:
+    """e.g. ['running', '2'] or ['running,2'] => ['1', '2']"""
+    statuses = []
+    for value in values or []:
+        for status in value.split(','):
+            status = status.strip().lower()
+            if not status:
+                continue
+            status = STATUS_NAMES.get(status, status)
+            if status not in STATUS_NAMES.values():
+                raise ValueError("Invalid status: %s" % status)
+            statuses.append(status)
+    return statuses
+
+
+def search_jobs_query(session, nodes: Optional[List[int]] = None, project: Optional[str] = None,
+                      spider: Optional[str] = None, statuses: Optional[List[str]] = None,
+                      since: Optional[datetime] = None, until: Optional[datetime] = None,
+                      time_field: str = 'finish', max_items: Optional[int] = None,
+                      sort: str = 'id') -> Tuple[Any, List[Tuple[Any, bool]]]:
+    """
+    Return (query, sort_key) of the jobs of the given filters, to be paginated with paginate_keyset().
+    since and until apply to time_field, until excluded.
+    max_items=0 finds the finished jobs which scraped nothing.
+    """
+    if sort not in SEARCH_SORTS:
+        raise ValueError("Invalid sort: %s" % sort)
+    if time_field not in TIME_FIELDS:
+        raise ValueError("Invalid time_field: %s" % time_field)
+    query = session.query(Job).filter(Job.deleted == NOT_DELETED)
+    if nodes:
+        query = query.filter(Job.node.in_(nodes))
+    if project:
+        query = query.filter(Job.project == project)
+    if spider:
+        query = query.filter(Job.spider == spider)
+    if statuses:
+        query = query.filter(Job.status.in_(statuses))
+    column = TIME_FIELDS[time_field]
+    if since is not None:
+        query = query.filter(column >= since)
+    if until is not None:
+        query = query.filter(column < until)
+    if max_items is not None:
+        query = query.filter(Job.status == STATUS_FINISHED, func.coalesce(Job.items, 0) <= max_items)
+    sort_key = SEARCH_SORTS[sort]
+    if sort != 'id':
+        # NULL sorts differently across databases, see pagination.keyset_condition()
+        query = query.filter(sort_key[0][0].isnot(None))
+    return query, sort_key
+
+
+def aggregate_jobs(session, group_by: Optional[List[str]] = None, nodes: Optional[List[int]] = None,
+                   project: Optional[str] = None, spider: Optional[str] = None,
+                   since: Optional[datetime] = None, until: Optional[datetime] = None,
+                   order_by: Optional[str] = None, limit: int = 1000) -> List[Dict[str, Any]]:
+    """
+    Sum up the finished jobs in JobRollup, grouped by any of node, project, spider, hour and day.
+    since and until apply to the hour of finish, so since is rounded down to the hour, until excluded.
+    Groups are ordered by the group_by columns, or by the metric order_by in descending order.
+    """
+    group_by = group_by or []
+    invalid = [name for name in group_by if name not in ROLLUP_GROUPS]
+    if invalid:
+        raise ValueError("Invalid group_by: %s" % ', '.join(invalid))
+    if order_by is not None and order_by not in ROLLUP_METRICS:
+        raise ValueError("Invalid order_by: %s" % order_by)
+    groups = [ROLLUP_GROUPS[name].label(name) for name in group_by]
+    metrics = [expression.label(name) for name, expression in ROLLUP_METRICS.items()]
+    query = session.query(*(groups + metrics))
+    if nodes:
+        query = query.filter(JobRollup.node.in_(nodes))
+    if project:
+        query = query.filter(JobRollup.project == project)
+    if spider:
+        query = query.filter(JobRollup.spider == spider)
+    if since is not None:
+        query = query.filter(JobRollup.hour >= get_hour(since))
+    if until is not None:
+        query = query.filter(JobRollup.hour < until)
+    if groups:
+        query = query.group_by(*groups)
+        if order_by is None:
+            query = query.order_by(*groups)
+        else:
+            query = query.order_by(ROLLUP_METRICS[order_by].desc(), *groups)
+    results = []
+    for row in query.limit(limit):
+        result = dict(row._mapping)
+        if result['jobs'] is None:  # No rows to aggregate without group_by
+            continue
+        for name in ('hour', 'day'):
+            if name in result:
+                result[name] = str(result[name])
+        results.append(result)
+    return results
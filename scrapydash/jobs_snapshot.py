@@ -0,0 +1,130 @@
+# coding: utf-8
+"""
+Jobs snapshot module for keeping the Job tables of all nodes up to date in the background
+"""
+import asyncio
+import logging
+import random
+import time
+from typing import Any, Callable, Dict, Optional
+from urllib.parse import urlsplit
+
+from .jobs_sync import sync_jobs_delta
+from .models import Job, JobRollup, db, ensure_table
+from .scrapyd_client import ScrapydClient, get_scrapyd_client, get_scrapyd_server
+from .utils.jobs_ingest import JobsIngestor
+
+logger = logging.getLogger(__name__)
+
+# Each node waits for JOBS_SNAPSHOT_INTERVAL +/- JITTER_RATIO * JOBS_SNAPSHOT_INTERVAL seconds,
+# so that nodes are not all synced at the same moment.
+JITTER_RATIO = 0.1
+
+
+def get_default_session_factory():
+    return db.Session
+
+
+class JobsSnapshotWorker:
+    """
+    One asyncio task per node: fetch its jobs via JobsIngestor and upsert the delta into its Job table,
+    so that reading jobs never has to wait for the Scrapyd servers.
+    """
+
+    def __init__(self, config: Dict[str, Any], scrapyd_client: ScrapydClient,
+                 session_factory: Optional[Callable] = None, is_paused: Optional[Callable[[], bool]] = None):
+        self.config = config
+        self.scrapyd_client = scrapyd_client
+        self.session_factory = session_factory or get_default_session_factory()
+        self.is_paused = is_paused  # Blocking, run in a thread
+        self.interval = config.get('JOBS_SNAPSHOT_INTERVAL', 300)
+        self.nodes = list(range(1, len(config.get('SCRAPYD_SERVERS', []) or ['127.0.0.1:6800']) + 1))
+        self.ingestors: Dict[int, JobsIngestor] = {}
+        self.freshness: Dict[int, Dict[str, Any]] = dict((node, dict(node=node, last_sync=None))
+                                                         for node in self.nodes)
+        self._tasks: Dict[int, asyncio.Task] = {}
+
+    def get_jitter(self) -> float:
+        return random.uniform(-JITTER_RATIO, JITTER_RATIO) * self.interval
+
+    def start(self):
+        """Start one task per node, in the running event loop"""
+        if self._tasks or not self.interval:
+            return
+        for node in self.nodes:
+            self._tasks[node] = asyncio.ensure_future(self.run_node(node))
+        logger.info("Jobs snapshot of %s nodes every %ss", len(self.nodes), self.interval)
+
+    async def stop(self):
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    async def run_node(self, node: int):
+        # Spread the first round of all nodes over the first JITTER_RATIO of the interval
+        await asyncio.sleep(random.uniform(0, JITTER_RATIO * self.interval))
+        while True:
+            try:
+                if self.is_paused is None or not await asyncio.to_thread(self.is_paused):
+                    await self.sync_node(node)
+            except asyncio.CancelledError:
+                raise
+            except Exception as err:
+                logger.error("[node %s] Jobs snapshot failed: %s", node, err)
+            delay = max(0, self.interval + self.get_jitter())
+            self.freshness[node]['next_sync'] = time.time() + delay
+            await asyncio.sleep(delay)
+
+    async def sync_node(self, node: int) -> Dict[str, Any]:
+        """Fetch the jobs of a node and persist what changed, recording the freshness of the node"""
+        start = time.monotonic()
+        base_url, auth = get_scrapyd_server(self.config, node)
+        freshness = self.freshness.setdefault(node, dict(node=node, last_sync=None))
+        freshness['server'] = urlsplit(base_url).netloc
+        ingestor = self.ingestors.get(node)
+        if ingestor is None:
+            ingestor = self.ingestors[node] = JobsIngestor(None)
+        ingestor.client = self.scrapyd_client.get_client(base_url)
+        try:
+            delta = await ingestor.poll(node, base_url, auth)
+            stats = await asyncio.to_thread(self.persist, delta)
+        except Exception as err:
+            # Start from scratch next time, since the delta may not have been persisted
+            ingestor.reset(node)
+            freshness.update(ok=False, error=str(err), last_attempt=time.time(),
+                             duration=round(time.monotonic() - start, 3))
+            raise
+        freshness.update(ok=True, error=None, last_attempt=time.time(), last_sync=time.time(),
+                         duration=round(time.monotonic() - start, 3), mode=delta.mode, jobs=len(delta.jobs),
+                         added=len(delta.added), changed=len(delta.changed), removed=len(delta.removed))
+        logger.debug("[node %s] Jobs snapshot took %.3fs: %s %s", node, freshness['duration'], delta, stats)
+        return freshness
+
+    def persist(self, delta) -> Dict[str, int]:
+        session = self.session_factory()
+        try:
+            for model in (Job, JobRollup):
+                ensure_table(model.__table__, session.get_bind(model))
+            return sync_jobs_delta(session, delta)
+        finally:
+            session.close()
+
+    def get_freshness(self) -> Dict[str, Any]:
+        now = time.time()
+        nodes = {}
+        for node, freshness in self.freshness.items():
+            freshness = dict(freshness)
+            freshness['age'] = round(now - freshness['last_sync'], 3) if freshness['last_sync'] else None
+            nodes[node] = freshness
+        return dict(interval=self.interval, running=bool(self._tasks), nodes=nodes)
+
+
+def get_jobs_snapshot_worker(app) -> JobsSnapshotWorker:
+    """Return the worker created in lifespan, or an idle one if lifespan has not run (e.g. in tests)"""
+    worker = getattr(app.state, 'jobs_snapshot_worker', None)
+    if worker is None:
+        worker = JobsSnapshotWorker(getattr(app.state, 'config', None) or {}, get_scrapyd_client(app))
+        app.state.jobs_snapshot_worker = worker
+    return worker
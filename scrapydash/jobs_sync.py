@@ -0,0 +1,306 @@
+# coding: utf-8
+"""
+Jobs sync module for persisting snapshots of Scrapyd jobs into the Job table, keyed by node
+"""
+from datetime import datetime, timedelta
+import logging
+import re
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import insert
+
+from .models import Job, JobRollup
+from .utils.jobs_ingest import JobsDelta, dedupe_jobs, get_job_key
+
+logger = logging.getLogger(__name__)
+
+STATUS_PENDING = '0'
+STATUS_RUNNING = '1'
+STATUS_FINISHED = '2'
+NOT_DELETED = '0'
+DELETED = '1'
+HREF_PATTERN = re.compile(r"""href=['"](.+?)['"]""")  # Temp support for Scrapyd v1.3.0 (not released)
+# Keep the number of bound parameters of 'IN (...)' below the limit of SQLite
+CHUNK_SIZE = 500
+# Columns which are never overwritten by an upsert
+INSERT_ONLY_COLUMNS = ['id', 'node', 'create_time']
+UNIQUE_COLUMNS = ['node', 'project', 'spider', 'job']
+ROLLUP_METRICS = ['jobs', 'pages', 'items', 'runtime', 'max_runtime']
+# (node, project, spider, hour)
+RollupKey = Tuple[int, str, str, datetime]
+
+
+def chunks(items: List[Any], size: int = CHUNK_SIZE) -> Iterable[List[Any]]:
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def job_to_row(node: int, job: Dict[str, str], liststats_datas: Optional[Dict[str, Any]] = None,
+               now: Optional[datetime] = None) -> Dict[str, Any]:
+    """Convert a job dict of JOB_KEYS into the column values of the Job table"""
+    row: Dict[str, Any] = dict(node=node)
+    for k, v in job.items():
+        v = v or None  # Save NULL in database for empty string
+        if k in ['start', 'finish']:
+            v = datetime.strptime(v, '%Y-%m-%d %H:%M:%S') if v else None  # Avoid empty string
+        elif k in ['href_log', 'href_items']:  # <a href='/logs/demo/test/xxx.log'>Log</a>
+            m = re.search(HREF_PATTERN, v) if v else None
+            v = m.group(1) if m else v
+        elif k == 'pid':
+            v = int(v) if v else None
+        row[k] = v
+    if not job['start']:
+        row['status'] = STATUS_PENDING
+    elif not job['finish']:
+        row['status'] = STATUS_RUNNING
+    else:
+        row['status'] = STATUS_FINISHED
+    row['deleted'] = NOT_DELETED
+    if not job['start']:
+        row['pages'] = None
+        row['items'] = None
+    elif liststats_datas:
+        try:
+            data = liststats_datas[job['project']][job['spider']][job['job']]
+            row['pages'] = data['pages']  # Logparser: None or non-negative int
+            row['items'] = data['items']  # Logparser: None or non-negative int
+        except KeyError:
+            pass
+        except Exception as err:
+            logger.error(err)
+    # SQLite DateTime type only accepts Python datetime and date objects as input
+    row['update_time'] = now or datetime.now()
+    return row
+
+
+def build_upsert(dialect_name: str, columns: List[str]):
+    """
+    Return an INSERT statement which updates the row with the same (node, project, spider, job) on conflict,
+    or None if the dialect has no native upsert.
+    """
+    update_columns = [c for c in columns if c not in INSERT_ONLY_COLUMNS]
+    if dialect_name in ('sqlite', 'postgresql'):
+        if dialect_name == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        stmt = dialect_insert(Job.__table__)
+        return stmt.on_conflict_do_update(index_elements=UNIQUE_COLUMNS,
+                                          set_=dict((c, stmt.excluded[c]) for c in update_columns))
+    elif dialect_name in ('mysql', 'mariadb'):
+        from sqlalchemy.dialects.mysql import insert as dialect_insert
+        stmt = dialect_insert(Job.__table__)
+        return stmt.on_duplicate_key_update(**dict((c, stmt.inserted[c]) for c in update_columns))
+    return None
+
+
+def get_hour(value: datetime) -> datetime:
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+def get_rollup_key(node: int, row) -> RollupKey:
+    return node, row['project'], row['spider'], get_hour(row['finish'])
+
+
+def add_to_rollup(totals: Dict[RollupKey, Dict[str, int]], key: RollupKey, record):
+    """Count a finished job, a Job record or a row of the same columns, into the totals of its bucket"""
+    total = totals.setdefault(key, dict((k, 0) for k in ROLLUP_METRICS))
+    runtime = int((record.finish - record.start).total_seconds()) if record.start and record.finish else 0
+    total['jobs'] += 1
+    total['pages'] += record.pages or 0
+    total['items'] += record.items or 0
+    total['runtime'] += runtime
+    total['max_runtime'] = max(total['max_runtime'], runtime)
+
+
+def query_finished_jobs(session):
+    return session.query(Job.node, Job.project, Job.spider, Job.start, Job.finish, Job.pages, Job.items).filter(
+        Job.deleted == NOT_DELETED, Job.status == STATUS_FINISHED, Job.finish.isnot(None))
+
+
+def refresh_job_rollups(session, keys: Iterable[RollupKey]) -> int:
+    """
+    Recompute the given buckets of JobRollup from the Job table, without committing,
+    so that syncing the same snapshot again never counts a job twice. Return the number of buckets written.
+    """
+    keys_by_node: Dict[int, Set[RollupKey]] = {}
+    for key in keys:
+        keys_by_node.setdefault(key[0], set()).add(key)
+    for node, node_keys in keys_by_node.items():
+        hours = [key[3] for key in node_keys]
+        first_hour, last_hour = min(hours), max(hours)
+        # One range scan of the finished jobs of the node on ix_job_keyset
+        totals: Dict[RollupKey, Dict[str, int]] = {}
+        query = query_finished_jobs(session).filter(
+            Job.node == node, Job.finish >= first_hour, Job.finish < last_hour + timedelta(hours=1))
+        for record in query:
+            key = (node, record.project, record.spider, get_hour(record.finish))
+            if key in node_keys:
+                add_to_rollup(totals, key, record)
+        rollups = session.query(JobRollup).filter(JobRollup.node == node, JobRollup.hour >= first_hour,
+                                                  JobRollup.hour <= last_hour)
+        existing = dict(((node, r.project, r.spider, r.hour), r) for r in rollups)
+        now = datetime.now()
+        for key in node_keys:
+            rollup = existing.get(key)
+            if key not in totals:
+                if rollup is not None:
+                    session.delete(rollup)
+                continue
+            if rollup is None:
+                rollup = JobRollup(node=node, project=key[1], spider=key[2], hour=key[3], day=key[3].date())
+                session.add(rollup)
+            for k, v in totals[key].items():
+                setattr(rollup, k, v)
+            rollup.update_time = now
+    session.flush()
+    return sum(len(node_keys) for node_keys in keys_by_node.values())
+
+
+def rebuild_job_rollups(session, nodes: Optional[List[int]] = None) -> int:
+    """Recompute JobRollup of the given nodes, or all nodes, from scratch and commit"""
+    query = query_finished_jobs(session)
+    rollups = session.query(JobRollup)
+    if nodes is not None:
+        query = query.filter(Job.node.in_(nodes))
+        rollups = rollups.filter(JobRollup.node.in_(nodes))
+    totals: Dict[RollupKey, Dict[str, int]] = {}
+    try:
+        for record in query.yield_per(CHUNK_SIZE):
+            add_to_rollup(totals, (record.node, record.project, record.spider, get_hour(record.finish)), record)
+        rollups.delete(synchronize_session=False)
+        now = datetime.now()
+        rows = [dict(total, node=key[0], project=key[1], spider=key[2], hour=key[3], day=key[3].date(),
+                     update_time=now) for key, total in totals.items()]
+        for chunk in chunks(rows):
+            session.execute(insert(JobRollup.__table__), chunk)
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    logger.info("Rebuilt %s job rollups of nodes %s", len(totals), nodes or 'all')
+    return len(totals)
+
+
+def load_existing(session, node: int, keys: List[Tuple[str, str, str]]) -> Dict[Tuple[str, str, str], Any]:
+    """Return {(project, spider, job): (id, status, deleted, start, pages, items)} of the given keys of the node"""
+    existing = {}
+    keys_set = set(keys)
+    for chunk in chunks(sorted(set(key[2] for key in keys))):
+        query = session.query(Job.id, Job.project, Job.spider, Job.job, Job.status, Job.deleted, Job.start,
+                              Job.pages, Job.items)
+        for record in query.filter(Job.node == node, Job.job.in_(chunk)):
+            key = (record.project, record.spider, record.job)
+            if key in keys_set:
+                existing[key] = record
+    return existing
+
+
+def upsert_jobs(session, node: int, jobs: List[Dict[str, str]],
+                liststats_datas: Optional[Dict[str, Any]] = None) -> Dict[str, int]:
+    """
+    Insert or update the jobs of a node in bulk, without committing.
+    Deleted finished jobs are ignored, other deleted ones are recovered.
+    The buckets of JobRollup of the jobs which are newly finished, recovered or with new stats are refreshed.
+    """
+    existing = load_existing(session, node, [get_job_key(job) for job in jobs])
+    now = datetime.now()
+    stats = dict(inserted=0, updated=0, recovered=0, ignored=0)
+    # Rows of an executemany must share the same columns, pages and items are not always known
+    groups: Dict[Tuple[str, ...], List[Dict[str, Any]]] = {}
+    rollup_keys: Set[RollupKey] = set()
+    for job in jobs:
+        record = existing.get(get_job_key(job))
+        row = job_to_row(node, job, liststats_datas, now)
+        if record is None:
+            stats['inserted'] += 1
+        elif record.deleted == DELETED:
+            if record.status == STATUS_FINISHED and str(record.start) == job['start']:
+                logger.info("Ignore deleted job: %s", '/'.join(get_job_key(job)))
+                stats['ignored'] += 1
+                continue
+            row['pages'] = row.get('pages')
+            row['items'] = row.get('items')
+            logger.info("Recover deleted job: %s", '/'.join(get_job_key(job)))
+            stats['recovered'] += 1
+        else:
+            stats['updated'] += 1
+        if row['status'] == STATUS_FINISHED and (
+                record is None or record.status != STATUS_FINISHED or record.deleted == DELETED
+                or ('items' in row and (row['pages'], row['items']) != (record.pages, record.items))):
+            rollup_keys.add(get_rollup_key(node, row))
+        groups.setdefault(tuple(sorted(row)), []).append(row)
+
+    dialect_name = session.get_bind(Job).dialect.name
+    for columns, rows in groups.items():
+        stmt = build_upsert(dialect_name, list(columns))
+        if stmt is not None:
+            session.execute(stmt, rows)
+            continue
+        # No native upsert: plain bulk insert of new rows and bulk update of existing ones by id
+        new_rows = [row for row in rows if get_job_key(row) not in existing]
+        old_rows = [dict(row, id=existing[get_job_key(row)].id) for row in rows if get_job_key(row) in existing]
+        if new_rows:
+            session.execute(insert(Job.__table__), new_rows)
+        if old_rows:
+            session.bulk_update_mappings(Job, old_rows)
+    if rollup_keys:
+        refresh_job_rollups(session, rollup_keys)
+    return stats
+
+
+def delete_stale_pending_jobs(session, node: int, current_pending_keys: Iterable[Tuple[str, str, str]]) -> int:
+    """Delete in bulk the pending jobs of a node which are no longer pending in Scrapyd, without committing"""
+    current_pending_keys = set(current_pending_keys)
+    query = session.query(Job.id, Job.project, Job.spider, Job.job).filter(Job.node == node,
+                                                                           Job.status == STATUS_PENDING)
+    stale_ids = [record.id for record in query
+                 if (record.project, record.spider, record.job) not in current_pending_keys]
+    for chunk in chunks(stale_ids):
+        session.query(Job).filter(Job.id.in_(chunk)).delete(synchronize_session=False)
+    if stale_ids:
+        logger.info("Deleted %s pending jobs of node %s", len(stale_ids), node)
+    return len(stale_ids)
+
+
+def sync_jobs(session, node: int, jobs: List[Dict[str, str]],
+              liststats_datas: Optional[Dict[str, Any]] = None) -> Dict[str, int]:
+    """
+    Persist a full snapshot of the jobs of a node in one transaction:
+    one batched upsert, and one bulk delete of the pending jobs which have been started or cancelled.
+    """
+    pending_keys = [get_job_key(job) for job in jobs if not job['start']]
+    try:
+        stats = upsert_jobs(session, node, dedupe_jobs(jobs), liststats_datas)
+        stats['deleted'] = delete_stale_pending_jobs(session, node, pending_keys)
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    logger.debug("Synced jobs of node %s: %s", node, stats)
+    return stats
+
+
+def sync_jobs_delta(session, delta: JobsDelta,
+                    liststats_datas: Optional[Dict[str, Any]] = None) -> Dict[str, int]:
+    """
+    Persist only what changed since the previous snapshot, see JobsIngestor.
+    Running jobs are upserted as well if liststats_datas is given, to refresh their pages and items.
+    """
+    jobs = delta.added + delta.changed
+    if liststats_datas:
+        seen = set(get_job_key(job) for job in jobs)
+        jobs += [job for job in delta.jobs if job['start'] and not job['finish'] and get_job_key(job) not in seen]
+    if not jobs and not delta.removed:
+        return dict(inserted=0, updated=0, recovered=0, ignored=0, deleted=0)
+    try:
+        stats = upsert_jobs(session, delta.node, jobs, liststats_datas)
+        # Pending jobs can only disappear from the snapshot, finished ones are kept in the table
+        stats['deleted'] = delete_stale_pending_jobs(
+            session, delta.node, [get_job_key(job) for job in delta.jobs if not job['start']])
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    logger.debug("Synced %s: %s", delta, stats)
+    return stats
@@ -0,0 +1,276 @@
+# coding: utf-8
+"""
+Log reader module for serving byte ranges and tails of Scrapy logfiles in chunks,
+via seek and mmap for the local logfiles and HTTP Range requests against Scrapyd,
+so that memory use does not depend on the size of the logfile.
+"""
+import asyncio
+from collections import OrderedDict
+import logging
+import mmap
+import os
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+from urllib.parse import quote, urlsplit
+
+from .scrapyd_client import ScrapydClient, get_scrapyd_server, parse_scrapyd_server
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+# The window requested from Scrapyd for the last N lines starts at N * TAIL_LINE_BYTES bytes,
+# and grows until it holds N lines or reaches TAIL_MAX_BYTES
+TAIL_LINE_BYTES = 256
+TAIL_MAX_BYTES = 16 * 1024 * 1024
+# {(node, project, spider, job): url with extension} of the latest logfiles located on Scrapyd
+RESOLVED_URLS_LIMIT = 1000
+resolved_urls: 'OrderedDict[Tuple[int, str, str, str], str]' = OrderedDict()
+
+
+class LogNotFound(Exception):
+    pass
+
+
+def find_tail_offset(buf, lines: int) -> Optional[int]:
+    """
+    Return the offset in buf (bytes or mmap) where the last lines start, ignoring a trailing newline,
+    or None if buf holds fewer lines, in which case the tail may start before buf.
+    """
+    pos = len(buf)
+    if pos and buf[pos - 1:pos] == b'\n':
+        pos -= 1
+    for __ in range(lines):
+        pos = buf.rfind(b'\n', 0, pos)
+        if pos < 0:
+            return None
+    return pos + 1
+
+
+class LocalLog:
+    """A logfile in LOCAL_SCRAPYD_LOGS_DIR, read in chunks in a thread"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.source = path
+
+    async def size(self) -> int:
+        return (await asyncio.to_thread(os.stat, self.path)).st_size
+
+    def _tail_offset(self, lines: int) -> int:
+        with open(self.path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if lines <= 0 or not size:
+                return size
+            # Pages are mapped on demand, only those near the end are touched for a short tail
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                offset = find_tail_offset(m, lines)
+        return 0 if offset is None else offset
+
+    async def tail_offset(self, lines: int) -> int:
+        return await asyncio.to_thread(self._tail_offset, lines)
+
+    async def iter_range(self, start: int = 0, end: Optional[int] = None) -> AsyncIterator[bytes]:
+        """Yield the bytes in [start, end), or up to the current end of the file"""
+        f = await asyncio.to_thread(open, self.path, 'rb')
+        try:
+            await asyncio.to_thread(f.seek, start)
+            remaining = None if end is None else max(end - start, 0)
+            while remaining is None or remaining > 0:
+                size = CHUNK_SIZE if remaining is None else min(CHUNK_SIZE, remaining)
+                chunk = await asyncio.to_thread(f.read, size)
+                if not chunk:
+                    break
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+        finally:
+            await asyncio.to_thread(f.close)
+
+
+class RemoteLog:
+    """A logfile served by Scrapyd at /logs/, requested with Range headers via the pooled ScrapydClient"""
+
+    def __init__(self, client: ScrapydClient, url: str, auth=None):
+        self.client = client
+        self.url = url
+        self.auth = auth
+        self.source = url
+
+    async def size(self) -> int:
+        r = await self.client.request('HEAD', self.url, auth=self.auth)
+        if r.status_code == 200 and 'content-length' in r.headers:
+            return int(r.headers['content-length'])
+        # Without HEAD, the total size is in Content-Range: 'bytes 0-0/12345'
+        r = await self.client.get(self.url, auth=self.auth, headers=dict(Range='bytes=0-0'))
+        if r.status_code == 206 and '/' in r.headers.get('content-range', ''):
+            return int(r.headers['content-range'].rsplit('/', 1)[1])
+        if r.status_code == 416:
+            return 0
+        r.raise_for_status()
+        return len(r.content)
+
+    async def iter_range(self, start: int = 0, end: Optional[int] = None) -> AsyncIterator[bytes]:
+        """Yield the bytes in [start, end), skipping bytes instead if Scrapyd ignores the Range header"""
+        if end is not None and end <= start:
+            return
+        headers = dict(Range='bytes=%s-%s' % (start, '' if end is None else end - 1))
+        async with self.client.stream('GET', self.url, auth=self.auth, headers=headers) as r:
+            if r.status_code == 416:  # start is beyond the end
+                return
+            r.raise_for_status()
+            position = start if r.status_code == 206 else 0
+            async for chunk in r.aiter_bytes(CHUNK_SIZE):
+                chunk_start = position
+                position += len(chunk)
+                if position <= start:
+                    continue
+                if chunk_start < start:
+                    chunk = chunk[start - chunk_start:]
+                if end is not None and position >= end:
+                    yield chunk[:len(chunk) - (position - end)]
+                    return
+                yield chunk
+
+    async def read(self, start: int, end: int) -> bytes:
+        buf = bytearray()
+        async for chunk in self.iter_range(start, end):
+            buf.extend(chunk)
+        return bytes(buf)
+
+    async def tail_offset(self, lines: int) -> int:
+        size = await self.size()
+        if lines <= 0 or not size:
+            return size
+        window = min(size, lines * TAIL_LINE_BYTES, TAIL_MAX_BYTES)
+        while True:
+            buf = await self.read(size - window, size)
+            offset = find_tail_offset(buf, lines)
+            if offset is not None:
+                return size - window + offset
+            if window >= size:
+                return 0
+            if window >= TAIL_MAX_BYTES:
+                # Give up on very long lines, start from the first complete line of the window
+                return size - window + buf.find(b'\n') + 1
+            window = min(size, window * 4, TAIL_MAX_BYTES)
+
+
+def parse_range_header(value: str, size: int) -> Tuple[int, int]:
+    """
+    Return [start, end) of a single range of the Range header: 'bytes=0-99', 'bytes=100-' or 'bytes=-100'.
+    Raise ValueError if it is invalid or not satisfiable.
+    """
+    unit, __, spec = value.partition('=')
+    if unit.strip() != 'bytes' or ',' in spec:
+        raise ValueError("Unsupported range: %s" % value)
+    first, __, last = spec.strip().partition('-')
+    if not first:
+        start, end = max(size - int(last), 0), size
+    else:
+        start, end = int(first), min(int(last) + 1, size) if last else size
+    if start >= size or start >= end:
+        raise ValueError("Range not satisfiable: %s" % value)
+    return start, end
+
+
+def check_log_names(*names: str):
+    """
+    Raise LogNotFound unless each of the names, e.g. project, spider and job from the URL,
+    is a single path segment, so that the path of the logfile never leaves the logs directory.
+    """
+    for name in names:
+        if name in ('', '.', '..') or '/' in name or '\\' in name or '\0' in name:
+            raise LogNotFound("Invalid name in the path of the logfile: %r" % name)
+
+
+def get_local_logs_dir(config: Dict[str, Any], node: int) -> str:
+    """Return LOCAL_SCRAPYD_LOGS_DIR if the node is LOCAL_SCRAPYD_SERVER, otherwise ''"""
+    logs_dir = config.get('LOCAL_SCRAPYD_LOGS_DIR', '')
+    local_server = config.get('LOCAL_SCRAPYD_SERVER', '')
+    if not logs_dir or not local_server:
+        return ''
+    base_url, __ = get_scrapyd_server(config, node)
+    local_url, __ = parse_scrapyd_server(local_server)
+    return logs_dir if urlsplit(base_url).netloc == urlsplit(local_url).netloc else ''
+
+
+async def locate_remote_log(client: ScrapydClient, config: Dict[str, Any], node: int, project: str, spider: str,
+                            job: str, extensions: List[str]) -> str:
+    """Probe all extensions at once with HEAD requests, and remember the url found for the job"""
+    key = (node, project, spider, job)
+    url = resolved_urls.get(key)
+    if url is not None:
+        resolved_urls.move_to_end(key)
+        return url
+    base_url, auth = get_scrapyd_server(config, node)
+    url = '%s/logs/%s/%s/%s' % (base_url, quote(project), quote(spider), quote(job))
+    urls = [url + ext for ext in extensions]
+
+    async def probe(url):
+        try:
+            r = await client.request('HEAD', url, auth=auth)
+            return r.status_code == 200
+        except Exception as err:
+            logger.warning("Fail to request logfile %s: %s", url, err)
+            return False
+
+    found = await asyncio.gather(*[probe(url) for url in urls])
+    for url, ok in zip(urls, found):  # In the order of SCRAPYD_LOG_EXTENSIONS
+        if ok:
+            resolved_urls[key] = url
+            if len(resolved_urls) > RESOLVED_URLS_LIMIT:
+                resolved_urls.popitem(last=False)
+            return url
+    raise LogNotFound("Fail to request logfile from %s with extensions %s" % (url, extensions))
+
+
+async def open_log(client: ScrapydClient, config: Dict[str, Any], node: int, project: str, spider: str, job: str,
+                   with_ext: bool = False):
+    """
+    Return a LocalLog if the logfile is in LOCAL_SCRAPYD_LOGS_DIR, otherwise a RemoteLog.
+    with_ext means that job already has its extension, e.g. 'job.log' in the Logs page.
+    Raise LogNotFound if not found, or if any of project, spider and job is not a single path segment.
+    """
+    check_log_names(project, spider, job)
+    extensions = [''] if with_ext else (config.get('SCRAPYD_LOG_EXTENSIONS') or [''])
+    logs_dir = get_local_logs_dir(config, node)
+    if logs_dir:
+        path = os.path.join(logs_dir, project, spider, job)
+        for ext in extensions:
+            if await asyncio.to_thread(os.path.isfile, path + ext):
+                logger.debug("Using local logfile: %s", path + ext)
+                return LocalLog(path + ext)
+    url = await locate_remote_log(client, config, node, project, spider, job, extensions)
+    return RemoteLog(client, url, get_scrapyd_server(config, node)[1])
+
+
+async def stream_log(log, start: int = 0, end: Optional[int] = None, follow: bool = False, interval: float = 2,
+                     timeout: float = 3600,
+                     is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None) -> AsyncIterator[bytes]:
+    """
+    Yield the bytes in [start, end) of the log. With follow, keep yielding the bytes appended
+    every interval seconds, until is_disconnected() or timeout, like 'tail -f'.
+    """
+    offset = start
+    async for chunk in log.iter_range(start, end):
+        offset += len(chunk)
+        yield chunk
+    if not follow:
+        return
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if is_disconnected is not None and await is_disconnected():
+            return
+        await asyncio.sleep(interval)
+        try:
+            size = await log.size()
+        except Exception as err:
+            logger.warning("Stop following %s: %s", log.source, err)
+            return
+        if size < offset:
+            logger.info("Stop following %s, which has been truncated", log.source)
+            return
+        if size > offset:
+            async for chunk in log.iter_range(offset, size):
+                offset += len(chunk)
+                yield chunk
@@ -0,0 +1,255 @@
+# coding: utf-8
+"""
+Log stats module for parsing Scrapy logfiles incrementally with LogParser:
+the byte offset and the stats parsed so far of each job are checkpointed under STATS_PATH,
+so that each request only fetches and parses the bytes appended since the previous one.
+"""
+import asyncio
+from collections import OrderedDict
+from datetime import datetime
+import json
+import logging
+import os
+import re
+from typing import Any, Dict, Optional
+from urllib.parse import quote, urlsplit
+import weakref
+
+import httpx
+from logparser import __version__ as LOGPARSER_VERSION
+from logparser import parse
+from logparser.common import Common
+
+from .log_reader import check_log_names, get_local_logs_dir
+from .scrapyd_client import ScrapydClient, get_scrapyd_server
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_VERSION = 1
+# The appended bytes are parsed in blocks of at most this size, which bounds the memory used
+PARSE_CHUNK_SIZE = 4 * 1024 * 1024
+# Same as the defaults of LogParser
+LOG_HEAD_LINES = 100
+LOG_TAIL_LINES = 200
+LOG_CATEGORIES_LIMIT = 10
+# The checkpoints of the jobs requested lately are kept in memory as well
+CHECKPOINTS_LIMIT = 200
+NA = Common.NA
+DATETIME_LINE_PATTERN = re.compile(rb'^\d{4}-\d{2}-\d{2}[ ]\d{2}:\d{2}:\d{2}[ ]', re.M)
+UNSAFE_NAME_PATTERN = re.compile(r'[^0-9A-Za-z_.-]')
+
+
+def safe_name(name: str) -> str:
+    """Keep the names in URLs from leaving STATS_PATH, e.g. '..'"""
+    return UNSAFE_NAME_PATTERN.sub('-', name).strip('.') or '-'
+
+
+def calc_runtime(first_log_time: str, latest_log_time: str) -> str:
+    if NA in (first_log_time, latest_log_time):
+        return NA
+    fmt = '%Y-%m-%d %H:%M:%S'
+    return str(datetime.strptime(latest_log_time, fmt) - datetime.strptime(first_log_time, fmt))
+
+
+def keep_lines(text: str, limit: int, head: bool = True) -> str:
+    lines = text.split('\n')
+    return '\n'.join(lines[:limit] if head else lines[-limit:])
+
+
+def merge_stats(data: Dict[str, Any], data_: Dict[str, Any]) -> Dict[str, Any]:
+    """Merge data_ parsed from the appended log into data, as LogParser does for the local logfiles"""
+    if not data:
+        data = data_
+    else:
+        if data['first_log_time'] == NA:
+            data['first_log_time'] = data_['first_log_time']
+            data['first_log_timestamp'] = data_['first_log_timestamp']
+        if data_['latest_log_time'] != NA:
+            data['latest_log_time'] = data_['latest_log_time']
+            data['latest_log_timestamp'] = data_['latest_log_timestamp']
+        data['runtime'] = calc_runtime(data['first_log_time'], data['latest_log_time'])
+
+        data['datas'].extend(data_['datas'])
+        for k in ['pages', 'items']:
+            if data[k] is None:
+                data[k] = data_[k]
+            elif data_[k] is not None:
+                data[k] = max(data[k], data_[k])
+
+        for k, v in data_['latest_matches'].items():
+            data['latest_matches'][k] = v or data['latest_matches'].get(k, '')
+        for k in ['latest_crawl', 'latest_scrape']:
+            if data_['latest_matches'][k]:
+                data['%s_timestamp' % k] = data_['%s_timestamp' % k]
+
+        for k, v in data_['log_categories'].items():
+            category = data['log_categories'].setdefault(k, dict(count=0, details=[]))
+            if v['count'] > 0:
+                # The counts in the stats dumped at the end are the final ones
+                if data_['finish_reason'] != NA:
+                    category['count'] = v['count']
+                else:
+                    category['count'] += v['count']
+            category['details'].extend(v['details'])
+
+        for k in ['shutdown_reason', 'finish_reason']:
+            if data_[k] != NA:
+                data[k] = data_[k]
+        data['crawler_stats'] = data_['crawler_stats'] or data['crawler_stats']
+        data['last_update_time'] = data_['last_update_time']
+        data['last_update_timestamp'] = data_['last_update_timestamp']
+        if len(data['head'].split('\n')) < LOG_HEAD_LINES:
+            data['head'] = keep_lines('%s\n%s' % (data['head'], data_['head']), LOG_HEAD_LINES)
+        data['tail'] = keep_lines('%s\n%s' % (data['tail'], data_['tail']), LOG_TAIL_LINES, head=False)
+    for v in data['log_categories'].values():
+        v['details'] = v['details'][-LOG_CATEGORIES_LIMIT:]
+    return data
+
+
+def find_parsable_size(buf: bytes, final: bool = False) -> int:
+    """
+    Return the size of the head of buf which can be parsed now.
+    Like LogParser, the last record is left for the next round unless the log ending has been found,
+    as it may be a traceback still being written; a single record which fills a whole block is parsed anyway.
+    """
+    if final:
+        return len(buf)
+    size = buf.rfind(b'\n') + 1
+    if re.search(Common.PATTERN_LOG_ENDING, buf[:size].decode('utf-8', 'replace')):
+        return size
+    starts = [m.start() for m in DATETIME_LINE_PATTERN.finditer(buf)]
+    if len(starts) >= 2:
+        return starts[-1]
+    return len(buf) if len(buf) >= PARSE_CHUNK_SIZE else 0
+
+
+class LogStatsEngine:
+    """
+    Checkpoints of the stats of each logfile: {'version', 'source', 'position', 'stats'},
+    saved as STATS_PATH/<server>/<project>/<spider>/<job>.checkpoint.json
+    """
+
+    def __init__(self, stats_path: str):
+        self.stats_path = stats_path
+        self.checkpoints: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+        self._locks: 'weakref.WeakValueDictionary[str, asyncio.Lock]' = weakref.WeakValueDictionary()
+
+    def get_checkpoint_path(self, config: Dict[str, Any], node: int, project: str, spider: str, job: str) -> str:
+        base_url, __ = get_scrapyd_server(config, node)
+        server = re.sub(r'[.:]', '_', urlsplit(base_url).netloc)
+        return os.path.join(self.stats_path, safe_name(server), safe_name(project), safe_name(spider),
+                            safe_name(job) + '.checkpoint.json')
+
+    def load(self, path: str) -> Optional[Dict[str, Any]]:
+        checkpoint = self.checkpoints.get(path)
+        if checkpoint is None and os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    checkpoint = json.load(f)
+            except Exception as err:
+                logger.error("Fail to load stats checkpoint %s: %s", path, err)
+        if checkpoint is not None and checkpoint.get('version') != CHECKPOINT_VERSION:
+            checkpoint = None
+        return checkpoint
+
+    def save(self, path: str, checkpoint: Dict[str, Any]):
+        self.checkpoints[path] = checkpoint
+        self.checkpoints.move_to_end(path)
+        while len(self.checkpoints) > CHECKPOINTS_LIMIT:
+            self.checkpoints.popitem(last=False)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = '%s.%s.tmp' % (path, os.getpid())
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(checkpoint, f, ensure_ascii=False)
+            os.replace(tmp_path, path)  # Never leave a partial checkpoint behind
+        except Exception as err:
+            logger.error("Fail to save stats checkpoint %s: %s", path, err)
+
+    def parse_block(self, checkpoint: Dict[str, Any], buf: bytes, final: bool = False) -> int:
+        """Parse the head of buf into the checkpoint and return the number of bytes parsed"""
+        size = find_parsable_size(buf, final)
+        if size:
+            data_ = parse(buf[:size].decode('utf-8', 'replace'), LOG_HEAD_LINES, LOG_TAIL_LINES)
+            checkpoint['stats'] = merge_stats(checkpoint['stats'], data_)
+            checkpoint['position'] += size
+        return size
+
+    async def get_stats(self, log, path: str, final: bool = False) -> Dict[str, Any]:
+        """
+        Return the stats of log (see log_reader.open_log), parsing the bytes appended since the checkpoint.
+        final means that the job has finished, so that the last record is parsed as well.
+        """
+        lock = self._locks.get(path)
+        if lock is None:
+            lock = self._locks[path] = asyncio.Lock()
+        async with lock:
+            checkpoint = await asyncio.to_thread(self.load, path)
+            if checkpoint is None or checkpoint['source'] != log.source:
+                checkpoint = dict(version=CHECKPOINT_VERSION, source=log.source, position=0, stats={})
+            size = await log.size()
+            if size < checkpoint['position']:
+                logger.warning("Reparse %s, which is smaller than before: %s < %s",
+                               log.source, size, checkpoint['position'])
+                checkpoint.update(position=0, stats={})
+            if size > checkpoint['position']:
+                await self.parse_appended(log, checkpoint, size, final)
+                await asyncio.to_thread(self.save, path, checkpoint)
+            return checkpoint['stats']
+
+    async def parse_appended(self, log, checkpoint: Dict[str, Any], size: int, final: bool = False):
+        start = checkpoint['position']
+        logger.debug("Parse %s from %s to %s", log.source, start, size)
+        buf = bytearray()
+        async for chunk in log.iter_range(start, size):
+            buf.extend(chunk)
+            if len(buf) >= PARSE_CHUNK_SIZE:
+                del buf[:await asyncio.to_thread(self.parse_block, checkpoint, bytes(buf))]
+        if buf:
+            await asyncio.to_thread(self.parse_block, checkpoint, bytes(buf), final)
+        logger.info("Parsed %s bytes of %s, up to %s", checkpoint['position'] - start, log.source,
+                    checkpoint['position'])
+
+
+def read_logparser_stats(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):  # Still being written by LogParser, or corrupted
+        return None
+
+
+async def request_logparser_stats(client: ScrapydClient, config: Dict[str, Any], node: int, project: str,
+                                  spider: str, job: str) -> Optional[Dict[str, Any]]:
+    """
+    Return the stats saved by the LogParser service as <job>.json next to the logfile,
+    from LOCAL_SCRAPYD_LOGS_DIR or via Scrapyd, or None if not available or of another version of LogParser.
+    Raise LogNotFound if any of project, spider and job is not a single path segment.
+    """
+    check_log_names(project, spider, job)
+    logs_dir = get_local_logs_dir(config, node)
+    if logs_dir:
+        js = await asyncio.to_thread(read_logparser_stats, os.path.join(logs_dir, project, spider, job + '.json'))
+        source = logs_dir
+    else:
+        base_url, auth = get_scrapyd_server(config, node)
+        source = '%s/logs/%s/%s/%s.json' % (base_url, quote(project), quote(spider), quote(job))
+        try:
+            r = await client.get(source, auth=auth)
+            js = r.json() if r.status_code == 200 else None
+        except (httpx.HTTPError, ValueError) as err:
+            logger.debug("Fail to request the stats of LogParser from %s: %s", source, err)
+            js = None
+    if not isinstance(js, dict) or js.get('logparser_version') != LOGPARSER_VERSION:
+        logger.debug("No stats of LogParser v%s in %s", LOGPARSER_VERSION, source)
+        return None
+    return js
+
+
+def get_log_stats_engine(app) -> LogStatsEngine:
+    """Return the engine of the app, created on first use with STATS_PATH"""
+    engine = getattr(app.state, 'log_stats_engine', None)
+    if engine is None:
+        from . import vars
+        engine = app.state.log_stats_engine = LogStatsEngine(vars.STATS_PATH)
+    return engine
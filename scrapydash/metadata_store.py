@@ -0,0 +1,145 @@
+# coding: utf-8
+"""
+Metadata store module for serving the Metadata row from memory with write-behind persistence
+"""
+import asyncio
+import logging
+import threading
+from typing import Any, Callable, Dict, Optional
+
+from .__version__ import __version__
+
+logger = logging.getLogger(__name__)
+
+
+def get_default_session_factory():
+    from .models import db
+    return db.Session
+
+
+class MetadataStore:
+    """
+    The Metadata row of the current version, loaded once and read from memory.
+    Writes are visible in this process at once and coalesced until the next sync(),
+    which flushes them in one commit and reloads the row to pick up the writes of other workers.
+    Without a running sync task (e.g. in the poll subprocess or in tests), writes are flushed at once.
+    """
+
+    def __init__(self, session_factory: Optional[Callable] = None, interval: float = 5):
+        self.session_factory = session_factory
+        self.interval = interval
+        self.loaded = False
+        self._data: Dict[str, Any] = {}
+        self._dirty: Dict[str, Any] = {}
+        self._lock = threading.RLock()
+        self._task: Optional[asyncio.Task] = None
+
+    def get_session(self):
+        if self.session_factory is None:
+            self.session_factory = get_default_session_factory()
+        return self.session_factory()
+
+    def load(self):
+        """Reload the row from the database, keeping the local writes which are not flushed yet"""
+        from .models import Metadata, ensure_table
+        session = self.get_session()
+        try:
+            ensure_table(Metadata.__table__, session.get_bind(Metadata))
+            metadata = session.query(Metadata).filter_by(version=__version__).first()
+            data = {}
+            if metadata:
+                data = dict((k, v) for (k, v) in metadata.__dict__.items() if not k.startswith('_'))
+        except Exception as err:
+            logger.error("Fail to load metadata: %s", err)
+            return
+        finally:
+            session.close()
+        with self._lock:
+            data.update(self._dirty)
+            self._data = data
+            self.loaded = True
+
+    def flush(self) -> int:
+        """Write the pending writes in one commit, return the number of keys written"""
+        from .models import Metadata, ensure_table
+        with self._lock:
+            dirty, self._dirty = self._dirty, {}
+        if not dirty:
+            return 0
+        session = self.get_session()
+        try:
+            ensure_table(Metadata.__table__, session.get_bind(Metadata))
+            metadata = session.query(Metadata).filter_by(version=__version__).first()
+            if not metadata:
+                metadata = Metadata(version=__version__)
+                session.add(metadata)
+            for key, value in dirty.items():
+                setattr(metadata, key, value)
+            session.commit()
+        except Exception as err:
+            session.rollback()
+            logger.error("Fail to flush metadata %s: %s", dirty, err)
+            with self._lock:
+                # Keep the writes made meanwhile, which are newer
+                self._dirty = dict(dirty, **self._dirty)
+            return 0
+        finally:
+            session.close()
+        logger.debug("Flushed metadata: %s", dirty)
+        return len(dirty)
+
+    def sync(self):
+        self.flush()
+        self.load()
+
+    def get_all(self) -> Dict[str, Any]:
+        if not self.loaded:
+            self.load()
+        with self._lock:
+            return dict(self._data)
+
+    def get(self, key: str, default=None):
+        return self.get_all().get(key, default)
+
+    def set(self, key: str, value: Any):
+        if not self.loaded:
+            self.load()
+        with self._lock:
+            self._data[key] = value
+            self._dirty[key] = value
+        if self._task is None:
+            self.flush()
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def start(self, interval: Optional[float] = None):
+        """Start the sync task in the running event loop"""
+        if interval is not None:
+            self.interval = interval
+        if self._task is not None or not self.interval:
+            return
+        self._task = asyncio.ensure_future(self.run())
+
+    async def stop(self):
+        """Stop the sync task and flush what is left"""
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        await asyncio.to_thread(self.flush)
+
+    async def run(self):
+        await asyncio.to_thread(self.load)
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await asyncio.to_thread(self.sync)
+            except asyncio.CancelledError:
+                raise
+            except Exception as err:
+                logger.error("Fail to sync metadata: %s", err)
+
+
+metadata_store = MetadataStore()
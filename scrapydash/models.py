@@ -4,11 +4,11 @@ from pprint import pformat
 import time
 from datetime import datetime
 
-from sqlalchemy import Column, Integer, String, Float, DateTime, Text, ForeignKey, UniqueConstraint
+from sqlalchemy import Column, Integer, String, Float, Date, DateTime, Text, ForeignKey, Index, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import relationship, sessionmaker
-from sqlalchemy import create_engine
+from sqlalchemy.orm import relationship, scoped_session, sessionmaker
 
+from .engines import RoutingSession, register_base, registry
 from .vars import STATE_RUNNING
 
 # Legacy SQLAlchemy compatibility class
@@ -17,24 +17,37 @@ class LegacySQLAlchemy:
     def __init__(self, session_options=None):
         self.session_options = session_options or {}
         self.Base = declarative_base()
-        self.engine = create_engine('sqlite:///scrapydash.db')  # Replace with your database URL
-        self.Base.metadata.bind = self.engine
-        self.Session = sessionmaker(bind=self.engine, **self.session_options)
-        self.session = self.Session()
+        register_base(self.Base)
+        # A new session per call, routed to the engines of SQLALCHEMY_BINDS by __bind_key__
+        self.Session = sessionmaker(class_=RoutingSession, **self.session_options)
+        # Thread-local session for legacy code, instead of one session shared by all threads
+        self.session = scoped_session(self.Session)
         
         # Legacy Flask app compatibility
         self.app = LegacyFlaskApp()
+
+    @property
+    def engine(self):
+        return registry.get_engine()
+
+    def get_tables_by_bind_key(self):
+        tables = {}
+        for mapper in self.Base.registry.mappers:
+            tables.setdefault(getattr(mapper.class_, '__bind_key__', None), []).extend(mapper.tables)
+        return tables
     
     def create_all(self, app=None):
         """Legacy create_all method"""
         try:
-            self.Base.metadata.create_all(self.engine)
+            for bind_key, tables in self.get_tables_by_bind_key().items():
+                self.Base.metadata.create_all(registry.get_engine(bind_key), tables=tables)
         except Exception as e:
             print(f"Error creating database tables: {e}")
     
     def drop_all(self, app=None):
         """Legacy drop_all method"""
-        self.Base.metadata.drop_all(self.engine)
+        for bind_key, tables in self.get_tables_by_bind_key().items():
+            self.Base.metadata.drop_all(registry.get_engine(bind_key), tables=tables)
 
 class LegacyQuery:
     """Legacy Query class for Flask-SQLAlchemy compatibility"""
@@ -70,7 +83,34 @@ class LegacyAppContext:
 
 
 db = LegacySQLAlchemy(session_options=dict(autocommit=False, autoflush=True))
-db.create_all()
+
+
+def init_db():
+    """Create all tables, called on startup instead of on import"""
+    db.create_all()
+
+
+_ensured_tables = set()
+
+
+def ensure_table(table, bind):
+    """Create the table if not exists, as well as the indexes added to the model afterwards"""
+    key = (bind, table.name)
+    if key in _ensured_tables:
+        return
+    table.create(bind, checkfirst=True)
+    for index in table.indexes:
+        index.create(bind, checkfirst=True)
+    _ensured_tables.add(key)
+
+
+def get_session():
+    """Session dependency for FastAPI routes using the models below"""
+    session = db.Session()
+    try:
+        yield session
+    finally:
+        session.close()
 
 
 # TODO: Database Migrations https://blog.miguelgrinberg.com/post/the-flask-mega-tutorial-part-iv-database
@@ -105,44 +145,144 @@ Metadata.query = LegacyQuery(Metadata, db.session)
 
 
 # TODO: Timezone Conversions https://blog.miguelgrinberg.com/post/the-flask-mega-tutorial-part-xii-dates-and-times
-def create_jobs_table(server):
-    class Job(db.Base):
-        __tablename__ = server
-        __bind_key__ = 'jobs'
-        # https://stackoverflow.com/questions/10059345/sqlalchemy-unique-across-multiple-columns
-        # https://stackoverflow.com/questions/43975349/why-uniqueconstraint-doesnt-work-in-flask-sqlalchemy
-        __table_args__ = (UniqueConstraint('project', 'spider', 'job'), )
-
-        id = Column(Integer, primary_key=True)
-        project = Column(String(255), unique=False, nullable=False)  # Pending
-        spider = Column(String(255), unique=False, nullable=False)  # Pending
-        job = Column(String(255), unique=False, nullable=False)  # Pending
-        status = Column(String(1), unique=False, nullable=False, index=True)  # Pending 0, Running 1, Finished 2
-        deleted = Column(String(1), unique=False, nullable=False, default='0', index=True)
-        create_time = Column(DateTime, unique=False, nullable=False, default=datetime.now)
-        update_time = Column(DateTime, unique=False, nullable=False, default=datetime.now)
-
-        pages = Column(Integer, unique=False, nullable=True)
-        items = Column(Integer, unique=False, nullable=True)
-        pid = Column(Integer, unique=False, nullable=True)  # Running
-        start = Column(DateTime, unique=False, nullable=True, index=True)
-        runtime = Column(String(20), unique=False, nullable=True)
-        finish = Column(DateTime, unique=False, nullable=True, index=True)  # Finished
-        href_log = Column(Text(), unique=False, nullable=True)
-        href_items = Column(Text(), unique=False, nullable=True)
-
-        def __repr__(self):
-            return "<Job #%s in table %s, %s/%s/%s start: %s>" % (
-                self.id, self.__tablename__, self.project, self.spider, self.job, self.start)
-
-    return Job
-    # sqlalchemy/ext/declarative/clsregistry.py:128: SAWarning: This declarative base already contains a class
-    # with the same class name and module name as scrapydash.models.Job,
-    # and will be replaced in the string-lookup table.
-    # https://stackoverflow.com/questions/27773489/dynamically-create-a-python-subclass-in-a-function
-    # return type('Job_%s' % server, (Job, ), dict(__tablename__=server,  __bind_key__='jobs'))
-
-# print(dir([create_table(s) for s in 'abc'][0]))
+# The jobs of all nodes in one table, instead of one table per Scrapyd server,
+# see jobs_migrate.py for moving the jobs of the legacy tables like '127_0_0_1_6800'
+class Job(db.Base):
+    __tablename__ = 'job'
+    __bind_key__ = 'jobs'
+    # https://stackoverflow.com/questions/10059345/sqlalchemy-unique-across-multiple-columns
+    __table_args__ = (
+        UniqueConstraint('node', 'project', 'spider', 'job', name='uq_job_node_project_spider_job'),
+        # Looking up the jobs of a snapshot, see jobs_sync.load_existing()
+        Index('ix_job_node_job', 'node', 'job'),
+        # Cluster-wide queries, e.g. all running jobs of a spider
+        Index('ix_job_project_spider_status', 'project', 'spider', 'status'),
+        Index('ix_job_status_deleted', 'status', 'deleted'),
+        # Searching the job history by time range, see jobs_query.py
+        Index('ix_job_project_spider_finish', 'project', 'spider', 'finish'),
+        Index('ix_job_finish', 'finish'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    node = Column(Integer, unique=False, nullable=False)  # Starting from 1, see SCRAPYD_SERVERS
+    project = Column(String(255), unique=False, nullable=False)  # Pending
+    spider = Column(String(255), unique=False, nullable=False)  # Pending
+    job = Column(String(255), unique=False, nullable=False)  # Pending
+    status = Column(String(1), unique=False, nullable=False)  # Pending 0, Running 1, Finished 2
+    deleted = Column(String(1), unique=False, nullable=False, default='0')
+    create_time = Column(DateTime, unique=False, nullable=False, default=datetime.now)
+    update_time = Column(DateTime, unique=False, nullable=False, default=datetime.now)
+
+    pages = Column(Integer, unique=False, nullable=True)
+    items = Column(Integer, unique=False, nullable=True)
+    pid = Column(Integer, unique=False, nullable=True)  # Running
+    start = Column(DateTime, unique=False, nullable=True)
+    runtime = Column(String(20), unique=False, nullable=True)
+    finish = Column(DateTime, unique=False, nullable=True)  # Finished
+    href_log = Column(Text(), unique=False, nullable=True)
+    href_items = Column(Text(), unique=False, nullable=True)
+
+    def __repr__(self):
+        return "<Job #%s of node %s, %s/%s/%s start: %s>" % (
+            self.id, self.node, self.project, self.spider, self.job, self.start)
+
+
+# Matches the order of the jobs listing of a node for keyset pagination, see pagination.py
+Index('ix_job_keyset', Job.node, Job.deleted, Job.status, Job.finish.desc(), Job.start, Job.id)
+
+
+# The finished jobs of each spider of each node aggregated by the hour of finish,
+# kept up to date along with the Job table, see jobs_sync.refresh_job_rollups()
+class JobRollup(db.Base):
+    __tablename__ = 'job_rollup'
+    __bind_key__ = 'jobs'
+    __table_args__ = (
+        UniqueConstraint('node', 'project', 'spider', 'hour', name='uq_job_rollup_node_project_spider_hour'),
+        Index('ix_job_rollup_hour', 'hour', 'project', 'spider'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    node = Column(Integer, unique=False, nullable=False)
+    project = Column(String(255), unique=False, nullable=False)
+    spider = Column(String(255), unique=False, nullable=False)
+    hour = Column(DateTime, unique=False, nullable=False)  # e.g. 2026-01-01 08:00:00
+    day = Column(Date, unique=False, nullable=False)
+    jobs = Column(Integer, unique=False, nullable=False, default=0)
+    pages = Column(Integer, unique=False, nullable=False, default=0)
+    items = Column(Integer, unique=False, nullable=False, default=0)
+    runtime = Column(Integer, unique=False, nullable=False, default=0)  # Total seconds from start to finish
+    max_runtime = Column(Integer, unique=False, nullable=False, default=0)
+    update_time = Column(DateTime, unique=False, nullable=False, default=datetime.now)
+
+    def __repr__(self):
+        return "<JobRollup of node %s, %s/%s hour: %s jobs: %s>" % (
+            self.node, self.project, self.spider, self.hour, self.jobs)
+
+
+# The reports of finished jobs parsed from their logfiles, bounded by size and age, see report_store.py
+class JobReport(db.Base):
+    __tablename__ = 'job_report'
+    __bind_key__ = 'jobs'
+    __table_args__ = (
+        UniqueConstraint('node', 'project', 'spider', 'job', name='uq_job_report_node_project_spider_job'),
+        # Listing the latest reports of a node, and dropping the oldest reports on compaction
+        Index('ix_job_report_node_update_time', 'node', 'update_time'),
+        Index('ix_job_report_update_time', 'update_time'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    node = Column(Integer, unique=False, nullable=False)
+    project = Column(String(255), unique=False, nullable=False)
+    spider = Column(String(255), unique=False, nullable=False)
+    job = Column(String(255), unique=False, nullable=False)
+    report = Column(Text(), unique=False, nullable=False)  # Compact JSON of the keys in REPORT_KEYS
+    update_time = Column(DateTime, unique=False, nullable=False, default=datetime.now)
+
+    def __repr__(self):
+        return "<JobReport of node %s, %s/%s/%s update_time: %s>" % (
+            self.node, self.project, self.spider, self.job, self.update_time)
+
+
+# The eggs kept in the artifact store by (project, version), the blob being named by the sha256 of the egg,
+# so that the versions with the same egg share a blob, see artifact_store.py
+class EggArtifact(db.Base):
+    __tablename__ = 'egg_artifact'
+    __table_args__ = (
+        UniqueConstraint('project', 'version', name='uq_egg_artifact_project_version'),
+        # Counting the references to a blob before dropping it
+        Index('ix_egg_artifact_digest', 'digest'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    project = Column(String(255), unique=False, nullable=False)
+    version = Column(String(255), unique=False, nullable=False)
+    digest = Column(String(64), unique=False, nullable=False)
+    size = Column(Integer, unique=False, nullable=False)
+    create_time = Column(DateTime, unique=False, nullable=False, default=datetime.now)
+
+    def __repr__(self):
+        return "<EggArtifact %s %s digest: %s create_time: %s>" % (
+            self.project, self.version, self.digest, self.create_time)
+
+
+# The versions of a project deployed to each node, the latest one being the current version of the project
+class EggDeployment(db.Base):
+    __tablename__ = 'egg_deployment'
+    __table_args__ = (
+        UniqueConstraint('node', 'project', 'version', name='uq_egg_deployment_node_project_version'),
+        Index('ix_egg_deployment_project_deploy_time', 'project', 'deploy_time'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    node = Column(Integer, unique=False, nullable=False)
+    project = Column(String(255), unique=False, nullable=False)
+    version = Column(String(255), unique=False, nullable=False)
+    digest = Column(String(64), unique=False, nullable=False)
+    deploy_time = Column(DateTime, unique=False, nullable=False, default=datetime.now)
+
+    def __repr__(self):
+        return "<EggDeployment of node %s, %s %s deploy_time: %s>" % (
+            self.node, self.project, self.version, self.deploy_time)
 
 
 # http://flask-sqlalchemy.pocoo.org/2.3/models/    One-to-Many Relationships
@@ -195,6 +335,7 @@ class Task(db.Base):
 
 class TaskResult(db.Base):
     __tablename__ = 'task_result'
+    __table_args__ = (Index('ix_task_result_task_id_id', 'task_id', 'id'), )
 
     id = Column(Integer, primary_key=True)
     task_id = Column(Integer, ForeignKey('task.id'), nullable=False, index=True)
@@ -211,6 +352,7 @@ class TaskResult(db.Base):
 
 class TaskJobResult(db.Base):
     __tablename__ = 'task_job_result'
+    __table_args__ = (Index('ix_task_job_result_task_result_id_node_id', 'task_result_id', 'node', 'id'), )
 
     id = Column(Integer, primary_key=True)
     task_result_id = Column(Integer, ForeignKey('task_result.id'), nullable=False, index=True)
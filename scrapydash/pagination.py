@@ -0,0 +1,88 @@
+# coding: utf-8
+"""
+Keyset pagination module: pages are located by the sort key of the last row instead of OFFSET,
+so that a deep page costs the same as the first one, given an index matching the sort order.
+"""
+import base64
+from datetime import datetime
+import json
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import and_, or_
+
+# [(column, descending), ...], the last column must be unique, e.g. the primary key
+SortKey = Sequence[Tuple[Any, bool]]
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict):
+        return datetime.fromisoformat(value['dt'])
+    return value
+
+
+def encode_cursor(name: str, values: List[Any]) -> str:
+    """Return an opaque cursor for the sort key values of a row, bound to the name of the listing"""
+    payload = json.dumps([name, [_encode_value(v) for v in values]], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(name: str, cursor: str, size: int) -> List[Any]:
+    try:
+        payload = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        cursor_name, values = json.loads(payload.decode('utf-8'))
+        assert cursor_name == name and isinstance(values, list) and len(values) == size
+        return [_decode_value(v) for v in values]
+    except Exception:
+        raise InvalidCursor("Invalid cursor: %s" % cursor)
+
+
+def keyset_condition(sort_key: SortKey, values: List[Any]):
+    """
+    The rows after values in the order of sort_key:
+    (c1 > v1) OR (c1 = v1 AND c2 > v2) OR ..., with '<' for descending columns.
+    A NULL value is only compared for equality, as NULL sorts differently across databases.
+    This is sound as long as a nullable column is NULL for all rows sharing the preceding columns,
+    e.g. finish and start of Job within the same status.
+    """
+    ors = []
+    for i, (column, descending) in enumerate(sort_key):
+        equals = [c.is_(None) if v is None else c == v for (c, __), v in zip(sort_key[:i], values[:i])]
+        value = values[i]
+        if value is None:
+            continue
+        ors.append(and_(*(equals + [column < value if descending else column > value])))
+    return or_(*ors)
+
+
+def paginate_keyset(query, name: str, sort_key: SortKey, cursor: Optional[str] = None,
+                    limit: int = 100) -> Tuple[List[Any], Optional[str]]:
+    """Return (rows, next_cursor) of the page after cursor; next_cursor is None on the last page"""
+    if cursor:
+        values = decode_cursor(name, cursor, len(sort_key))
+        query = query.filter(keyset_condition(sort_key, values))
+    query = query.order_by(*[column.desc() if descending else column.asc() for column, descending in sort_key])
+    rows = query.limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(name, [getattr(rows[-1], column.key) for column, __ in sort_key])
+    return rows, next_cursor
+
+
+def row_to_dict(record) -> Dict[str, Any]:
+    """Column values of an ORM instance, with datetime as str"""
+    result = {}
+    for column in record.__table__.columns:
+        value = getattr(record, column.key)
+        result[column.key] = str(value) if isinstance(value, datetime) else value
+    return result
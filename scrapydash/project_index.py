@@ -0,0 +1,201 @@
+# coding: utf-8
+"""
+Project index module for the Scrapy projects in SCRAPY_PROJECTS_DIR, as listed on the Deploy page:
+the folders, the directory holding scrapy.cfg, the project name and the latest modification time of each project.
+The index is built with os.scandir and refreshed incrementally: only the directories whose mtime has changed,
+i.e. with entries added, removed or replaced, are scanned again, the others cost one stat each.
+"""
+from collections import deque
+from configparser import ConfigParser, Error as ScrapyCfgParseError
+from datetime import datetime
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, List
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REFRESH_INTERVAL = 5
+# Files modified in place do not change the mtime of their directory, so rescan everything once in a while
+FULL_RESCAN_INTERVAL = 300
+# Never part of a project, and often huge
+IGNORED_DIRS = {'.git', '.hg', '.svn', '.tox', '.nox', '.idea', '.vscode', '.mypy_cache', '.pytest_cache',
+                '__pycache__', 'node_modules', 'venv', '.venv', 'env', 'build', 'dist', 'project.egg-info'}
+IGNORED_TOP_FILES = {'setup.py', 'setup_backup.py'}
+
+
+def is_ignored_dir(name: str) -> bool:
+    return name in IGNORED_DIRS or name.endswith('.egg-info')
+
+
+class DirState:
+    """The mtime of a directory, the latest mtime of its files and its subdirectories, as of the last scan"""
+    __slots__ = ('mtime_ns', 'latest', 'subdirs', 'has_cfg')
+
+    def __init__(self, mtime_ns: int, latest: float, subdirs: List[str], has_cfg: bool):
+        self.mtime_ns = mtime_ns
+        self.latest = latest
+        self.subdirs = subdirs
+        self.has_cfg = has_cfg
+
+
+class ProjectEntry:
+
+    def __init__(self, folder: str, path: str):
+        self.folder = folder
+        self.path = path
+        self.dirs: Dict[str, DirState] = {}
+        self.cfg_dir = ''
+        self.cfg_mtime_ns = 0
+        self.project = folder
+        self.latest = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(folder=self.folder, project=self.project, cfg_dir=self.cfg_dir, modification_time=self.latest,
+                    modification_time_str=datetime.fromtimestamp(self.latest).strftime('%Y-%m-%dT%H_%M_%S'))
+
+
+def scan_dir(path: str, top: bool) -> DirState:
+    st = os.stat(path)
+    latest = 0.0
+    subdirs = []
+    has_cfg = False
+    with os.scandir(path) as it:
+        for entry in it:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if not is_ignored_dir(entry.name):
+                        subdirs.append(entry.path)
+                elif entry.is_file():
+                    if entry.name == 'scrapy.cfg':
+                        has_cfg = True
+                    if entry.name.endswith('.egg') or (top and entry.name in IGNORED_TOP_FILES):
+                        continue
+                    latest = max(latest, entry.stat().st_mtime)
+            except OSError:  # Removed meanwhile
+                continue
+    subdirs.sort()
+    return DirState(st.st_mtime_ns, latest, subdirs, has_cfg)
+
+
+def get_project_name(cfg_path: str, default: str) -> str:
+    """[deploy] project in scrapy.cfg, or the name of the folder"""
+    config = ConfigParser()
+    try:
+        config.read(cfg_path)
+        return config.get('deploy', 'project', fallback='') or default
+    except ScrapyCfgParseError as err:
+        logger.error("%s parse error: %s", cfg_path, err)
+        return default
+
+
+def refresh_project(entry: ProjectEntry, full: bool = False) -> int:
+    """Update the entry, scanning only the directories which have changed unless full, return how many were"""
+    scanned = 0
+    dirs: Dict[str, DirState] = {}
+    pending = deque([entry.path])  # Breadth first, so that the scrapy.cfg nearest to the top is found first
+    cfg_dir = ''
+    while pending:
+        path = pending.popleft()
+        state = entry.dirs.get(path)
+        try:
+            if full or state is None or os.stat(path).st_mtime_ns != state.mtime_ns:
+                state = scan_dir(path, path == entry.path)
+                scanned += 1
+        except OSError:
+            continue
+        dirs[path] = state
+        if state.has_cfg and not cfg_dir:
+            cfg_dir = path
+        pending.extend(state.subdirs)
+    entry.dirs = dirs
+    entry.latest = max([state.latest for state in dirs.values()] or [time.time()])
+    entry.cfg_dir = cfg_dir
+    if cfg_dir:
+        cfg_path = os.path.join(cfg_dir, 'scrapy.cfg')
+        try:
+            mtime_ns = os.stat(cfg_path).st_mtime_ns
+        except OSError:
+            mtime_ns = 0
+        if mtime_ns != entry.cfg_mtime_ns:
+            entry.cfg_mtime_ns = mtime_ns
+            entry.project = get_project_name(cfg_path, entry.folder)
+    return scanned
+
+
+class ProjectIndex:
+    """
+    The projects in SCRAPY_PROJECTS_DIR, i.e. the folders with a scrapy.cfg inside.
+    Reads are served from memory, and refresh the index first if it is older than refresh_interval seconds.
+    """
+
+    def __init__(self, projects_dir: str, refresh_interval: float = DEFAULT_REFRESH_INTERVAL):
+        self.projects_dir = projects_dir
+        self.refresh_interval = refresh_interval
+        self.entries: Dict[str, ProjectEntry] = {}
+        self.top_mtime_ns = 0
+        self.last_refresh = 0.0
+        self.last_full_refresh = 0.0
+        self.stats = dict(refreshes=0, scanned_dirs=0, duration=0.0)
+        self._lock = threading.Lock()
+
+    def refresh(self, full: bool = False):
+        start = time.monotonic()
+        full = full or time.monotonic() - self.last_full_refresh > FULL_RESCAN_INTERVAL
+        scanned = 0
+        try:
+            top_mtime_ns = os.stat(self.projects_dir).st_mtime_ns
+        except OSError:
+            self.entries = {}
+        else:
+            if full or top_mtime_ns != self.top_mtime_ns:
+                folders = []
+                with os.scandir(self.projects_dir) as it:
+                    for entry in it:
+                        if entry.is_dir() and not is_ignored_dir(entry.name):
+                            folders.append((entry.name, entry.path))
+                self.entries = dict((folder, self.entries.get(folder) or ProjectEntry(folder, path))
+                                    for folder, path in folders)
+                self.top_mtime_ns = top_mtime_ns
+            for entry in self.entries.values():
+                scanned += refresh_project(entry, full)
+        now = time.monotonic()
+        self.last_refresh = now
+        if full:
+            self.last_full_refresh = now
+        self.stats['refreshes'] += 1
+        self.stats['scanned_dirs'] += scanned
+        self.stats['duration'] = round(now - start, 3)
+        logger.debug("Refreshed project index of %s in %.3fs, %s directories scanned",
+                     self.projects_dir, now - start, scanned)
+
+    def ensure_fresh(self):
+        if time.monotonic() - self.last_refresh < self.refresh_interval and self.last_refresh:
+            return
+        with self._lock:
+            if time.monotonic() - self.last_refresh >= self.refresh_interval or not self.last_refresh:
+                self.refresh()
+
+    def list_projects(self) -> List[Dict[str, Any]]:
+        """The projects sorted by folder, case insensitive, as on the Deploy page"""
+        self.ensure_fresh()
+        entries = [entry for entry in self.entries.values() if entry.cfg_dir]
+        return [entry.to_dict() for entry in sorted(entries, key=lambda x: x.folder.lower())]
+
+    def get_cfg_dir(self, folder: str) -> str:
+        """Return the directory of scrapy.cfg of the project in folder, or '' if not found"""
+        self.ensure_fresh()
+        entry = self.entries.get(folder)
+        return entry.cfg_dir if entry else ''
+
+
+def get_project_index(app) -> ProjectIndex:
+    """Return the index of SCRAPY_PROJECTS_DIR of the app, created on first use"""
+    config = getattr(app.state, 'config', None) or {}
+    projects_dir = config.get('SCRAPY_PROJECTS_DIR', '')
+    index = getattr(app.state, 'project_index', None)
+    if index is None or index.projects_dir != projects_dir:
+        index = app.state.project_index = ProjectIndex(
+            projects_dir, config.get('PROJECT_INDEX_REFRESH_INTERVAL', DEFAULT_REFRESH_INTERVAL))
+    return index
@@ -0,0 +1,228 @@
+# coding: utf-8
+"""
+Report store module for keeping the reports of finished jobs in the JobReport table,
+with an in-memory LRU in front, so that the Node Reports and Cluster Reports pages
+are served at once, even after a restart, without fetching and parsing the logfiles again.
+"""
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import json
+import logging
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from logparser.common import Common
+
+logger = logging.getLogger(__name__)
+
+# The stats of a job kept in its report, see make_report()
+REPORT_KEYS = ['pages', 'items', 'shutdown_reason', 'finish_reason', 'runtime', 'first_log_time', 'latest_log_time',
+               'log_categories', 'latest_matches']
+REPORT_KEYS_SET = set(REPORT_KEYS)
+DEFAULT_REPORTS_LIMIT = 10000
+DEFAULT_REPORTS_MAX_AGE = 90  # Days
+# The reports of the jobs requested lately are kept in memory as well
+CACHE_SIZE = 1000
+# Drop the reports beyond the limits after every COMPACT_EVERY writes, in batches of DELETE_BATCH rows
+COMPACT_EVERY = 100
+DELETE_BATCH = 500
+NA = Common.NA
+
+ReportKey = Tuple[int, str, str, str]  # (node, project, spider, job)
+
+
+def get_default_session_factory():
+    from .models import db
+    return db.Session
+
+
+def make_report(stats: Dict[str, Any]) -> Dict[str, Any]:
+    """Keep the keys in REPORT_KEYS of the stats parsed by LogParser, with the counts of the log categories only"""
+    report = dict((k, stats.get(k, NA)) for k in REPORT_KEYS)
+    report['log_categories'] = dict((k, dict(count=v.get('count', 0)))
+                                    for k, v in (stats.get('log_categories') or {}).items())
+    report['latest_matches'] = dict(latest_item=(stats.get('latest_matches') or {}).get('latest_item', ''))
+    return report
+
+
+def is_finished(stats: Dict[str, Any]) -> bool:
+    return stats.get('shutdown_reason', NA) != NA or stats.get('finish_reason', NA) != NA
+
+
+def merge_reports(reports: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """Sum up the reports of a job on multiple nodes, e.g. for the Cluster Reports page"""
+    totals: Dict[str, Any] = dict(nodes=0, finished=0, pages=0, items=0, first_log_time=NA, latest_log_time=NA,
+                                  log_categories={}, finish_reasons={})
+    for report in reports:
+        totals['nodes'] += 1
+        totals['finished'] += is_finished(report)
+        for k in ['pages', 'items']:
+            if isinstance(report.get(k), int):
+                totals[k] += report[k]
+        for k, pick in [('first_log_time', min), ('latest_log_time', max)]:
+            if report.get(k, NA) != NA:
+                totals[k] = report[k] if totals[k] == NA else pick(totals[k], report[k])
+        for k, v in (report.get('log_categories') or {}).items():
+            totals['log_categories'][k] = totals['log_categories'].get(k, 0) + v.get('count', 0)
+        reason = report.get('finish_reason', NA)
+        if reason != NA:
+            totals['finish_reasons'][reason] = totals['finish_reasons'].get(reason, 0) + 1
+    return totals
+
+
+class ReportStore:
+    """
+    The reports of finished jobs, at most limit of them and none older than max_age days, 0 for no limit.
+    Reads go to the LRU first, writes go to the database at once.
+    """
+
+    def __init__(self, session_factory: Optional[Callable] = None, limit: int = DEFAULT_REPORTS_LIMIT,
+                 max_age: int = DEFAULT_REPORTS_MAX_AGE, cache_size: int = CACHE_SIZE):
+        self.session_factory = session_factory
+        self.limit = limit
+        self.max_age = max_age
+        self.cache_size = cache_size
+        self.cache: 'OrderedDict[ReportKey, Dict[str, Any]]' = OrderedDict()
+        self.writes = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict[str, Any]] = None,
+                    session_factory: Optional[Callable] = None) -> 'ReportStore':
+        config = config or {}
+        return cls(session_factory, config.get('STATS_REPORTS_LIMIT', DEFAULT_REPORTS_LIMIT),
+                   config.get('STATS_REPORTS_MAX_AGE', DEFAULT_REPORTS_MAX_AGE))
+
+    def get_session(self):
+        from .models import JobReport, ensure_table
+        if self.session_factory is None:
+            self.session_factory = get_default_session_factory()
+        session = self.session_factory()
+        ensure_table(JobReport.__table__, session.get_bind(JobReport))
+        return session
+
+    def remember(self, key: ReportKey, report: Dict[str, Any]):
+        with self._lock:
+            self.cache[key] = report
+            self.cache.move_to_end(key)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+    def forget(self, keys: Iterable[ReportKey]):
+        with self._lock:
+            for key in keys:
+                self.cache.pop(key, None)
+
+    def get(self, node: int, project: str, spider: str, job: str) -> Optional[Dict[str, Any]]:
+        return self.get_many(project, spider, job, [node]).get(node)
+
+    def get_many(self, project: str, spider: str, job: str, nodes: List[int]) -> Dict[int, Dict[str, Any]]:
+        """Return {node: report} of the job on the nodes, loading those not in the LRU in one query"""
+        from .models import JobReport
+        reports = {}
+        with self._lock:
+            for node in nodes:
+                report = self.cache.get((node, project, spider, job))
+                if report is not None:
+                    self.cache.move_to_end((node, project, spider, job))
+                    reports[node] = report
+        missing = [node for node in nodes if node not in reports]
+        if missing:
+            session = self.get_session()
+            try:
+                rows = (session.query(JobReport.node, JobReport.report)
+                        .filter(JobReport.project == project, JobReport.spider == spider, JobReport.job == job,
+                                JobReport.node.in_(missing)).all())
+            finally:
+                session.close()
+            for node, text in rows:
+                reports[node] = json.loads(text)
+                self.remember((node, project, spider, job), reports[node])
+        return reports
+
+    def list(self, node: int, project: Optional[str] = None, spider: Optional[str] = None,
+             limit: int = 100) -> List[Dict[str, Any]]:
+        """Return the latest reports of a node, most recently updated first"""
+        from .models import JobReport
+        session = self.get_session()
+        try:
+            query = session.query(JobReport).filter(JobReport.node == node)
+            if project:
+                query = query.filter(JobReport.project == project)
+            if spider:
+                query = query.filter(JobReport.spider == spider)
+            rows = query.order_by(JobReport.update_time.desc(), JobReport.id.desc()).limit(limit).all()
+            return [dict(json.loads(row.report), node=row.node, project=row.project, spider=row.spider, job=row.job,
+                         update_time=str(row.update_time)) for row in rows]
+        finally:
+            session.close()
+
+    def put(self, node: int, project: str, spider: str, job: str, stats: Dict[str, Any]) -> Dict[str, Any]:
+        """Save the report of the stats of a finished job, unless it is the same as the one saved before"""
+        from .models import JobReport
+        key = (node, project, spider, job)
+        report = make_report(stats)
+        with self._lock:
+            if self.cache.get(key) == report:
+                return report
+        session = self.get_session()
+        try:
+            row = session.query(JobReport).filter_by(node=node, project=project, spider=spider, job=job).first()
+            if row is None:
+                row = JobReport(node=node, project=project, spider=spider, job=job)
+                session.add(row)
+            row.report = json.dumps(report, ensure_ascii=False, separators=(',', ':'))
+            row.update_time = datetime.now()
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+        self.remember(key, report)
+        self.writes += 1
+        if self.writes % COMPACT_EVERY == 1:
+            self.compact()
+        return report
+
+    def compact(self, now: Optional[datetime] = None) -> int:
+        """Drop the reports older than max_age days, then the oldest ones beyond limit, return the number dropped"""
+        from .models import JobReport
+        session = self.get_session()
+        columns = (JobReport.id, JobReport.node, JobReport.project, JobReport.spider, JobReport.job)
+        try:
+            rows = []
+            if self.max_age > 0:
+                deadline = (now or datetime.now()) - timedelta(days=self.max_age)
+                rows.extend(session.query(*columns).filter(JobReport.update_time < deadline).all())
+            if self.limit > 0:
+                excess = session.query(JobReport).count() - len(rows) - self.limit
+                if excess > 0:
+                    expired = set(row[0] for row in rows)
+                    query = (session.query(*columns).order_by(JobReport.update_time, JobReport.id)
+                             .limit(excess + len(expired)))
+                    rows.extend(row for row in query if row[0] not in expired)
+            # In batches, as LIMIT in subqueries is not supported by all databases
+            for i in range(0, len(rows), DELETE_BATCH):
+                ids = [row[0] for row in rows[i:i + DELETE_BATCH]]
+                session.query(JobReport).filter(JobReport.id.in_(ids)).delete(synchronize_session=False)
+            session.commit()
+        except Exception as err:
+            session.rollback()
+            logger.error("Fail to compact the job reports: %s", err)
+            return 0
+        finally:
+            session.close()
+        self.forget(tuple(row[1:]) for row in rows)
+        if rows:
+            logger.info("Dropped %s job reports beyond the limits: %s reports, %s days", len(rows),
+                        self.limit, self.max_age)
+        return len(rows)
+
+
+def get_report_store(app) -> ReportStore:
+    """Return the store created in lifespan, or a fresh one if lifespan has not run (e.g. in tests)"""
+    store = getattr(app.state, 'report_store', None)
+    if store is None:
+        store = app.state.report_store = ReportStore.from_config(getattr(app.state, 'config', None))
+    return store
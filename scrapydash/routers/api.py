@@ -2,64 +2,51 @@
 """
 API router for ScrapydWeb FastAPI - Scrapyd API endpoints
 """
-from typing import Optional, Dict, Any, List
+import asyncio
+from datetime import datetime
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+from typing import Optional, Dict, Any, List, Tuple
 from fastapi import APIRouter, Depends, HTTPException, Request, Query
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from sqlalchemy.orm import Session
 
+import httpx
+
+from ..api_cache import MUTATING_OPTS, get_api_cache
+from ..artifact_store import get_artifact_store
 from ..database import get_db
+from ..deploy import DEFAULT_DEPLOY_RETRIES, add_version, clean_project_name, clean_version, deploy_to_nodes
+from ..deploy_upload import (DEFAULT_EXTRACT_MAX_BYTES, DEFAULT_UPLOAD_MAX_BYTES, UploadError, extract_project,
+                             get_upload_extension, get_upload_file, parse_upload, save_egg)
+from ..egg_cache import BuildError, get_egg_cache
+from ..jobs_query import aggregate_jobs, parse_statuses, search_jobs_query
+from ..jobs_snapshot import get_jobs_snapshot_worker
+from ..jobs_sync import NOT_DELETED
+from ..log_reader import LogNotFound, open_log, parse_range_header, stream_log
+from ..log_stats import get_log_stats_engine, request_logparser_stats
+from ..models import Job, JobRollup, Task, TaskJobResult, TaskResult, ensure_table, get_session
+from ..pagination import InvalidCursor, paginate_keyset, row_to_dict
+from ..project_index import get_project_index
+from ..report_store import get_report_store, is_finished, make_report, merge_reports
+from ..task_summary import get_task_scheduler, summarize_tasks
 from ..common import get_response_from_view, json_dumps
-import requests
+from ..scrapyd_client import get_scrapyd_client, get_scrapyd_server
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-@router.get("/{node:int}/api/{opt}")
-@router.get("/{node:int}/api/{opt}/{project}")
-@router.get("/{node:int}/api/{opt}/{project}/{version_spider_job}")
-@router.get("/api/{opt}")
-@router.get("/api/{opt}/{project}")
-@router.get("/api/{opt}/{project}/{version_spider_job}")
-async def api_endpoint(
-    request: Request,
-    opt: str,
-    node: int = 1,
-    project: Optional[str] = None,
-    version_spider_job: Optional[str] = None,
-    db: Session = Depends(get_db)
-):
-    """
-    Proxy API calls to Scrapyd servers
-    Handles: listprojects, listversions, listspiders, listjobs, delproject, delversion, schedule, cancel, etc.
-    """
-    config = request.app.state.config
-    scrapyd_servers = config.get('SCRAPYD_SERVERS', []) or ['127.0.0.1:6800']
-    
-    if node < 1 or node > len(scrapyd_servers):
-        raise HTTPException(status_code=404, detail="Node not found")
-    
-    server = scrapyd_servers[node - 1]
-    
-    # Parse server URL and auth
-    if '@' in server:
-        auth_part, server_part = server.split('@', 1)
-        if ':' in auth_part:
-            username, password = auth_part.split(':', 1)
-            auth = (username, password)
-        else:
-            auth = None
-    else:
-        server_part = server
-        auth = None
-    
-    # Build Scrapyd API URL
-    if '://' not in server_part:
-        server_part = f'http://{server_part}'
-    
-    scrapyd_url = f"{server_part}/{opt}.json"
-    
-    # Prepare parameters
+
+def build_scrapyd_params(opt: str, project: Optional[str] = None, version_spider_job: Optional[str] = None,
+                         query_params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Build the parameters of a Scrapyd API call from the path of api_endpoint"""
     params = {}
-    query_params = dict(request.query_params)
+    query_params = query_params or {}
     
     # Handle different API endpoints
     if opt == 'listprojects':
@@ -93,44 +80,184 @@ async def api_endpoint(
             params['job'] = version_spider_job
     elif opt == 'daemonstatus':
         pass  # No additional params needed
-    
+    return params
+
+
+async def request_scrapyd(client, server_part: str, auth, opt: str, params: Dict[str, Any],
+                          post: bool = False) -> Tuple[int, Dict[str, Any]]:
+    """Call {opt}.json of one Scrapyd server, returning (status_code, js) instead of raising"""
+    scrapyd_url = f"{server_part}/{opt}.json"
     try:
-        # Make request to Scrapyd
-        if request.method == 'POST':
-            # Get form data for POST requests
-            form_data = await request.form()
-            params.update(dict(form_data))
-            response = requests.post(scrapyd_url, data=params, auth=auth, timeout=30)
+        # Make request to Scrapyd without blocking the event loop
+        if post:
+            response = await client.post(scrapyd_url, data=params, auth=auth)
         else:
-            response = requests.get(scrapyd_url, params=params, auth=auth, timeout=30)
+            response = await client.get(scrapyd_url, params=params, auth=auth)
         
         response.raise_for_status()
         
-        # Return JSON response
         try:
-            json_data = response.json()
-            return JSONResponse(content=json_data)
+            return response.status_code, response.json()
         except ValueError:
             # If not JSON, return text response
-            return JSONResponse(content={"status": "ok", "message": response.text})
+            return response.status_code, {"status": "ok", "message": response.text}
             
-    except requests.exceptions.RequestException as e:
-        return JSONResponse(
-            status_code=500,
-            content={
-                "status": "error", 
-                "message": f"Failed to connect to Scrapyd server: {str(e)}",
-                "server": server_part
-            }
-        )
+    except httpx.HTTPError as e:
+        return 500, {
+            "status": "error", 
+            "message": f"Failed to connect to Scrapyd server: {str(e)}",
+            "server": server_part
+        }
     except Exception as e:
-        return JSONResponse(
-            status_code=500,
-            content={
-                "status": "error",
-                "message": f"API error: {str(e)}"
-            }
+        return 500, {
+            "status": "error",
+            "message": f"API error: {str(e)}"
+        }
+
+
+async def call_scrapyd_node(app, node: int, opt: str, params: Dict[str, Any], project: Optional[str] = None,
+                            version_spider_job: Optional[str] = None, post: bool = False) -> Tuple[int, Dict[str, Any]]:
+    """
+    Call one Scrapyd server via the shared client, serving read-only opts from the cache
+    and invalidating the cached results of the node after a mutating opt
+    The returned js may be shared with other callers, copy it before modifying.
+    """
+    server_part, auth = get_scrapyd_server(app.state.config, node)
+    client = get_scrapyd_client(app)
+    cache = get_api_cache(app)
+    if opt in MUTATING_OPTS:
+        try:
+            return await request_scrapyd(client, server_part, auth, opt, params, post=post)
+        finally:
+            cache.invalidate(node, params.get('project', project))
+    if not post and cache.cacheable(opt):
+        return await cache.get_or_fetch(
+            (node, opt, project, version_spider_job),
+            lambda: request_scrapyd(client, server_part, auth, opt, params),
+            ok=lambda status_code, js: status_code == 200 and js.get('status') == 'ok'
         )
+    return await request_scrapyd(client, server_part, auth, opt, params, post=post)
+
+
+@router.get("/{node:int}/api/{opt}")
+@router.get("/{node:int}/api/{opt}/{project}")
+@router.get("/{node:int}/api/{opt}/{project}/{version_spider_job}")
+@router.get("/api/{opt}")
+@router.get("/api/{opt}/{project}")
+@router.get("/api/{opt}/{project}/{version_spider_job}")
+async def api_endpoint(
+    request: Request,
+    opt: str,
+    node: int = 1,
+    project: Optional[str] = None,
+    version_spider_job: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Proxy API calls to Scrapyd servers
+    Handles: listprojects, listversions, listspiders, listjobs, delproject, delversion, schedule, cancel, etc.
+    """
+    config = request.app.state.config
+    try:
+        get_scrapyd_server(config, node)
+    except IndexError:
+        raise HTTPException(status_code=404, detail="Node not found")
+    
+    params = build_scrapyd_params(opt, project, version_spider_job, dict(request.query_params))
+    post = request.method == 'POST'
+    if post:
+        # Get form data for POST requests
+        form_data = await request.form()
+        params.update(dict(form_data))
+    
+    status_code, js = await call_scrapyd_node(request.app, node, opt, params, project, version_spider_job, post=post)
+    return JSONResponse(status_code=status_code, content=js)
+
+def get_selected_nodes(config: Dict[str, Any], nodes: Optional[List[str]] = None,
+                       group: Optional[str] = None) -> List[int]:
+    """Resolve ?nodes=1&nodes=2 (or nodes=1,2) and ?group=xxx into node indexes, defaulting to all nodes"""
+    amount = len(config.get('SCRAPYD_SERVERS', []) or [None])
+    selected = set()
+    for value in nodes or []:
+        for node in value.split(','):
+            if node.strip():
+                try:
+                    selected.add(int(node))
+                except ValueError:
+                    raise HTTPException(status_code=400, detail="Invalid node: %s" % node)
+    if group is not None:
+        groups = config.get('SCRAPYD_SERVERS_GROUPS', []) or []
+        members = [idx for idx, name in enumerate(groups, 1) if name == group and idx <= amount]
+        if not members:
+            raise HTTPException(status_code=404, detail="Group not found: %s" % group)
+        selected.update(members)
+    if not nodes and group is None:
+        selected = set(range(1, amount + 1))
+    invalid = [node for node in selected if node < 1 or node > amount]
+    if invalid:
+        raise HTTPException(status_code=404, detail="Node not found: %s" % invalid)
+    return sorted(selected)
+
+
+@router.get("/cluster/api/{opt}")
+@router.get("/cluster/api/{opt}/{project}")
+@router.get("/cluster/api/{opt}/{project}/{version_spider_job}")
+@router.post("/cluster/api/{opt}")
+@router.post("/cluster/api/{opt}/{project}")
+@router.post("/cluster/api/{opt}/{project}/{version_spider_job}")
+async def cluster_api_endpoint(
+    request: Request,
+    opt: str,
+    project: Optional[str] = None,
+    version_spider_job: Optional[str] = None,
+    nodes: Optional[List[str]] = Query(None),
+    group: Optional[str] = None
+):
+    """
+    Fan out an API call to multiple Scrapyd servers concurrently
+    e.g. /cluster/api/daemonstatus?group=xxx or /cluster/api/cancel/demo/jobid?nodes=1,2
+    The merged JSON document is streamed as each node answers:
+    {"opt": ..., "nodes": {"2": {...}, "1": {...}}, "ok": 2, "error": 0, "elapsed": 0.1}
+    """
+    config = request.app.state.config
+    selected_nodes = get_selected_nodes(config, nodes, group)
+    
+    query_params = dict((k, v) for (k, v) in request.query_params.items() if k not in ['nodes', 'group'])
+    params = build_scrapyd_params(opt, project, version_spider_job, query_params)
+    post = request.method == 'POST'
+    if post:
+        form_data = await request.form()
+        params.update(dict(form_data))
+    
+    semaphore = asyncio.Semaphore(config.get('SCRAPYD_FANOUT_CONCURRENCY', 20))
+    
+    async def call_node(node):
+        async with semaphore:
+            status_code, js = await call_scrapyd_node(request.app, node, opt, dict(params),
+                                                      project, version_spider_job, post=post)
+        js = dict(js)
+        js.setdefault('status_code', status_code)
+        return node, js
+    
+    async def stream():
+        start_time = time.time()
+        counts = dict(ok=0, error=0)
+        tasks = [asyncio.ensure_future(call_node(node)) for node in selected_nodes]
+        try:
+            yield '{"opt": %s, "nodes": {' % json.dumps(opt)
+            for index, future in enumerate(asyncio.as_completed(tasks)):
+                node, js = await future
+                counts['ok' if js.get('status') == 'ok' else 'error'] += 1
+                yield '%s"%s": %s' % (', ' if index else '', node, json.dumps(js))
+            yield '}, "ok": %s, "error": %s, "elapsed": %.3f}' % (
+                counts['ok'], counts['error'], time.time() - start_time)
+        finally:
+            # In case the browser disconnects before all nodes answer
+            for task in tasks:
+                task.cancel()
+    
+    return StreamingResponse(stream(), media_type='application/json')
+
 
 @router.post("/{node:int}/api/{opt}")
 @router.post("/{node:int}/api/{opt}/{project}")
@@ -157,25 +284,15 @@ async def api_status(
 ):
     """Get API and server status"""
     config = request.app.state.config
-    scrapyd_servers = config.get('SCRAPYD_SERVERS', []) or ['127.0.0.1:6800']
-    
-    if node < 1 or node > len(scrapyd_servers):
+    try:
+        server_part, auth = get_scrapyd_server(config, node)
+    except IndexError:
         raise HTTPException(status_code=404, detail="Node not found")
     
-    server = scrapyd_servers[node - 1]
-    
-    # Parse server URL
-    if '@' in server:
-        _, server_part = server.split('@', 1)
-    else:
-        server_part = server
-    
-    if '://' not in server_part:
-        server_part = f'http://{server_part}'
-    
     try:
         # Test connection to Scrapyd
-        response = requests.get(f"{server_part}/daemonstatus.json", timeout=10)
+        client = get_scrapyd_client(request.app)
+        response = await client.get(f"{server_part}/daemonstatus.json", auth=auth, timeout=10)
         response.raise_for_status()
         daemon_status = response.json()
         
@@ -198,3 +315,593 @@ async def api_status(
                 "message": f"Cannot connect to Scrapyd: {str(e)}"
             }
         )
+
+
+@router.get("/{node:int}/log/{project}/{spider}/{job}")
+async def log_stream(
+    request: Request,
+    node: int,
+    project: str,
+    spider: str,
+    job: str,
+    lines: Optional[int] = Query(None, ge=0),
+    follow: bool = False,
+    with_ext: bool = False
+):
+    """
+    Stream a Scrapy logfile in chunks, from LOCAL_SCRAPYD_LOGS_DIR or from Scrapyd with Range requests.
+    ?lines=N for the last N lines, ?follow=true to keep pushing new lines of a running job, like 'tail -f',
+    or a Range header for a byte range, e.g. to resume from the offset in the X-Log-Offset header of a response.
+    """
+    config = request.app.state.config
+    try:
+        get_scrapyd_server(config, node)
+    except IndexError:
+        raise HTTPException(status_code=404, detail="Node not found")
+    try:
+        log = await open_log(get_scrapyd_client(request.app), config, node, project, spider, job, with_ext)
+    except LogNotFound as err:
+        raise HTTPException(status_code=404, detail=str(err))
+    status_code, start, end = 200, 0, None
+    headers = {'X-Log-Source': log.source, 'Accept-Ranges': 'bytes'}
+    range_header = request.headers.get('range')
+    try:
+        if lines is not None:
+            start = await log.tail_offset(lines)
+        elif range_header:
+            size = await log.size()
+            try:
+                start, end = parse_range_header(range_header, size)
+            except ValueError:
+                raise HTTPException(status_code=416, detail="Range not satisfiable: %s" % range_header,
+                                    headers={'Content-Range': 'bytes */%s' % size})
+            status_code = 206
+            headers['Content-Range'] = 'bytes %s-%s/%s' % (start, end - 1, size)
+            headers['Content-Length'] = str(end - start)
+    except httpx.HTTPError as err:
+        raise HTTPException(status_code=502, detail="Fail to request logfile from %s: %s" % (log.source, err))
+    headers['X-Log-Offset'] = str(start)
+    chunks = stream_log(log, start, end, follow=follow and end is None,
+                        interval=config.get('LOG_FOLLOW_INTERVAL', 2),
+                        timeout=config.get('LOG_FOLLOW_TIMEOUT', 3600),
+                        is_disconnected=request.is_disconnected)
+    return StreamingResponse(chunks, status_code=status_code, headers=headers,
+                             media_type='text/plain; charset=utf-8')
+
+
+async def parse_log_stats(request: Request, node: int, project: str, spider: str, job: str,
+                          job_finished: bool = False, with_ext: bool = False) -> Tuple[Dict[str, Any], str]:
+    """Return the stats of a logfile parsed incrementally, see log_stats.py, and the source of the logfile"""
+    config = request.app.state.config
+    try:
+        log = await open_log(get_scrapyd_client(request.app), config, node, project, spider, job, with_ext)
+    except LogNotFound as err:
+        raise HTTPException(status_code=404, detail=str(err))
+    engine = get_log_stats_engine(request.app)
+    path = engine.get_checkpoint_path(config, node, project, spider, job)
+    try:
+        stats = await engine.get_stats(log, path, final=job_finished)
+    except httpx.HTTPError as err:
+        raise HTTPException(status_code=502, detail="Fail to request logfile from %s: %s" % (log.source, err))
+    if is_finished(stats):
+        await asyncio.to_thread(get_report_store(request.app).put, node, project, spider, job, stats)
+    return stats, log.source
+
+
+@router.get("/{node:int}/log/{project}/{spider}/{job}/stats")
+@router.post("/{node:int}/log/{project}/{spider}/{job}/stats")
+async def log_stats(
+    request: Request,
+    node: int,
+    project: str,
+    spider: str,
+    job: str,
+    job_finished: bool = False,
+    with_ext: bool = False
+):
+    """
+    Stats of a Scrapy logfile parsed by LogParser, resuming from the offset checkpointed under STATS_PATH,
+    so that only the bytes appended since the previous request are fetched and parsed.
+    Pass job_finished=true once the job has finished, to parse the last lines as well.
+    The report of a finished job is kept in the report store, see report_store.py.
+    """
+    try:
+        get_scrapyd_server(request.app.state.config, node)
+    except IndexError:
+        raise HTTPException(status_code=404, detail="Node not found")
+    stats, source = await parse_log_stats(request, node, project, spider, job, job_finished, with_ext)
+    return JSONResponse(content=dict(stats, status='ok', source=source))
+
+
+@router.get("/{node:int}/log/{project}/{spider}/{job}/report")
+async def log_report(
+    request: Request,
+    node: int,
+    project: str,
+    spider: str,
+    job: str,
+    job_finished: bool = False,
+    with_ext: bool = False
+):
+    """
+    Report of a job: pages, items, runtime, finish reason and the counts of the log categories.
+    The report of a finished job is served from the report store, with from_memory=true,
+    otherwise the logfile is parsed like the stats above.
+    """
+    try:
+        get_scrapyd_server(request.app.state.config, node)
+    except IndexError:
+        raise HTTPException(status_code=404, detail="Node not found")
+    report = await asyncio.to_thread(get_report_store(request.app).get, node, project, spider, job)
+    if report is not None:
+        return dict(report, status='ok', from_memory=True)
+    stats, __ = await parse_log_stats(request, node, project, spider, job, job_finished, with_ext)
+    return dict(make_report(stats), status='ok', from_memory=False)
+
+
+@router.get("/{node:int}/reports")
+def list_reports(
+    request: Request,
+    node: int,
+    project: Optional[str] = None,
+    spider: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000)
+):
+    """Reports of the latest finished jobs of a node from the report store, most recently updated first"""
+    try:
+        get_scrapyd_server(request.app.state.config, node)
+    except IndexError:
+        raise HTTPException(status_code=404, detail="Node not found")
+    items = get_report_store(request.app).list(node, project, spider, limit)
+    return {"status": "ok", "node": node, "items": items}
+
+
+@router.get("/cluster/reports/{project}/{spider}/{job}")
+async def cluster_reports(
+    request: Request,
+    project: str,
+    spider: str,
+    job: str,
+    nodes: Optional[List[str]] = Query(None),
+    group: Optional[str] = None,
+    job_finished: bool = False
+):
+    """
+    Reports of a job on the selected nodes, gathered concurrently and summed up in totals,
+    e.g. /cluster/reports/demo/test/job?group=xxx
+    Each node is served from the report store, otherwise from the stats of the LogParser service,
+    otherwise by parsing its logfile, see log_stats() above.
+    """
+    start_time = time.time()
+    config = request.app.state.config
+    selected_nodes = get_selected_nodes(config, nodes, group)
+    store = get_report_store(request.app)
+    reports = dict((node, dict(report, source='store'))
+                   for node, report in (await asyncio.to_thread(store.get_many, project, spider, job,
+                                                                selected_nodes)).items())
+    semaphore = asyncio.Semaphore(config.get('SCRAPYD_FANOUT_CONCURRENCY', 20))
+
+    async def get_report(node):
+        async with semaphore:
+            try:
+                stats = await request_logparser_stats(get_scrapyd_client(request.app), config, node,
+                                                      project, spider, job)
+                if stats is not None:
+                    if is_finished(stats):
+                        await asyncio.to_thread(store.put, node, project, spider, job, stats)
+                    return node, dict(make_report(stats), source='logparser')
+                stats, __ = await parse_log_stats(request, node, project, spider, job, job_finished)
+                return node, dict(make_report(stats), source='log')
+            except HTTPException as err:
+                return node, dict(status='error', status_code=err.status_code, message=err.detail)
+            except LogNotFound as err:
+                return node, dict(status='error', status_code=404, message=str(err))
+            except Exception as err:
+                return node, dict(status='error', status_code=-1, message=str(err))
+
+    missing = [node for node in selected_nodes if node not in reports]
+    reports.update(await asyncio.gather(*[get_report(node) for node in missing]))
+    ok = [report for report in reports.values() if report.get('status') != 'error']
+    for report in ok:
+        report['status'] = 'ok'
+    return {"status": "ok", "project": project, "spider": spider, "job": job,
+            "nodes": dict((node, reports[node]) for node in selected_nodes),
+            "totals": merge_reports(ok), "ok": len(ok), "error": len(reports) - len(ok),
+            "elapsed": round(time.time() - start_time, 3)}
+
+
+async def build_deploy_egg(request: Request) -> Tuple[str, str, Dict[str, Any], str]:
+    """Return (project, version, egg info, egg path) for the form fields folder, project and version"""
+    form = await request.form()
+    project = clean_project_name(form.get('project'))
+    version = clean_version(form.get('version'))
+    project_dir = await asyncio.to_thread(get_project_index(request.app).get_cfg_dir, form.get('folder', ''))
+    if not project_dir:
+        raise HTTPException(status_code=404, detail="scrapy.cfg not found in folder %s of SCRAPY_PROJECTS_DIR"
+                                                    % form.get('folder', ''))
+    try:
+        egg = await get_egg_cache(request.app).get_egg(project_dir)
+    except BuildError as err:
+        raise HTTPException(status_code=400, detail=str(err))
+    return project, version, dict(key=egg['key'], hit=egg['hit'], size=egg['size']), egg['path']
+
+
+async def keep_artifact(request: Request, project: str, version: str, egg: str) -> Optional[Dict[str, Any]]:
+    """Keep the egg in the artifact store for redeploys, without failing the deploy if it cannot be kept"""
+    try:
+        return await asyncio.to_thread(get_artifact_store(request.app).put, project, version, egg)
+    except Exception as err:
+        logger.error("Fail to keep the egg of %s %s: %s", project, version, err)
+        return None
+
+
+async def record_deployment(request: Request, node: int, project: str, version: str,
+                            artifact: Optional[Dict[str, Any]], js: Dict[str, Any]):
+    if artifact is None or js.get('status') != 'ok':
+        return
+    try:
+        await asyncio.to_thread(get_artifact_store(request.app).record_deployment, node, project, version,
+                                artifact['digest'])
+    except Exception as err:
+        logger.error("Fail to record the deployment of %s %s to node %s: %s", project, version, node, err)
+
+
+@router.post("/{node:int}/deploy")
+async def deploy_project(request: Request, node: int):
+    """
+    Deploy a project in SCRAPY_PROJECTS_DIR, with the form fields folder, project and version.
+    The egg is reused from the egg cache if the project has not changed since it was built.
+    """
+    config = request.app.state.config
+    try:
+        get_scrapyd_server(config, node)
+    except IndexError:
+        raise HTTPException(status_code=404, detail="Node not found")
+    project, version, egg_info, egg = await build_deploy_egg(request)
+    artifact = await keep_artifact(request, project, version, egg)
+    try:
+        status_code, js = await add_version(get_scrapyd_client(request.app), config, node, project, version, egg)
+    finally:
+        get_api_cache(request.app).invalidate(node, project)
+    await record_deployment(request, node, project, version, artifact, js)
+    return JSONResponse(status_code=status_code, content=dict(js, project=project, version=version, egg=egg_info))
+
+
+async def build_upload_egg(request: Request, workdir: str) -> Tuple[str, str, Dict[str, Any], str]:
+    """
+    Return (project, version, egg info, egg path) for the form fields file, project and version,
+    where file is an egg saved in workdir, or a zip or tar archive of a project extracted in workdir then built.
+    """
+    config = request.app.state.config
+    form = await parse_upload(request, config.get('DEPLOY_UPLOAD_MAX_BYTES', DEFAULT_UPLOAD_MAX_BYTES))
+    try:
+        upload = get_upload_file(form)
+        extension = get_upload_extension(upload.filename)
+        # Named after the file uploaded by default, like scrapyd-deploy
+        project = clean_project_name(form.get('project') or os.path.basename(upload.filename)[:-len(extension)])
+        version = clean_version(form.get('version'))
+        if extension == '.egg':
+            egg_path = os.path.join(workdir, 'upload.egg')
+            size = await asyncio.to_thread(save_egg, upload.file, egg_path)
+            return project, version, dict(key=None, hit=False, size=size), egg_path
+        project_dir = os.path.join(workdir, 'project')
+        await asyncio.to_thread(extract_project, upload.file, project_dir,
+                                config.get('DEPLOY_EXTRACT_MAX_BYTES', DEFAULT_EXTRACT_MAX_BYTES))
+    finally:
+        await form.close()
+    egg = await get_egg_cache(request.app).get_egg(project_dir)
+    return project, version, dict(key=egg['key'], hit=egg['hit'], size=egg['size']), egg['path']
+
+
+@router.post("/{node:int}/deploy/upload")
+async def deploy_upload(request: Request, node: int):
+    """
+    Deploy an uploaded egg, or a zip or tar archive of a project which is built into an egg via the egg cache.
+    The upload is streamed to disk, see deploy_upload.py, and the egg is streamed from disk to Scrapyd,
+    so that the memory used does not grow with the size of the upload.
+    """
+    config = request.app.state.config
+    try:
+        get_scrapyd_server(config, node)
+    except IndexError:
+        raise HTTPException(status_code=404, detail="Node not found")
+    workdir = await asyncio.to_thread(tempfile.mkdtemp, prefix='scrapydash-upload-')
+    try:
+        try:
+            project, version, egg_info, egg_path = await build_upload_egg(request, workdir)
+        except UploadError as err:
+            raise HTTPException(status_code=err.status_code, detail=str(err))
+        except BuildError as err:
+            raise HTTPException(status_code=400, detail=str(err))
+        artifact = await keep_artifact(request, project, version, egg_path)
+        try:
+            status_code, js = await add_version(get_scrapyd_client(request.app), config, node, project, version,
+                                                egg_path)
+        finally:
+            get_api_cache(request.app).invalidate(node, project)
+        await record_deployment(request, node, project, version, artifact, js)
+    finally:
+        await asyncio.to_thread(shutil.rmtree, workdir, ignore_errors=True)
+    return JSONResponse(status_code=status_code, content=dict(js, project=project, version=version, egg=egg_info))
+
+
+def stream_deploy(request: Request, nodes: List[int], project: str, version: str, egg_info: Dict[str, Any],
+                  egg: str, artifact: Optional[Dict[str, Any]]) -> StreamingResponse:
+    """
+    Upload the egg to the nodes concurrently, retrying the nodes which are unreachable or answer 5xx
+    up to DEPLOY_RETRIES times, and stream the results as each node answers:
+    {"project": ..., "version": ..., "egg": {...}, "nodes": {"2": {...}, "1": {...}}, "ok": 2, "error": 0, ...}
+    """
+    config = request.app.state.config
+    cache = get_api_cache(request.app)
+
+    async def stream():
+        start_time = time.time()
+        counts = dict(ok=0, error=0)
+        results = deploy_to_nodes(get_scrapyd_client(request.app), config, nodes, project, version, egg,
+                                  concurrency=config.get('SCRAPYD_FANOUT_CONCURRENCY', 20),
+                                  retries=config.get('DEPLOY_RETRIES', DEFAULT_DEPLOY_RETRIES))
+        try:
+            yield '{"project": %s, "version": %s, "egg": %s, "nodes": {' % (
+                json.dumps(project), json.dumps(version), json.dumps(egg_info))
+            index = 0
+            async for node, status_code, js in results:
+                cache.invalidate(node, project)
+                await record_deployment(request, node, project, version, artifact, js)
+                counts['ok' if js.get('status') == 'ok' else 'error'] += 1
+                yield '%s"%s": %s' % (', ' if index else '', node, json.dumps(dict(js, status_code=status_code)))
+                index += 1
+            yield '}, "ok": %s, "error": %s, "elapsed": %.3f}' % (
+                counts['ok'], counts['error'], time.time() - start_time)
+        finally:
+            # In case the browser disconnects before all nodes answer
+            await results.aclose()
+
+    return StreamingResponse(stream(), media_type='application/json')
+
+
+@router.post("/cluster/deploy")
+async def cluster_deploy(
+    request: Request,
+    nodes: Optional[List[str]] = Query(None),
+    group: Optional[str] = None
+):
+    """
+    Deploy a project to the selected nodes concurrently, like deploy_project() above,
+    e.g. /cluster/deploy?group=xxx. The egg is built once and shared by all uploads,
+    and the results are streamed as each node answers, see stream_deploy().
+    """
+    selected_nodes = get_selected_nodes(request.app.state.config, nodes, group)
+    project, version, egg_info, egg = await build_deploy_egg(request)
+    artifact = await keep_artifact(request, project, version, egg)
+    return stream_deploy(request, selected_nodes, project, version, egg_info, egg, artifact)
+
+
+@router.post("/cluster/redeploy/{project}/{version}")
+async def cluster_redeploy(
+    request: Request,
+    project: str,
+    version: str,
+    nodes: Optional[List[str]] = Query(None),
+    group: Optional[str] = None,
+    as_version: Optional[str] = None
+):
+    """
+    Deploy a version kept in the artifact store again to the selected nodes, without a rebuild,
+    e.g. /cluster/redeploy/demo/v1?group=xxx. As Scrapyd runs the highest version of a project,
+    roll back to an older version by uploading its egg as a new version, e.g. ?as_version=v1-rollback,
+    which shares the blob of the original version.
+    """
+    selected_nodes = get_selected_nodes(request.app.state.config, nodes, group)
+    store = get_artifact_store(request.app)
+    artifact = await asyncio.to_thread(store.get, project, version)
+    if artifact is None:
+        raise HTTPException(status_code=404, detail="Egg of %s %s not found in the artifact store" % (project, version))
+    egg_info = dict(digest=artifact['digest'], size=artifact['size'], version=version)
+    if as_version:
+        version = clean_version(as_version)
+        artifact = await keep_artifact(request, project, version, artifact['path'])
+    return stream_deploy(request, selected_nodes, project, version, egg_info, store.get_path(egg_info['digest']),
+                         artifact)
+
+
+@router.get("/deploy/versions")
+async def deploy_versions(request: Request, project: Optional[str] = None):
+    """The versions kept in the artifact store, most recent first, with the nodes on which each one is current"""
+    versions = await asyncio.to_thread(get_artifact_store(request.app).list_versions, project)
+    return {"status": "ok", "versions": versions}
+
+
+@router.get("/deploy/drift")
+async def deploy_drift(
+    request: Request,
+    project: Optional[str] = None,
+    nodes: Optional[List[str]] = Query(None),
+    group: Optional[str] = None
+):
+    """
+    The version of each project on the selected nodes as recorded on deploys, see ArtifactStore.drift(),
+    instead of requesting listversions.json of every node.
+    """
+    selected_nodes = get_selected_nodes(request.app.state.config, nodes, group)
+    drift = await asyncio.to_thread(get_artifact_store(request.app).drift, selected_nodes, project)
+    return {"status": "ok", "projects": drift,
+            "drifted": sorted(name for name, v in drift.items() if v['behind'] or v['missing'])}
+
+
+@router.get("/deploy/projects")
+async def deploy_projects(request: Request):
+    """The projects in SCRAPY_PROJECTS_DIR from the project index, see project_index.py"""
+    index = get_project_index(request.app)
+    projects = await asyncio.to_thread(index.list_projects)
+    return {"status": "ok", "projects_dir": index.projects_dir, "projects": projects, "index": index.stats}
+
+
+@router.get("/deploy/cache")
+async def deploy_cache_stats(request: Request):
+    """Hits, misses, builds and size of the egg cache, see egg_cache.py"""
+    return {"status": "ok", **(await asyncio.to_thread(get_egg_cache(request.app).get_stats))}
+
+
+@router.get("/jobs/snapshot")
+async def jobs_snapshot_status(request: Request):
+    """
+    Freshness of the Job tables kept up to date by the jobs snapshot worker:
+    last sync time, duration and result of each node.
+    """
+    return {"status": "ok", **get_jobs_snapshot_worker(request.app).get_freshness()}
+
+
+def keyset_response(query, name: str, sort_key, cursor: Optional[str], limit: int,
+                    process_rows=None) -> Dict[str, Any]:
+    try:
+        rows, next_cursor = paginate_keyset(query, name, sort_key, cursor, limit)
+    except InvalidCursor as err:
+        raise HTTPException(status_code=400, detail=str(err))
+    items = [row_to_dict(row) for row in rows]
+    if process_rows is not None:
+        process_rows(rows, items)
+    return {"status": "ok", "items": items, "next_cursor": next_cursor, "limit": limit}
+
+
+@router.get("/{node:int}/jobs")
+def list_jobs(
+    request: Request,
+    node: int,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    session: Session = Depends(get_session)
+):
+    """
+    Jobs of a node from its Job table, in the order of the Jobs page: pending, running, then finished.
+    Pass next_cursor of the response as cursor to get the next page.
+    """
+    try:
+        get_scrapyd_server(request.app.state.config, node)
+    except IndexError:
+        raise HTTPException(status_code=404, detail="Node not found")
+    ensure_table(Job.__table__, session.get_bind(Job))
+    sort_key = [(Job.status, False), (Job.finish, True), (Job.start, False), (Job.id, False)]
+    query = session.query(Job).filter(Job.node == node, Job.deleted == NOT_DELETED)
+    return keyset_response(query, 'jobs', sort_key, cursor, limit)
+
+
+@router.get("/jobs/search")
+def search_jobs(
+    request: Request,
+    project: Optional[str] = None,
+    spider: Optional[str] = None,
+    status: Optional[List[str]] = Query(None),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    time_field: str = 'finish',
+    max_items: Optional[int] = Query(None, ge=0),
+    sort: str = 'id',
+    nodes: Optional[List[str]] = Query(None),
+    group: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    session: Session = Depends(get_session)
+):
+    """
+    Search the jobs of all nodes, or of the selected nodes, e.g.
+    finished jobs of the last hour which scraped nothing: ?status=finished&since=2026-01-01T08:00:00&max_items=0
+    longest-running jobs right now: ?status=running&sort=start
+    status: pending, running, finished or 0, 1, 2; since and until apply to time_field (start or finish);
+    sort: id (newest first), finish (latest finished first) or start (earliest started first).
+    """
+    selected_nodes = None
+    if nodes or group is not None:
+        selected_nodes = get_selected_nodes(request.app.state.config, nodes, group)
+    ensure_table(Job.__table__, session.get_bind(Job))
+    try:
+        query, sort_key = search_jobs_query(session, selected_nodes, project, spider, parse_statuses(status),
+                                            since, until, time_field, max_items, sort)
+    except ValueError as err:
+        raise HTTPException(status_code=400, detail=str(err))
+    return keyset_response(query, 'jobs_search_%s' % sort, sort_key, cursor, limit)
+
+
+@router.get("/jobs/stats")
+def job_stats(
+    request: Request,
+    group_by: Optional[List[str]] = Query(None),
+    project: Optional[str] = None,
+    spider: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    order_by: Optional[str] = None,
+    nodes: Optional[List[str]] = Query(None),
+    group: Optional[str] = None,
+    limit: int = Query(1000, ge=1, le=10000),
+    session: Session = Depends(get_session)
+):
+    """
+    Totals of the finished jobs from the hourly rollups, e.g. items per spider per day:
+    ?group_by=spider&group_by=day&since=2026-01-01
+    group_by: node, project, spider, hour or day; order_by: jobs, pages, items, runtime or max_runtime.
+    Each group has jobs, pages, items, runtime (total seconds) and max_runtime.
+    """
+    selected_nodes = None
+    if nodes or group is not None:
+        selected_nodes = get_selected_nodes(request.app.state.config, nodes, group)
+    group_by = [name.strip() for value in group_by or [] for name in value.split(',') if name.strip()]
+    ensure_table(JobRollup.__table__, session.get_bind(JobRollup))
+    try:
+        items = aggregate_jobs(session, group_by, selected_nodes, project, spider, since, until, order_by, limit)
+    except ValueError as err:
+        raise HTTPException(status_code=400, detail=str(err))
+    return {"status": "ok", "group_by": group_by, "items": items}
+
+
+def ensure_task_tables(session: Session):
+    for model in (Task, TaskResult, TaskJobResult):
+        ensure_table(model.__table__, session.get_bind(model))
+
+
+@router.get("/tasks")
+def list_tasks(
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    session: Session = Depends(get_session),
+    scheduler=Depends(get_task_scheduler)
+):
+    """Timer tasks, newest first, each with the summary of its results and its next run time"""
+    ensure_task_tables(session)
+
+    def add_summary(tasks, items):
+        summaries = summarize_tasks(session, tasks, scheduler)
+        for item in items:
+            item['summary'] = summaries[item['id']]
+
+    return keyset_response(session.query(Task), 'tasks', [(Task.id, True)], cursor, limit, add_summary)
+
+
+@router.get("/tasks/{task_id:int}/results")
+def list_task_results(
+    task_id: int,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    session: Session = Depends(get_session)
+):
+    """Results of a timer task, newest first"""
+    ensure_task_tables(session)
+    query = session.query(TaskResult).filter(TaskResult.task_id == task_id)
+    return keyset_response(query, 'task_results', [(TaskResult.id, True)], cursor, limit)
+
+
+@router.get("/tasks/{task_id:int}/results/{task_result_id:int}/jobs")
+def list_task_job_results(
+    task_id: int,
+    task_result_id: int,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    session: Session = Depends(get_session)
+):
+    """Results of each node in a run of a timer task, ordered by node"""
+    ensure_task_tables(session)
+    if not session.query(TaskResult.id).filter_by(id=task_result_id, task_id=task_id).first():
+        raise HTTPException(status_code=404, detail="Task result not found")
+    query = session.query(TaskJobResult).filter(TaskJobResult.task_result_id == task_result_id)
+    sort_key = [(TaskJobResult.node, False), (TaskJobResult.id, False)]
+    return keyset_response(query, 'task_job_results', sort_key, cursor, limit)
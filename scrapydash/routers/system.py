@@ -12,10 +12,9 @@ from fastapi.responses import HTMLResponse, JSONResponse
 from sqlalchemy.orm import Session
 
 from ..database import get_db
-from ..models import Metadata
 from ..common import handle_metadata
 from ..__version__ import __version__
-from ..vars import PYTHON_VERSION, SCRAPY_VERSION, SCRAPYD_VERSION
+from .. import vars  # SCRAPY_VERSION and SCRAPYD_VERSION import scrapy on first access, see vars.__getattr__()
 
 router = APIRouter()
 
@@ -50,6 +49,7 @@ async def settings_view(
     templates = request.app.state.templates
     config = request.app.state.config
     template_context = request.app.state.template_context()
+    metadata = handle_metadata()
     
     # Get all configuration categories
     settings_categories = {
@@ -74,10 +74,10 @@ async def settings_view(
         },
         'LogParser': {
             'ENABLE_LOGPARSER': config.get('ENABLE_LOGPARSER', False),
-            'LOGPARSER_PID': handle_metadata().get('logparser_pid'),
+            'LOGPARSER_PID': metadata.get('logparser_pid'),
         },
         'Timer Tasks': {
-            'SCHEDULER_STATE': handle_metadata().get('scheduler_state', 1),
+            'SCHEDULER_STATE': metadata.get('scheduler_state', 1),
             'JOBS_TO_KEEP': config.get('JOBS_TO_KEEP', 100),
             'LOGS_TO_KEEP': config.get('LOGS_TO_KEEP', 100),
         },
@@ -104,9 +104,9 @@ async def settings_view(
         "node": node,
         "settings_categories": settings_categories,
         "scrapydash_version": __version__,
-        "python_version": PYTHON_VERSION,
-        "scrapy_version": SCRAPY_VERSION,
-        "scrapyd_version": SCRAPYD_VERSION,
+        "python_version": vars.PYTHON_VERSION,
+        "scrapy_version": vars.SCRAPY_VERSION,
+        "scrapyd_version": vars.SCRAPYD_VERSION,
         "platform_info": platform.platform(),
         **template_context
     }
@@ -122,14 +122,15 @@ async def system_info(
 ):
     """System information API endpoint"""
     config = request.app.state.config
+    metadata = handle_metadata()
     
     return {
         "system": {
             "platform": platform.platform(),
-            "python_version": PYTHON_VERSION,
+            "python_version": vars.PYTHON_VERSION,
             "scrapydash_version": __version__,
-            "scrapy_version": SCRAPY_VERSION,
-            "scrapyd_version": SCRAPYD_VERSION,
+            "scrapy_version": vars.SCRAPY_VERSION,
+            "scrapyd_version": vars.SCRAPYD_VERSION,
         },
         "configuration": {
             "scrapyd_servers": config.get('SCRAPYD_SERVERS', []),
@@ -138,9 +139,9 @@ async def system_info(
             "debug_mode": config.get('DEBUG', False),
         },
         "process": {
-            "main_pid": handle_metadata().get('main_pid'),
-            "logparser_pid": handle_metadata().get('logparser_pid'),
-            "scheduler_state": handle_metadata().get('scheduler_state', 1),
+            "main_pid": metadata.get('main_pid'),
+            "logparser_pid": metadata.get('logparser_pid'),
+            "scheduler_state": metadata.get('scheduler_state', 1),
         }
     }
 
@@ -148,23 +149,22 @@ async def system_info(
 @router.get("/metadata")
 async def metadata_view(
     request: Request,
-    node: int = 1,
-    db: Session = Depends(get_db)
+    node: int = 1
 ):
     """System metadata endpoint"""
-    metadata_record = db.query(Metadata).filter_by(version=__version__).first()
+    metadata = handle_metadata()
     
-    if not metadata_record:
+    if not metadata:
         return {"error": "Metadata not found"}
     
     return {
-        "version": metadata_record.version,
-        "main_pid": metadata_record.main_pid,
-        "logparser_pid": metadata_record.logparser_pid,
-        "poll_pid": metadata_record.poll_pid,
-        "pageview": metadata_record.pageview,
-        "scheduler_state": metadata_record.scheduler_state,
-        "last_check_update": metadata_record.last_check_update_timestamp,
+        "version": metadata.get('version'),
+        "main_pid": metadata.get('main_pid'),
+        "logparser_pid": metadata.get('logparser_pid'),
+        "poll_pid": metadata.get('poll_pid'),
+        "pageview": metadata.get('pageview'),
+        "scheduler_state": metadata.get('scheduler_state'),
+        "last_check_update": metadata.get('last_check_update_timestamp'),
     }
 
 @router.get("/health")
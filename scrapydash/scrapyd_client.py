@@ -0,0 +1,105 @@
+# coding: utf-8
+"""
+Async HTTP client module for talking to Scrapyd servers
+"""
+import logging
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SCRAPYD_SERVER = '127.0.0.1:6800'
+
+
+def parse_scrapyd_server(server: str, auth=None) -> Tuple[str, Optional[Tuple[str, str]]]:
+    """Split 'username:password@ip:port' into a base url and an auth tuple"""
+    if '@' in server:
+        auth_part, server = server.split('@', 1)
+        if ':' in auth_part:
+            username, password = auth_part.split(':', 1)
+            auth = (username, password)
+    # json.loads(json.dumps({'auth':(1,2)})) => {'auth': [1, 2]}
+    auth = tuple(auth) if auth else None
+    if '://' not in server:
+        server = 'http://%s' % server
+    return server.rstrip('/'), auth
+
+
+def get_scrapyd_server(config: Dict[str, Any], node: int) -> Tuple[str, Optional[Tuple[str, str]]]:
+    """Return (base_url, auth) of the Scrapyd server for the given node, starting from 1"""
+    scrapyd_servers = config.get('SCRAPYD_SERVERS', []) or [DEFAULT_SCRAPYD_SERVER]
+    if node < 1 or node > len(scrapyd_servers):
+        raise IndexError('node index error: %s, which should be between 1 and %s' % (node, len(scrapyd_servers)))
+    auths = config.get('SCRAPYD_SERVERS_AUTHS', []) or []
+    auth = auths[node - 1] if node <= len(auths) else None
+    return parse_scrapyd_server(scrapyd_servers[node - 1], auth)
+
+
+class ScrapydClient:
+    """
+    Long-lived async client with one connection pool per Scrapyd server,
+    so that a slow node can only exhaust its own connections.
+    """
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None, transport=None):
+        config = config or {}
+        self.transport = transport  # For test only
+        self.timeout = httpx.Timeout(
+            config.get('SCRAPYD_READ_TIMEOUT', 30),
+            connect=config.get('SCRAPYD_CONNECT_TIMEOUT', 5),
+        )
+        self.limits = httpx.Limits(
+            max_connections=config.get('SCRAPYD_MAX_CONNECTIONS_PER_NODE', 20),
+            max_keepalive_connections=config.get('SCRAPYD_MAX_KEEPALIVE_PER_NODE', 10),
+            keepalive_expiry=config.get('SCRAPYD_KEEPALIVE_EXPIRY', 60),
+        )
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self.closed = False
+
+    def get_client(self, url: str) -> httpx.AsyncClient:
+        """Return the pooled client for the origin of url, creating it on first use"""
+        parts = urlsplit(url)
+        origin = '%s://%s' % (parts.scheme, parts.netloc)
+        client = self._clients.get(origin)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(timeout=self.timeout, limits=self.limits, transport=self.transport)
+            self._clients[origin] = client
+            logger.debug("Created connection pool for %s", origin)
+        return client
+
+    async def request(self, method: str, url: str, auth=None, **kwargs) -> httpx.Response:
+        """Send a request via the pool of the target node; httpx.HTTPError is left to the caller"""
+        client = self.get_client(url)
+        return await client.request(method, url, auth=tuple(auth) if auth else None, **kwargs)
+
+    async def get(self, url: str, auth=None, **kwargs) -> httpx.Response:
+        return await self.request('GET', url, auth=auth, **kwargs)
+
+    async def post(self, url: str, auth=None, **kwargs) -> httpx.Response:
+        return await self.request('POST', url, auth=auth, **kwargs)
+
+    def stream(self, method: str, url: str, auth=None, **kwargs):
+        """Like request(), as an async context manager whose response body is read in chunks"""
+        client = self.get_client(url)
+        return client.stream(method, url, auth=tuple(auth) if auth else None, **kwargs)
+
+    async def aclose(self):
+        """Close all connection pools"""
+        for origin, client in list(self._clients.items()):
+            try:
+                await client.aclose()
+            except Exception as err:
+                logger.warning("Error closing connection pool for %s: %s", origin, err)
+        self._clients.clear()
+        self.closed = True
+
+
+def get_scrapyd_client(app) -> ScrapydClient:
+    """Return the client created in lifespan, or a fresh one if lifespan has not run (e.g. in tests)"""
+    client = getattr(app.state, 'scrapyd_client', None)
+    if client is None or client.closed:
+        client = ScrapydClient(getattr(app.state, 'config', None))
+        app.state.scrapyd_client = client
+    return client
@@ -0,0 +1,74 @@
+# coding: utf-8
+"""
+Task dispatch module for posting timer tasks to Scrapyd schedule.json directly,
+instead of calling back into the schedule.task view of ScrapydWeb over HTTP.
+"""
+import json
+import logging
+from typing import Any, Dict, Optional, Tuple
+
+from .scrapyd_client import ScrapydClient, get_scrapyd_server
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LATEST_VERSION = 'default: the latest version'
+
+
+def build_schedule_payload(task) -> Dict[str, Any]:
+    """
+    Return the form data of schedule.json for a Task, without jobid.
+    'settings_arguments': {'arg1': '233', 'setting': ['CLOSESPIDER_PAGECOUNT=10']}
+    A list value is sent as a repeated field, e.g. setting=A=1&setting=B=2
+    """
+    payload = dict(project=task.project)
+    if task.version != DEFAULT_LATEST_VERSION:
+        payload['_version'] = task.version
+    payload['spider'] = task.spider
+    payload.update(json.loads(task.settings_arguments or '{}'))
+    return payload
+
+
+class TaskDispatcher:
+    """
+    Fire timer tasks via the pooled ScrapydClient of the app.
+    The payload of each task is built once and cached until the task is updated.
+    """
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None, scrapyd_client: Optional[ScrapydClient] = None):
+        self.config = config or {}
+        self.own_client = scrapyd_client is None
+        self.scrapyd_client = scrapyd_client or ScrapydClient(self.config)
+        # {task_id: (update_time, payload)}
+        self.payloads: Dict[int, Tuple[Any, Dict[str, Any]]] = {}
+
+    def get_payload(self, task) -> Dict[str, Any]:
+        cached = self.payloads.get(task.id)
+        if cached is not None and cached[0] == task.update_time:
+            return cached[1]
+        payload = build_schedule_payload(task)
+        self.payloads[task.id] = (task.update_time, payload)
+        logger.debug("Built schedule payload of task #%s: %s", task.id, payload)
+        return payload
+
+    def invalidate(self, task_id: Optional[int] = None):
+        if task_id is None:
+            self.payloads.clear()
+        else:
+            self.payloads.pop(task_id, None)
+
+    def get_schedule_url(self, node: int) -> Tuple[str, Optional[Tuple[str, str]]]:
+        base_url, auth = get_scrapyd_server(self.config, node)
+        return '%s/schedule.json' % base_url, auth
+
+    async def dispatch(self, node: int, payload: Dict[str, Any], jobid: str) -> Dict[str, Any]:
+        """Post to schedule.json of the node and return its JSON along with url and status_code"""
+        url, auth = self.get_schedule_url(node)
+        r = await self.scrapyd_client.post(url, auth=auth, data=dict(payload, jobid=jobid))
+        js = r.json()
+        js.update(url=url, status_code=r.status_code)
+        return js
+
+    async def aclose(self):
+        """Close the client only if it is not shared with the app"""
+        if self.own_client:
+            await self.scrapyd_client.aclose()
@@ -0,0 +1,214 @@
+# coding: utf-8
+"""
+Task executor module for firing timer tasks on all selected nodes concurrently
+"""
+import asyncio
+import json
+import logging
+import re
+import traceback
+from typing import Any, Dict, List, Optional
+
+from .common import get_now_string
+from .models import Task, TaskJobResult, TaskResult, db
+from .scrapyd_client import ScrapydClient
+from .task_dispatch import TaskDispatcher
+
+logger = logging.getLogger(__name__)
+apscheduler_logger = logging.getLogger('apscheduler')
+
+EXTRACT_URL_SERVER_PATTERN = re.compile(r'//(.+?:\d+)')
+
+
+class TaskRunner:
+    """
+    The event loop and the dispatcher of the app, attached in lifespan,
+    so that the threads of APScheduler can hand timer tasks over to the loop and wait for them.
+    """
+
+    def __init__(self):
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.dispatcher: Optional[TaskDispatcher] = None
+        self.config: Dict[str, Any] = {}
+
+    def attach(self, loop: asyncio.AbstractEventLoop, scrapyd_client: ScrapydClient, config: Dict[str, Any]):
+        self.loop = loop
+        self.dispatcher = TaskDispatcher(config, scrapyd_client)
+        self.config = config
+
+    def detach(self):
+        self.loop = None
+        self.dispatcher = None
+
+    def new_dispatcher(self) -> TaskDispatcher:
+        """A dispatcher with a client of its own, built from the config of the app, to be closed by the caller"""
+        if not self.config.get('SCRAPYD_SERVERS'):
+            raise RuntimeError("No SCRAPYD_SERVERS to fire timer tasks on, the app has not been attached yet")
+        return TaskDispatcher(self.config)
+
+    def run(self, coro):
+        """
+        Run coro in the loop of the app, or in a new loop of the calling thread if detached, and wait for it.
+        Never to be called from the loop of the app itself.
+        """
+        if self.loop is not None and self.loop.is_running():
+            return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+        return asyncio.run(coro)
+
+
+task_runner = TaskRunner()
+
+
+class TaskExecutor:
+    """
+    Schedule a timer task on all selected nodes at once, retry the failed nodes with exponential backoff
+    via asyncio.sleep(), then save all TaskJobResult rows and the TaskResult counts in one transaction.
+    """
+    max_retries = 2
+    sleep_seconds_before_retry = 3  # Doubled after each retry
+
+    def __init__(self, task_id: int, task_name: Optional[str], selected_nodes: List[int], payload: Dict[str, Any],
+                 dispatcher: Optional[TaskDispatcher] = None, session_factory=None):
+        self.task_id = task_id
+        self.task_name = task_name
+        self.selected_nodes = selected_nodes
+        self.payload = payload  # See build_schedule_payload()
+        self.own_dispatcher = dispatcher is None
+        self.dispatcher = dispatcher or task_runner.new_dispatcher()
+        self.session_factory = session_factory or db.Session
+        self.jobid = 'task_%s_%s' % (task_id, get_now_string(allow_space=False))
+        self.task_result_id = None  # Be set in create_task_result()
+        self.pass_count = 0
+        self.fail_count = 0
+
+    async def main(self):
+        self.task_result_id = await asyncio.to_thread(self.create_task_result)
+        try:
+            results = await asyncio.gather(*[self.schedule_task_with_retries(node) for node in self.selected_nodes])
+        finally:
+            if self.own_dispatcher:
+                await self.dispatcher.aclose()
+        for js in results:
+            if js['status'] == 'ok':
+                self.pass_count += 1
+            else:
+                self.fail_count += 1
+        await asyncio.to_thread(self.save_results, results)
+        return results
+
+    def create_task_result(self) -> int:
+        session = self.session_factory()
+        try:
+            task_result = TaskResult(task_id=self.task_id)
+            session.add(task_result)
+            session.commit()
+            logger.debug("Get new task_result_id %s for task #%s", task_result.id, self.task_id)
+            return task_result.id
+        finally:
+            session.close()
+
+    async def schedule_task_with_retries(self, node: int) -> Dict[str, Any]:
+        delay = self.sleep_seconds_before_retry
+        for attempt in range(self.max_retries + 1):
+            js = {}
+            try:
+                js = await self.dispatcher.dispatch(node, self.payload, self.jobid)
+                assert js.get('status_code') == 200 and js.get('status') == 'ok', "Request got %s" % js
+            except Exception as err:
+                if attempt < self.max_retries:
+                    apscheduler_logger.warning("Fail to execute task #%s (%s) on node %s, would retry in %ss: %s",
+                                               self.task_id, self.task_name, node, delay, err)
+                    await asyncio.sleep(delay)
+                    delay *= 2
+                    continue
+                apscheduler_logger.error("Fail to execute task #%s (%s) on node %s, no more retries: %s",
+                                         self.task_id, self.task_name, node, traceback.format_exc())
+                try:
+                    js.setdefault('url', self.dispatcher.get_schedule_url(node)[0])
+                except IndexError:
+                    js.setdefault('url', '')
+                js.setdefault('status_code', -1)
+                js.setdefault('status', 'exception')
+                js.setdefault('exception', traceback.format_exc())
+            js.update(node=node)
+            return js
+
+    def save_results(self, results: List[Dict[str, Any]]):
+        """Insert all TaskJobResult rows and update the TaskResult in one transaction"""
+        session = self.session_factory()
+        try:
+            task = session.get(Task, self.task_id)
+            task_result = session.get(TaskResult, self.task_result_id)
+            if not task:
+                apscheduler_logger.error("Task #%s not found", self.task_id)
+                if task_result:
+                    session.delete(task_result)
+                    session.commit()
+                apscheduler_logger.warning("Deleted task_result #%s [FAIL %s, PASS %s] of task #%s",
+                                           self.task_result_id, self.fail_count, self.pass_count, self.task_id)
+                return
+            if not task_result:
+                apscheduler_logger.error("task_result #%s of task #%s not found", self.task_result_id, self.task_id)
+                apscheduler_logger.warning("Discard task_job_results of task_result #%s of task #%s: %s",
+                                           self.task_result_id, self.task_id, results)
+                return
+            task_job_results = []
+            for js in results:
+                m = re.search(EXTRACT_URL_SERVER_PATTERN, js.get('url', ''))
+                task_job_results.append(TaskJobResult(
+                    task_result_id=self.task_result_id,
+                    node=js['node'],
+                    server=m.group(1) if m else js.get('url', ''),  # '127.0.0.1:6800'
+                    status_code=js['status_code'],
+                    status=js['status'],
+                    result=js.get('jobid', '') or js.get('message', '') or js.get('exception', ''),
+                ))
+            session.add_all(task_job_results)
+            task_result.fail_count = self.fail_count
+            task_result.pass_count = self.pass_count
+            session.commit()
+            logger.info("Inserted %s task_job_results of task_result #%s [FAIL %s, PASS %s] of task #%s",
+                        len(task_job_results), self.task_result_id, self.fail_count, self.pass_count, self.task_id)
+        finally:
+            session.close()
+
+
+def execute_task(task_id):
+    """The func of the apscheduler_job of a timer task, run in a thread of the scheduler"""
+    # The same dispatcher builds the payload and fires the task, a temporary one if the app is detached
+    dispatcher = task_runner.dispatcher
+    own_dispatcher = dispatcher is None
+    session = db.Session()
+    try:
+        task = session.get(Task, task_id)
+        if not task:
+            from .utils.scheduler import scheduler
+            apscheduler_job = scheduler.get_job(str(task_id))
+            if apscheduler_job:
+                apscheduler_job.remove()
+            apscheduler_logger.error("apscheduler_job #{id} removed since task #{id} not exist. ".format(id=task_id))
+            return
+        task_name, selected_nodes = task.name, json.loads(task.selected_nodes)
+        if own_dispatcher:
+            dispatcher = task_runner.new_dispatcher()
+        payload = dispatcher.get_payload(task)
+    finally:
+        session.close()
+    task_executor = TaskExecutor(task_id=task_id,
+                                 task_name=task_name,
+                                 selected_nodes=selected_nodes,
+                                 payload=payload,
+                                 dispatcher=dispatcher)
+
+    async def run():
+        try:
+            await task_executor.main()
+        except Exception:
+            apscheduler_logger.error(traceback.format_exc())
+        finally:
+            if own_dispatcher:
+                await dispatcher.aclose()
+
+    # Share the pooled client in the loop of the app, yet wait for the whole fan-out, retries included,
+    # so that max_instances and coalesce of the apscheduler_job still prevent overlapping runs
+    return task_runner.run(run())
@@ -0,0 +1,101 @@
+# coding: utf-8
+"""
+Task summary module: run_times, fail_times, previous run result and next run time
+of a page of timer tasks, with one aggregate query instead of several queries per task.
+"""
+import logging
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import case, func
+
+from .models import TaskJobResult, TaskResult
+
+logger = logging.getLogger(__name__)
+
+TASK_STATUS_RUNNING = 'Running'
+TASK_STATUS_PAUSED = 'Paused'
+TASK_STATUS_FINISHED = 'Finished'
+
+
+def query_task_results_summary(session, task_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+    """
+    One query: per task, the number of runs and failed runs, the latest TaskResult
+    and the latest TaskJobResult of the latest TaskResult.
+    """
+    if not task_ids:
+        return {}
+    aggregate = session.query(
+        TaskResult.task_id.label('task_id'),
+        func.count(TaskResult.id).label('run_times'),
+        func.sum(case((TaskResult.fail_count > 0, 1), else_=0)).label('fail_times'),
+        func.max(TaskResult.id).label('latest_id'),
+    ).filter(TaskResult.task_id.in_(task_ids)).group_by(TaskResult.task_id).subquery()
+    latest_job_result = session.query(
+        TaskJobResult.task_result_id.label('task_result_id'),
+        func.max(TaskJobResult.id).label('latest_job_result_id'),
+    ).filter(TaskJobResult.task_result_id.in_(session.query(aggregate.c.latest_id))).group_by(
+        TaskJobResult.task_result_id).subquery()
+    rows = session.query(
+        aggregate.c.task_id, aggregate.c.run_times, aggregate.c.fail_times,
+        TaskResult.id, TaskResult.fail_count, TaskResult.pass_count, TaskResult.execute_time,
+        TaskJobResult.node, TaskJobResult.result,
+    ).join(TaskResult, TaskResult.id == aggregate.c.latest_id).outerjoin(
+        latest_job_result, latest_job_result.c.task_result_id == TaskResult.id).outerjoin(
+        TaskJobResult, TaskJobResult.id == latest_job_result.c.latest_job_result_id).all()
+
+    summaries = {}
+    for (task_id, run_times, fail_times, task_result_id, fail_count, pass_count, execute_time,
+         node, result) in rows:
+        summary = dict(run_times=run_times, fail_times=int(fail_times or 0), latest_task_result_id=task_result_id,
+                       prev_run_time=str(execute_time), prev_run_node=None, prev_run_job=None)
+        if fail_count == 0 and pass_count == 1 and result is not None:
+            summary['prev_run_result'] = result[-19:]  # task_N_2019-01-01T00_00_01
+            summary['prev_run_node'] = node
+            summary['prev_run_job'] = result
+        else:
+            # 'FAIL 0, PASS 0' if execute_task() has not finished
+            summary['prev_run_result'] = 'FAIL %s, PASS %s' % (fail_count, pass_count)
+        summaries[task_id] = summary
+    return summaries
+
+
+def get_apscheduler_jobs(scheduler) -> Dict[str, Any]:
+    """All jobs of the default jobstore in one call, instead of scheduler.get_job() per task"""
+    if scheduler is None:
+        return {}
+    try:
+        return dict((job.id, job) for job in scheduler.get_jobs(jobstore='default'))
+    except Exception as err:
+        logger.error("Fail to get jobs of the scheduler: %s", err)
+        return {}
+
+
+def summarize_tasks(session, tasks: List[Any], scheduler=None) -> Dict[int, Dict[str, Any]]:
+    """Return {task_id: summary} for a page of Task instances"""
+    results = query_task_results_summary(session, [task.id for task in tasks])
+    apscheduler_jobs = get_apscheduler_jobs(scheduler)
+    summaries = {}
+    for task in tasks:
+        summary = dict(run_times=0, fail_times=0, latest_task_result_id=None, prev_run_time=None,
+                       prev_run_result=None, prev_run_node=None, prev_run_job=None)
+        summary.update(results.get(task.id, {}))
+        apscheduler_job = apscheduler_jobs.get(str(task.id))  # type(job.id): str
+        if apscheduler_job is None:
+            summary.update(status=TASK_STATUS_FINISHED, next_run_time=None)
+        elif apscheduler_job.next_run_time:
+            # '2019-01-01 00:00:01+08:00'
+            summary.update(status=TASK_STATUS_RUNNING, next_run_time=str(apscheduler_job.next_run_time))
+        else:
+            summary.update(status=TASK_STATUS_PAUSED, next_run_time=None)
+        summaries[task.id] = summary
+    return summaries
+
+
+def get_task_scheduler() -> Optional[Any]:
+    """The scheduler for timer tasks, imported lazily as it is started on import"""
+    try:
+        from .utils.scheduler import scheduler
+    except Exception as err:
+        logger.error("Fail to load the scheduler for timer tasks: %s", err)
+        return None
+    return scheduler
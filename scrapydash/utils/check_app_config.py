@@ -5,13 +5,11 @@ import os
 import re
 
 from ..common import handle_metadata, handle_slash, json_dumps, session
-from ..models import create_jobs_table, db
 from ..utils.scheduler import scheduler
 from ..utils.setup_database import test_database_url_pattern
 from ..vars import (ALLOWED_SCRAPYD_LOG_EXTENSIONS, ALERT_TRIGGER_KEYS,
                     SCHEDULER_STATE_DICT, STATE_PAUSED, STATE_RUNNING,
-                    SCHEDULE_ADDITIONAL, STRICT_NAME_PATTERN, UA_DICT,
-                    jobs_table_map)
+                    SCHEDULE_ADDITIONAL, UA_DICT)
 from .send_email import send_email
 from .sub_process import init_logparser, init_poll
 
@@ -102,17 +100,28 @@ def check_app_config(config):
     if SCRAPY_PROJECTS_DIR:
         assert os.path.isdir(SCRAPY_PROJECTS_DIR), "SCRAPY_PROJECTS_DIR not found: %s" % SCRAPY_PROJECTS_DIR
         logger.info("Setting up SCRAPY_PROJECTS_DIR: %s", handle_slash(SCRAPY_PROJECTS_DIR))
+    check_assert('PROJECT_INDEX_REFRESH_INTERVAL', 5, int)
+    check_assert('EGG_CACHE_MAX_BYTES', 256 * 1024 * 1024, int)
+    check_assert('EGG_CACHE_MAX_AGE', 30, int)
+    check_assert('DEPLOY_RETRIES', 2, int)
+    check_assert('DEPLOY_UPLOAD_MAX_BYTES', 100 * 1024 * 1024, int)
+    check_assert('DEPLOY_EXTRACT_MAX_BYTES', 500 * 1024 * 1024, int)
+    check_assert('ARTIFACTS_MAX_VERSIONS', 20, int)
 
     # Scrapyd
     check_assert('CHECK_SCRAPYD_SERVERS', True, bool)
     check_scrapyd_servers(config)
-    # For JobsView
-    for node, scrapyd_server in enumerate(config['SCRAPYD_SERVERS'], 1):
-        # Note that check_app_config() is executed multiple times in test
-        if node not in jobs_table_map:
-            jobs_table_map[node] = create_jobs_table(re.sub(STRICT_NAME_PATTERN, '_', scrapyd_server))
-    db.create_all(bind='jobs')
-    logger.debug("Created %s tables for JobsView", len(jobs_table_map))
+    check_assert('SCRAPYD_CONNECT_TIMEOUT', 5, int, allow_zero=False)
+    check_assert('SCRAPYD_READ_TIMEOUT', 30, int, allow_zero=False)
+    check_assert('SCRAPYD_MAX_CONNECTIONS_PER_NODE', 20, int, allow_zero=False)
+    check_assert('SCRAPYD_MAX_KEEPALIVE_PER_NODE', 10, int)
+    check_assert('SCRAPYD_FANOUT_CONCURRENCY', 20, int, allow_zero=False)
+    check_assert('SCRAPYD_API_CACHE_TTL', {}, dict)
+    assert all([isinstance(v, int) and not isinstance(v, bool) and v >= 0
+                for v in config['SCRAPYD_API_CACHE_TTL'].values()]), \
+        "Values of SCRAPYD_API_CACHE_TTL should be non-negative integers. Current value: %s" % (
+        config['SCRAPYD_API_CACHE_TTL'])
+    check_assert('SCRAPYD_API_CACHE_MAX_BYTES', 8 * 1024 * 1024, int)
 
     check_assert('LOCAL_SCRAPYD_LOGS_DIR', '', str)
     check_assert('LOCAL_SCRAPYD_SERVER', '', str)
@@ -148,6 +157,8 @@ def check_app_config(config):
         ("SCRAPYD_LOG_EXTENSIONS should be a list like %s. "
          "Current value: %s" % (ALLOWED_SCRAPYD_LOG_EXTENSIONS, SCRAPYD_LOG_EXTENSIONS))
     logger.info("Locating scrapy logfiles with SCRAPYD_LOG_EXTENSIONS: %s", SCRAPYD_LOG_EXTENSIONS)
+    check_assert('LOG_FOLLOW_INTERVAL', 2, int, allow_zero=False)
+    check_assert('LOG_FOLLOW_TIMEOUT', 3600, int)
 
     # LogParser
     check_assert('ENABLE_LOGPARSER', False, bool)
@@ -158,6 +169,8 @@ def check_app_config(config):
              "on the current ScrapydWeb host.\nNote that you can run the LogParser service separately "
              "via command 'logparser' as you like. ")
     check_assert('BACKUP_STATS_JSON_FILE', True, bool)
+    check_assert('STATS_REPORTS_LIMIT', 10000, int)
+    check_assert('STATS_REPORTS_MAX_AGE', 90, int)
 
     # Run Spider
     check_assert('SCHEDULE_EXPAND_SETTINGS_ARGUMENTS', False, bool)
@@ -226,7 +239,8 @@ def check_app_config(config):
     check_assert('ENABLE_MONITOR', False, bool)
     if config.get('ENABLE_MONITOR', False):
         check_assert('POLL_ROUND_INTERVAL', 300, int, allow_zero=False)
-        check_assert('POLL_REQUEST_INTERVAL', 10, int, allow_zero=False)
+        check_assert('POLL_REQUEST_INTERVAL', 10, int)
+        check_assert('POLL_REQUEST_CONCURRENCY', 1, int, allow_zero=False)
 
         check_assert('ENABLE_SLACK_ALERT', False, bool)
         check_assert('ENABLE_TELEGRAM_ALERT', False, bool)
@@ -279,6 +293,11 @@ def check_app_config(config):
         # logging.getLogger('apscheduler').setLevel(logging.WARNING)
     check_assert('DATA_PATH', '', str)
     check_assert('DATABASE_URL', '', str)
+    check_assert('DATABASE_POOL_SIZE', 10, int, allow_zero=False)
+    check_assert('DATABASE_MAX_OVERFLOW', 20, int)
+    check_assert('DATABASE_POOL_RECYCLE', 3600, int)
+    check_assert('DATABASE_BUSY_TIMEOUT', 30, int)
+    check_assert('METADATA_SYNC_INTERVAL', 5, int)
     database_url = config.get('DATABASE_URL', '')
     if database_url:
         assert any(test_database_url_pattern(database_url)), "Invalid format of DATABASE_URL: %s" % database_url
@@ -0,0 +1,229 @@
+# coding: utf-8
+"""
+Jobs ingestion module: fetch the jobs of a Scrapyd server and emit what changed since the last snapshot.
+
+Only the stdlib and httpx are imported, as it is also used by the poll subprocess.
+"""
+from collections import OrderedDict
+from datetime import datetime
+import hashlib
+from html.parser import HTMLParser
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+
+logger = logging.getLogger(__name__)
+
+# The same keys as the columns of the Jobs page of Scrapyd, see also JobsView
+JOB_KEYS = ['project', 'spider', 'job', 'pid', 'start', 'runtime', 'finish', 'href_log', 'href_items']
+# runtime of running jobs changes on every fetch, so it is left out of the fingerprint
+FINGERPRINT_KEYS = ['project', 'spider', 'job', 'pid', 'start', 'finish', 'href_log', 'href_items']
+MODE_JSON = 'json'
+MODE_HTML = 'html'
+
+JobKey = Tuple[str, str, str]  # (project, spider, job)
+
+
+def get_job_key(job: Dict[str, str]) -> JobKey:
+    return (job['project'], job['spider'], job['job'])
+
+
+def get_job_fingerprint(job: Dict[str, str]) -> str:
+    return '\x1f'.join(job.get(k) or '' for k in FINGERPRINT_KEYS)
+
+
+class JobsHTMLParser(HTMLParser):
+    """
+    Incremental tokenizer of the Jobs page of Scrapyd, to be fed chunk by chunk.
+    Each <tr> with <td> cells becomes a job; <a href> cells are reduced to the href.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.jobs: List[Dict[str, str]] = []
+        self.found_title = False
+        self._in_h1 = False
+        self._row: Optional[List[str]] = None
+        self._cell: Optional[List[str]] = None
+        self._href: Optional[str] = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'h1':
+            self._in_h1 = True
+        elif tag == 'tr':
+            self._row = []
+        elif tag == 'td' and self._row is not None:
+            self._cell = []
+            self._href = None
+        elif tag == 'a' and self._cell is not None and self._href is None:
+            self._href = dict(attrs).get('href')
+
+    def handle_endtag(self, tag):
+        if tag == 'h1':
+            self._in_h1 = False
+        elif tag == 'td' and self._cell is not None:
+            self._row.append(self._href if self._href is not None else ''.join(self._cell).strip())
+            self._cell = None
+        elif tag == 'tr' and self._row is not None:
+            # Rows of <th> only, i.e. <thead>, are left with no cell
+            if len(self._row) >= 3:
+                job = dict(zip(JOB_KEYS, self._row))
+                for k in JOB_KEYS[len(self._row):]:
+                    job[k] = ''
+                self.jobs.append(job)
+            self._row = None
+
+    def handle_data(self, data):
+        if self._in_h1 and data.strip() == 'Jobs':
+            self.found_title = True
+        if self._cell is not None:
+            self._cell.append(data)
+
+
+def parse_listjobs(js: Dict[str, Any]) -> List[Dict[str, str]]:
+    """Convert the result of listjobs.json into the same job dicts as the Jobs page: pending, running, finished"""
+    jobs = []
+    for status in ['pending', 'running', 'finished']:
+        for item in js.get(status, []):
+            start = (item.get('start_time') or '')[:19]
+            finish = (item.get('end_time') or '')[:19]
+            runtime = ''
+            if start and finish:
+                runtime = str(datetime.strptime(finish, '%Y-%m-%d %H:%M:%S')
+                              - datetime.strptime(start, '%Y-%m-%d %H:%M:%S'))
+            jobs.append(dict(
+                project=item.get('project', ''),
+                spider=item.get('spider', ''),
+                job=item.get('id', ''),
+                pid=str(item['pid']) if item.get('pid') else '',
+                start=start,
+                runtime=runtime,
+                finish=finish,
+                href_log=item.get('log_url') or '',
+                href_items=item.get('items_url') or '',
+            ))
+    return jobs
+
+
+def dedupe_jobs(jobs: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    """
+    There may be jobs with the same (project, spider, job):
+    keep the latest pending/running one, and ignore finished ones already seen as pending/running.
+    """
+    seen_jobs = OrderedDict()
+    for job in jobs:  # (Pending, Running) ASC
+        if job['finish']:
+            break
+        seen_jobs.pop(get_job_key(job), None)
+        seen_jobs[get_job_key(job)] = job
+    for job in reversed(jobs):  # Finished DESC
+        if not job['finish']:
+            break
+        seen_jobs.setdefault(get_job_key(job), job)
+    return list(seen_jobs.values())
+
+
+class JobsDelta(object):
+    """The jobs of a node, and what changed since the previous snapshot"""
+
+    def __init__(self, node: int, mode: str, jobs: List[Dict[str, str]], added: List[Dict[str, str]],
+                 changed: List[Dict[str, str]], removed: List[JobKey], fingerprint: str):
+        self.node = node
+        self.mode = mode
+        self.jobs = jobs
+        self.added = added
+        self.changed = changed
+        self.removed = removed
+        self.fingerprint = fingerprint
+
+    @property
+    def unchanged(self) -> bool:
+        return not (self.added or self.changed or self.removed)
+
+    def __repr__(self):
+        return "<JobsDelta node %s (%s): %s jobs, %s added, %s changed, %s removed>" % (
+            self.node, self.mode, len(self.jobs), len(self.added), len(self.changed), len(self.removed))
+
+
+class JobsIngestor(object):
+    """
+    Keep the fingerprints of the last snapshot of each node, so that consumers
+    like Poll and the jobs table sync only have to handle the delta.
+    listjobs.json is preferred, falling back to tokenizing the Jobs page for old versions of Scrapyd.
+    """
+
+    def __init__(self, client: httpx.AsyncClient):
+        self.client = client
+        self.modes: Dict[int, str] = {}  # node -> MODE_JSON or MODE_HTML
+        self.fingerprints: Dict[int, Dict[JobKey, str]] = {}
+        self.snapshot_fingerprints: Dict[int, str] = {}
+
+    async def fetch_listjobs(self, base_url: str, auth=None) -> Optional[List[Dict[str, str]]]:
+        """Return None if listjobs.json is not supported, i.e. the 'project' parameter is required"""
+        r = await self.client.get('%s/listjobs.json' % base_url, auth=auth)
+        if r.status_code == 401:
+            r.raise_for_status()
+        try:
+            js = r.json()
+        except ValueError:
+            return None
+        if r.status_code != 200 or js.get('status') != 'ok':
+            logger.debug("listjobs.json of %s not supported: (%s) %s", base_url, r.status_code, js)
+            return None
+        return parse_listjobs(js)
+
+    async def fetch_jobs_page(self, base_url: str, auth=None) -> List[Dict[str, str]]:
+        parser = JobsHTMLParser()
+        async with self.client.stream('GET', '%s/jobs' % base_url, auth=auth) as r:
+            r.raise_for_status()
+            async for chunk in r.aiter_text():
+                parser.feed(chunk)
+        parser.close()
+        if not parser.found_title:
+            raise ValueError("Jobs page not found in %s/jobs" % base_url)
+        return parser.jobs
+
+    async def fetch(self, node: int, base_url: str, auth=None) -> Tuple[str, List[Dict[str, str]]]:
+        """Return (mode, jobs) of a node, remembering whether listjobs.json is supported"""
+        mode = self.modes.get(node, MODE_JSON)
+        if mode == MODE_JSON:
+            jobs = await self.fetch_listjobs(base_url, auth)
+            if jobs is not None:
+                self.modes[node] = MODE_JSON
+                return MODE_JSON, jobs
+            mode = self.modes[node] = MODE_HTML
+            logger.info("[node %s] Fall back to the Jobs page since listjobs.json is not supported", node)
+        return mode, await self.fetch_jobs_page(base_url, auth)
+
+    async def poll(self, node: int, base_url: str, auth=None) -> JobsDelta:
+        mode, jobs = await self.fetch(node, base_url, auth)
+        return self.diff(node, jobs, mode)
+
+    def diff(self, node: int, jobs: List[Dict[str, str]], mode: str = MODE_JSON) -> JobsDelta:
+        """Compare jobs with the last snapshot of the node, which is then replaced"""
+        jobs = dedupe_jobs(jobs)
+        fingerprints = OrderedDict((get_job_key(job), get_job_fingerprint(job)) for job in jobs)
+        snapshot_fingerprint = hashlib.sha1('\x1e'.join(fingerprints.values()).encode('utf-8')).hexdigest()
+        previous = self.fingerprints.get(node, {})
+        if snapshot_fingerprint == self.snapshot_fingerprints.get(node):
+            added, changed, removed = [], [], []
+        else:
+            added = [job for job in jobs if get_job_key(job) not in previous]
+            changed = [job for job in jobs
+                       if get_job_key(job) in previous and previous[get_job_key(job)] != fingerprints[get_job_key(job)]]
+            removed = [key for key in previous if key not in fingerprints]
+        self.fingerprints[node] = fingerprints
+        self.snapshot_fingerprints[node] = snapshot_fingerprint
+        delta = JobsDelta(node, mode, jobs, added, changed, removed, snapshot_fingerprint)
+        logger.debug("[node %s] %s", node, delta)
+        return delta
+
+    def reset(self, node: Optional[int] = None):
+        """Forget the last snapshot, so that all jobs would be emitted as added next time"""
+        for d in (self.fingerprints, self.snapshot_fingerprints):
+            if node is None:
+                d.clear()
+            else:
+                d.pop(node, None)
@@ -1,9 +1,9 @@
 # coding: utf-8
+import asyncio
 import json
 import logging
 import os
 import platform
-import re
 import sys
 import time
 import traceback
@@ -13,8 +13,12 @@ try:
 except ImportError:
     pid_exists = None
 
-import requests
-from requests.adapters import HTTPAdapter
+import httpx
+
+try:
+    from .jobs_ingest import JobsIngestor, get_job_key
+except ImportError:  # Run as a script, see start_poll() in sub_process.py
+    from jobs_ingest import JobsIngestor, get_job_key
 
 
 logger = logging.getLogger('scrapydash.utils.poll')  # __name__
@@ -24,22 +28,34 @@ _handler.setFormatter(_formatter)
 logger.addHandler(_handler)
 
 IN_WINDOWS = platform.system() == 'Windows'
-# See also scrapydash/views/dashboard/jobs.py
-JOB_PATTERN = re.compile(r"""
-                            <tr>\s*
-                                <td>(?P<Project>.*?)</td>\s*
-                                <td>(?P<Spider>.*?)</td>\s*
-                                <td>(?P<Job>.*?)</td>\s*
-                                (?:<td>(?P<PID>.*?)</td>\s*)?
-                                (?:<td>(?P<Start>.*?)</td>\s*)?
-                                (?:<td>(?P<Runtime>.*?)</td>\s*)?
-                                (?:<td>(?P<Finish>.*?)</td>\s*)?
-                                (?:<td>(?P<Log>.*?)</td>\s*)?
-                                (?:<td>(?P<Items>.*?)</td>\s*)?
-                                [\w\W]*?  # Temp support for Scrapyd v1.3.0 (not released)
-                            </tr>
-                          """, re.X)
-JOB_KEYS = ['project', 'spider', 'job', 'pid', 'start', 'runtime', 'finish', 'log', 'items']
+
+
+class NodeRateLimiter(object):
+    """
+    Limit the requests of a node to `concurrency` at a time,
+    with at least `interval` seconds between the starts of two requests.
+    """
+
+    def __init__(self, interval, concurrency=1):
+        self.interval = interval
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.lock = asyncio.Lock()
+        self.next_start = 0
+
+    async def __aenter__(self):
+        await self.semaphore.acquire()
+        try:
+            async with self.lock:
+                delay = self.next_start - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                self.next_start = time.monotonic() + self.interval
+        except BaseException:
+            self.semaphore.release()
+            raise
+
+    async def __aexit__(self, *exc_info):
+        self.semaphore.release()
 
 
 class Poll(object):
@@ -48,25 +64,28 @@ class Poll(object):
     def __init__(self, url_scrapydash, username, password,
                  scrapyd_servers, scrapyd_servers_auths,
                  poll_round_interval, poll_request_interval,
-                 main_pid, verbose, exit_timeout=0):
+                 main_pid, verbose, exit_timeout=0, poll_request_concurrency=1, transport=None):
         self.url_scrapydash = url_scrapydash
         self.auth = (username, password) if username and password else None
 
         self.scrapyd_servers = scrapyd_servers
         self.scrapyd_servers_auths = scrapyd_servers_auths
 
-        self.session = requests.Session()
-        self.session.mount('http://', HTTPAdapter(pool_connections=1000, pool_maxsize=1000))
-        self.session.mount('https://', HTTPAdapter(pool_connections=1000, pool_maxsize=1000))
-        # if username and password:
-            # self.session.auth = (username, password)
         self.timeout = 60
+        self.transport = transport  # For test only
+        self.client = None  # httpx.AsyncClient, created in the event loop of main()
+        self.ingestor = JobsIngestor(None)  # Keeps the last snapshot of jobs of each node
+        self.limiters = {}  # node -> NodeRateLimiter
 
         self.poll_round_interval = poll_round_interval
         self.poll_request_interval = poll_request_interval
+        self.poll_request_concurrency = poll_request_concurrency
 
         self.ignore_finished_bool_list = [True] * len(self.scrapyd_servers)
-        self.finished_jobs_dict = {}
+        self.finished_jobs_dict = {}  # node -> finished jobs whose stats have been fetched, or ignored
+        self.retry_jobs_dict = {}  # node -> finished jobs whose stats failed to be fetched
+        # {'elapsed': 1.2, 'nodes': {1: {'elapsed': 1.2, 'jobs': 3, 'ok': True}}}
+        self.round_timing = {}
 
         self.main_pid = main_pid
         self.poll_pid = os.getpid()
@@ -78,7 +97,9 @@ class Poll(object):
         self.exit_timeout = exit_timeout
 
         self.init_time = time.time()
-        self.url_stats = self.url_scrapydash + '/{node}/log/{opt}/{project}/{spider}/{job}/?job_finished={job_finished}'
+        # Stats are parsed incrementally, see log_stats.py
+        self.url_stats = (self.url_scrapydash
+                          + '/api/{node}/log/{project}/{spider}/{job}/stats?job_finished={job_finished}')
 
     def check_exit(self):
         exit_condition_1 = pid_exists is not None and not pid_exists(self.main_pid)
@@ -98,79 +119,91 @@ class Poll(object):
         else:
             return True
 
-    def fetch_jobs(self, node, url, auth):
-        running_jobs = []
-        finished_jobs_set = set()
+    def get_limiter(self, node):
+        limiter = self.limiters.get(node)
+        if limiter is None:
+            limiter = NodeRateLimiter(self.poll_request_interval, self.poll_request_concurrency)
+            self.limiters[node] = limiter
+        return limiter
+
+    async def fetch_jobs(self, node, url, auth):
         self.logger.debug("[node %s] fetch_jobs: %s", node, url)
-        r = self.make_request(url, auth=auth, post=False)
-        # Should not invoke update_finished_jobs() if fail to fetch jobs
-        assert r is not None, "[node %s] fetch_jobs failed: %s" % (node, url)
-
-        self.logger.debug("[node %s] fetch_jobs got (%s) %s bytes", node, r.status_code, len(r.content))
-        # Temp support for Scrapyd v1.3.0 (not released)
-        text = re.sub(r'<thead>.*?</thead>', '', r.text, flags=re.S)
-        jobs = [dict(zip(JOB_KEYS, job)) for job in re.findall(JOB_PATTERN, text)]
-        for job in jobs:
-            job_tuple = (job['project'], job['spider'], job['job'])
-            if job['pid']:
-                running_jobs.append(job_tuple)
-            elif job['finish']:
-                finished_jobs_set.add(job_tuple)
+        try:
+            async with self.get_limiter(node):
+                delta = await self.ingestor.poll(node, url, auth)
+        except Exception as err:
+            # Should not invoke update_finished_jobs() if fail to fetch jobs
+            raise AssertionError("[node %s] fetch_jobs failed: %s\n%s" % (node, url, err))
+
+        self.logger.debug("[node %s] fetch_jobs got %s", node, delta)
+        # The stats of running jobs are fetched every round, so they are taken from the whole snapshot,
+        # whereas a job has just finished only if it is added or changed since the previous snapshot.
+        running_jobs = [get_job_key(job) for job in delta.jobs if job['pid']]
+        finished_jobs_set = set(get_job_key(job) for job in delta.added + delta.changed
+                                if not job['pid'] and job['finish'])
         self.logger.debug("[node %s] got running_jobs: %s", node, len(running_jobs))
-        self.logger.debug("[node %s] got finished_jobs_set: %s", node, len(finished_jobs_set))
-        return running_jobs, finished_jobs_set
+        self.logger.debug("[node %s] got newly finished_jobs_set: %s", node, len(finished_jobs_set))
+        return running_jobs, finished_jobs_set, set(delta.removed)
 
-    def fetch_stats(self, node, job_tuple, finished_jobs):
+    async def fetch_stats(self, node, job_tuple, finished_jobs):
         (project, spider, job) = job_tuple
-        job_finished = 'True' if job_tuple in finished_jobs else ''
+        job_finished = job_tuple in finished_jobs
         kwargs = dict(
             node=node,
-            opt='stats',
             project=project,
             spider=spider,
             job=job,
-            job_finished=job_finished
+            job_finished='true' if job_finished else 'false'
         )
-        # http://127.0.0.1:5000/log/stats/proxy/test/55f1f388a7ae11e8b9b114dda9e91c2f/
+        # http://127.0.0.1:5000/api/1/log/proxy/test/55f1f388a7ae11e8b9b114dda9e91c2f/stats
         url = self.url_stats.format(**kwargs)
         self.logger.debug("[node %s] fetch_stats: %s", node, url)
-        # Make POST request to trigger alert, see log.py
-        r = self.make_request(url, auth=self.auth, post=True)
+        r = await self.make_request(node, url, auth=self.auth)
         if r is None:
             self.logger.error("[node %s %s] fetch_stats failed: %s", node, self.scrapyd_servers[node-1], url)
             if job_finished:
-                self.finished_jobs_dict[node].remove(job_tuple)
+                self.finished_jobs_dict[node].discard(job_tuple)
+                self.retry_jobs_dict[node].add(job_tuple)
                 self.logger.info("[node %s] retry in next round: %s", node, url)
         else:
             self.logger.debug("[node %s] fetch_stats got (%s) %s bytes from %s",
                               node, r.status_code, len(r.content), url)
 
     def main(self):
-        while True:
-            self.check_exit()
-            start_time = time.time()
-            try:
-                self.run()
-                end_time = time.time()
-                self.logger.debug("Took %.1f seconds", (end_time - start_time))
-                if 0 < self.exit_timeout < end_time - self.init_time:
-                    self.logger.critical("GoodBye, exit_timeout: %s", self.exit_timeout)
-                    break
-                else:
-                    self.logger.info("Sleeping for %ss", self.poll_round_interval)
-                    time.sleep(self.poll_round_interval)
-            except KeyboardInterrupt:
-                self.logger.warning("Poll subprocess (pid: %s) cancelled by KeyboardInterrupt", self.poll_pid)
-                sys.exit()
-            except Exception:
-                self.logger.error(traceback.format_exc())
-
-    def make_request(self, url, auth, post=False):
         try:
-            if post:
-                r = self.session.post(url, auth=auth, timeout=self.timeout)
-            else:
-                r = self.session.get(url, auth=auth, timeout=self.timeout)
+            asyncio.run(self.main_loop())
+        except KeyboardInterrupt:
+            self.logger.warning("Poll subprocess (pid: %s) cancelled by KeyboardInterrupt", self.poll_pid)
+            sys.exit()
+
+    async def main_loop(self):
+        self.client = httpx.AsyncClient(timeout=self.timeout, transport=self.transport,
+                                        limits=httpx.Limits(max_connections=1000, max_keepalive_connections=1000))
+        self.ingestor.client = self.client
+        try:
+            while True:
+                self.check_exit()
+                try:
+                    await self.run()
+                    end_time = time.time()
+                    if 0 < self.exit_timeout < end_time - self.init_time:
+                        self.logger.critical("GoodBye, exit_timeout: %s", self.exit_timeout)
+                        break
+                    else:
+                        self.logger.info("Sleeping for %ss", self.poll_round_interval)
+                        await asyncio.sleep(self.poll_round_interval)
+                except Exception:
+                    self.logger.error(traceback.format_exc())
+        finally:
+            await self.client.aclose()
+
+    async def make_request(self, node, url, auth, post=False):
+        try:
+            async with self.get_limiter(node):
+                if post:
+                    r = await self.client.post(url, auth=auth)
+                else:
+                    r = await self.client.get(url, auth=auth)
             r.encoding = 'utf-8'
             assert r.status_code == 200, "got status_code %s" % r.status_code
         except Exception as err:
@@ -179,35 +212,54 @@ class Poll(object):
         else:
             return r
 
-    def run(self):
-        for node, (scrapyd_server, auth) in enumerate(zip(self.scrapyd_servers, self.scrapyd_servers_auths), 1):
-            # Update Jobs history
-            # url_jobs = self.url_scrapydash + '/%s/jobs/' % node
-            # self.make_request(url_jobs, auth=self.auth, post=True)
-
-            url_jobs = 'http://%s/jobs' % scrapyd_server
-            # json.loads(json.dumps({'auth':(1,2)})) => {'auth': [1, 2]}
-            auth = tuple(auth) if auth else None  # TypeError: 'list' object is not callable
-            try:
-                running_jobs, finished_jobs_set = self.fetch_jobs(node, url_jobs, auth)
-                finished_jobs = self.update_finished_jobs(node, finished_jobs_set)
-                for job_tuple in running_jobs + finished_jobs:
-                    self.fetch_stats(node, job_tuple, finished_jobs)
-                    self.logger.debug("Sleeping for %ss", self.poll_request_interval)
-                    time.sleep(self.poll_request_interval)
-            except KeyboardInterrupt:
-                raise
-            except AssertionError as err:
-                self.logger.error(err)
-            except Exception:
-                self.logger.error(traceback.format_exc())
-
-    def update_finished_jobs(self, node, finished_jobs_set):
+    async def run(self):
+        """Poll all nodes in parallel, each one throttled by its own NodeRateLimiter"""
+        start_time = time.monotonic()
+        nodes = list(enumerate(zip(self.scrapyd_servers, self.scrapyd_servers_auths), 1))
+        timings = await asyncio.gather(*[self.run_node(node, scrapyd_server, auth)
+                                         for node, (scrapyd_server, auth) in nodes])
+        self.round_timing = dict(elapsed=time.monotonic() - start_time,
+                                 nodes=dict(zip([node for node, __ in nodes], timings)))
+        self.logger.info("Round took %.1f seconds: %s", self.round_timing['elapsed'],
+                         ', '.join("node %s %.1fs (%s jobs%s)" % (node, t['elapsed'], t['jobs'],
+                                                                 '' if t['ok'] else ', failed')
+                                   for node, t in self.round_timing['nodes'].items()))
+        return self.round_timing
+
+    async def run_node(self, node, scrapyd_server, auth):
+        start_time = time.monotonic()
+        # Update Jobs history
+        # url_jobs = self.url_scrapydash + '/%s/jobs/' % node
+        # self.make_request(url_jobs, auth=self.auth, post=True)
+
+        url_jobs = 'http://%s' % scrapyd_server
+        # json.loads(json.dumps({'auth':(1,2)})) => {'auth': [1, 2]}
+        auth = tuple(auth) if auth else None  # TypeError: 'list' object is not callable
+        jobs = 0
+        ok = False
+        try:
+            running_jobs, finished_jobs_set, removed_jobs_set = await self.fetch_jobs(node, url_jobs, auth)
+            finished_jobs = self.update_finished_jobs(node, finished_jobs_set, removed_jobs_set)
+            jobs = len(running_jobs) + len(finished_jobs)
+            await asyncio.gather(*[self.fetch_stats(node, job_tuple, finished_jobs)
+                                   for job_tuple in running_jobs + finished_jobs])
+            ok = True
+        except AssertionError as err:
+            self.logger.error(err)
+        except Exception:
+            self.logger.error(traceback.format_exc())
+        return dict(elapsed=time.monotonic() - start_time, jobs=jobs, ok=ok)
+
+    def update_finished_jobs(self, node, finished_jobs_set, removed_jobs_set=frozenset()):
+        """Return the finished jobs to fetch the stats of: the newly finished ones and those failed last round"""
         finished_jobs_set_previous = self.finished_jobs_dict.setdefault(node, set())
+        retry_jobs_set = self.retry_jobs_dict.setdefault(node, set())
         self.logger.debug("[node %s] previous finished_jobs_set: %s", node, len(finished_jobs_set_previous))
-        # set([2,3]).difference(set([1,2])) => {3}
-        finished_jobs_set_new_added = finished_jobs_set.difference(finished_jobs_set_previous)
-        self.finished_jobs_dict[node] = finished_jobs_set
+        finished_jobs_set_previous.difference_update(removed_jobs_set)
+        retry_jobs_set.difference_update(removed_jobs_set)
+        finished_jobs_set_new_added = finished_jobs_set | retry_jobs_set
+        retry_jobs_set.clear()
+        finished_jobs_set_previous.update(finished_jobs_set_new_added)
         self.logger.debug("[node %s] now finished_jobs_set: %s", node, len(self.finished_jobs_dict[node]))
         if finished_jobs_set_new_added:
             self.logger.info("[node %s] new added finished_jobs_set: %s", node, finished_jobs_set_new_added)
@@ -231,7 +283,7 @@ def main(args):
     keys = ('url_scrapydash', 'username', 'password',
             'scrapyd_servers', 'scrapyd_servers_auths',
             'poll_round_interval', 'poll_request_interval',
-            'main_pid', 'verbose', 'exit_timeout')
+            'main_pid', 'verbose', 'exit_timeout', 'poll_request_concurrency')
     kwargs = dict(zip(keys, args))
     kwargs['scrapyd_servers'] = json.loads(kwargs['scrapyd_servers'])
     kwargs['scrapyd_servers_auths'] = json.loads(kwargs['scrapyd_servers_auths'])
@@ -240,6 +292,7 @@ def main(args):
     kwargs['main_pid'] = int(kwargs['main_pid'])
     kwargs['verbose'] = kwargs['verbose'] == 'True'
     kwargs['exit_timeout'] = int(kwargs.setdefault('exit_timeout', 0))  # For test only
+    kwargs['poll_request_concurrency'] = int(kwargs.setdefault('poll_request_concurrency', 1))
 
     poll = Poll(**kwargs)
     poll.main()
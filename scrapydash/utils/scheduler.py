@@ -10,7 +10,8 @@ from apscheduler.jobstores.memory import MemoryJobStore
 from apscheduler.schedulers.background import BackgroundScheduler
 
 from ..common import handle_metadata
-from ..vars import APSCHEDULER_DATABASE_URI, TIMER_TASKS_HISTORY_LOG
+from ..engines import BIND_APSCHEDULER, registry
+from ..vars import TIMER_TASKS_HISTORY_LOG
 
 
 apscheduler_logger = logging.getLogger('apscheduler')
@@ -29,7 +30,8 @@ apscheduler_logger.addHandler(_handler)
 EVENT_MAP = {EVENT_JOB_MAX_INSTANCES: 'EVENT_JOB_MAX_INSTANCES', EVENT_JOB_REMOVED: 'EVENT_JOB_REMOVED'}
 
 jobstores = {
-    'default': SQLAlchemyJobStore(url=APSCHEDULER_DATABASE_URI),
+    # The pooled engine of APSCHEDULER_DATABASE_URI, see engines.py
+    'default': SQLAlchemyJobStore(engine=registry.get_engine(BIND_APSCHEDULER)),
     'memory': MemoryJobStore()
 }
 executors = {
@@ -103,7 +103,9 @@ def start_poll(config):
         str(config.get('POLL_ROUND_INTERVAL', 300)),
         str(config.get('POLL_REQUEST_INTERVAL', 10)),
         str(config['MAIN_PID']),
-        str(config.get('VERBOSE', False))
+        str(config.get('VERBOSE', False)),
+        '0',  # exit_timeout
+        str(config.get('POLL_REQUEST_CONCURRENCY', 1))
     ]
 
     # 'Windows':
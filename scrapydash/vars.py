@@ -2,9 +2,12 @@
 import glob
 import importlib
 import io
+import logging
 import os
 import re
 import sys
+import threading
+import time
 
 from apscheduler.schedulers.base import STATE_PAUSED, STATE_RUNNING, STATE_STOPPED
 
@@ -16,62 +19,156 @@ from .utils.setup_database import setup_database
 PYTHON_VERSION = '.'.join([str(n) for n in sys.version_info[:3]])
 PY2 = sys.version_info.major < 3
 
-try:
-    from scrapy import __version__ as SCRAPY_VERSION
-except ImportError:
-    SCRAPY_VERSION = '0.0.0'
-
-try:
-    from scrapyd import __version__ as SCRAPYD_VERSION
-except ImportError:
-    SCRAPYD_VERSION = '0.0.0'
-
 SCRAPYDASH_SETTINGS_PY = 'scrapydash_settings_v11.py'
-sys.path.append(os.getcwd())
-try:
-    custom_settings_module = importlib.import_module(os.path.splitext(SCRAPYDASH_SETTINGS_PY)[0])
-except ImportError:
-    custom_data_path = ''
-    custom_database_url = ''
-else:
-    custom_data_path = getattr(custom_settings_module, 'DATA_PATH', '')
-    custom_data_path = custom_data_path if isinstance(custom_data_path, str) else ''
-    custom_database_url = getattr(custom_settings_module, 'DATABASE_URL', '')
-    custom_database_url = custom_database_url if isinstance(custom_database_url, str) else ''
 
 # For data storage
 ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
 
-DATA_PATH = default_data_path or custom_data_path
-if DATA_PATH:
-    DATA_PATH = os.path.abspath(DATA_PATH)
-else:
-    DATA_PATH = os.path.join(ROOT_DIR, 'data')
-
-DATABASE_PATH = os.path.join(DATA_PATH, 'database')
-DEMO_PROJECTS_PATH = os.path.join(DATA_PATH, 'demo_projects')
-DEPLOY_PATH = os.path.join(DATA_PATH, 'deploy')
-HISTORY_LOG = os.path.join(DATA_PATH, 'history_log')
-PARSE_PATH = os.path.join(DATA_PATH, 'parse')
-SCHEDULE_PATH = os.path.join(DATA_PATH, 'schedule')
-STATS_PATH = os.path.join(DATA_PATH, 'stats')
-
-for path in [DATA_PATH, DATABASE_PATH, DEMO_PROJECTS_PATH, DEPLOY_PATH,
-             HISTORY_LOG, PARSE_PATH, SCHEDULE_PATH, STATS_PATH]:
-    if not os.path.isdir(path):
-        os.mkdir(path)
-    elif path in [PARSE_PATH, DEPLOY_PATH, SCHEDULE_PATH]:
-        for file in glob.glob(os.path.join(path, '*.*')):
-            if not os.path.split(file)[-1] in ['ScrapydWeb_demo.log']:
-                os.remove(file)
-
-RUN_SPIDER_HISTORY_LOG = os.path.join(HISTORY_LOG, 'run_spider_history.log')
-TIMER_TASKS_HISTORY_LOG = os.path.join(HISTORY_LOG, 'timer_tasks_history.log')
-
-# For database
-DATABASE_URL = custom_database_url or default_database_url or 'sqlite:///' + DATABASE_PATH
-results = setup_database(DATABASE_URL, DATABASE_PATH)
-APSCHEDULER_DATABASE_URI, SQLALCHEMY_DATABASE_URI, SQLALCHEMY_BINDS, DATABASE_PATH = results
+logger = logging.getLogger(__name__)
+
+# Importing this module does no I/O: the names below are resolved on first access, see __getattr__(),
+# or all at once via init(), by running the phases they depend on in order.
+PHASE_SETTINGS = 'settings'  # Import the custom settings module and resolve the paths
+PHASE_PATHS = 'paths'  # Create the data directories, clean up the temp files and create the history logs
+PHASE_DATABASE = 'database'  # Run setup_database(), which may create the databases of MySQL or PostgreSQL
+PHASES = [PHASE_SETTINGS, PHASE_PATHS, PHASE_DATABASE]
+
+LAZY_NAMES = dict(
+    SCRAPY_VERSION=None,
+    SCRAPYD_VERSION=None,
+    custom_data_path=PHASE_SETTINGS,
+    custom_database_url=PHASE_SETTINGS,
+    DATA_PATH=PHASE_PATHS,
+    DEMO_PROJECTS_PATH=PHASE_PATHS,
+    DEPLOY_PATH=PHASE_PATHS,
+    HISTORY_LOG=PHASE_PATHS,
+    PARSE_PATH=PHASE_PATHS,
+    SCHEDULE_PATH=PHASE_PATHS,
+    STATS_PATH=PHASE_PATHS,
+    RUN_SPIDER_HISTORY_LOG=PHASE_PATHS,
+    TIMER_TASKS_HISTORY_LOG=PHASE_PATHS,
+    DATABASE_URL=PHASE_SETTINGS,
+    DATABASE_PATH=PHASE_DATABASE,
+    APSCHEDULER_DATABASE_URI=PHASE_DATABASE,
+    SQLALCHEMY_DATABASE_URI=PHASE_DATABASE,
+    SQLALCHEMY_BINDS=PHASE_DATABASE,
+)
+
+
+def get_package_version(package):
+    try:
+        return importlib.import_module(package).__version__
+    except ImportError:
+        return '0.0.0'
+
+
+class Runtime:
+    """The values of LAZY_NAMES, along with how long each init phase took"""
+
+    def __init__(self):
+        self.values = {}
+        self.phases_done = []
+        self.timings = {}
+        self._lock = threading.RLock()
+
+    def init_settings(self):
+        sys.path.append(os.getcwd())
+        try:
+            custom_settings_module = importlib.import_module(os.path.splitext(SCRAPYDASH_SETTINGS_PY)[0])
+        except ImportError:
+            custom_data_path = ''
+            custom_database_url = ''
+        else:
+            custom_data_path = getattr(custom_settings_module, 'DATA_PATH', '')
+            custom_data_path = custom_data_path if isinstance(custom_data_path, str) else ''
+            custom_database_url = getattr(custom_settings_module, 'DATABASE_URL', '')
+            custom_database_url = custom_database_url if isinstance(custom_database_url, str) else ''
+
+        data_path = default_data_path or custom_data_path
+        if data_path:
+            data_path = os.path.abspath(data_path)
+        else:
+            data_path = os.path.join(ROOT_DIR, 'data')
+        history_log = os.path.join(data_path, 'history_log')
+        database_path = os.path.join(data_path, 'database')
+        return dict(
+            custom_data_path=custom_data_path,
+            custom_database_url=custom_database_url,
+            DATA_PATH=data_path,
+            DATABASE_PATH=database_path,
+            DEMO_PROJECTS_PATH=os.path.join(data_path, 'demo_projects'),
+            DEPLOY_PATH=os.path.join(data_path, 'deploy'),
+            HISTORY_LOG=history_log,
+            PARSE_PATH=os.path.join(data_path, 'parse'),
+            SCHEDULE_PATH=os.path.join(data_path, 'schedule'),
+            STATS_PATH=os.path.join(data_path, 'stats'),
+            RUN_SPIDER_HISTORY_LOG=os.path.join(history_log, 'run_spider_history.log'),
+            TIMER_TASKS_HISTORY_LOG=os.path.join(history_log, 'timer_tasks_history.log'),
+            DATABASE_URL=custom_database_url or default_database_url or 'sqlite:///' + database_path,
+        )
+
+    def init_paths(self):
+        v = self.values
+        for path in [v['DATA_PATH'], v['DATABASE_PATH'], v['DEMO_PROJECTS_PATH'], v['DEPLOY_PATH'],
+                     v['HISTORY_LOG'], v['PARSE_PATH'], v['SCHEDULE_PATH'], v['STATS_PATH']]:
+            if not os.path.isdir(path):
+                os.mkdir(path)
+            elif path in [v['PARSE_PATH'], v['DEPLOY_PATH'], v['SCHEDULE_PATH']]:
+                for file in glob.glob(os.path.join(path, '*.*')):
+                    if not os.path.split(file)[-1] in ['ScrapydWeb_demo.log']:
+                        os.remove(file)
+        setup_logfile(delete=False)
+        return {}
+
+    def init_database(self):
+        results = setup_database(self.values['DATABASE_URL'], self.values['DATABASE_PATH'])
+        keys = ['APSCHEDULER_DATABASE_URI', 'SQLALCHEMY_DATABASE_URI', 'SQLALCHEMY_BINDS', 'DATABASE_PATH']
+        return dict(zip(keys, results))
+
+    def init(self, until=PHASE_DATABASE):
+        """Run the phases up to and including until, each at most once"""
+        with self._lock:
+            for phase in PHASES[:PHASES.index(until) + 1]:
+                if phase in self.phases_done:
+                    continue
+                start = time.perf_counter()
+                # Marked as done beforehand, so that a phase can look up the values it is resolving
+                self.phases_done.append(phase)
+                try:
+                    self.values.update(getattr(self, 'init_%s' % phase)())
+                except Exception:
+                    self.phases_done.remove(phase)
+                    raise
+                self.timings[phase] = time.perf_counter() - start
+                logger.debug("Init phase %s of %s took %.3fs", phase, __name__, self.timings[phase])
+            return self.values
+
+    def get(self, name):
+        phase = LAZY_NAMES[name]
+        if phase is None:
+            # e.g. 'SCRAPY_VERSION' => 'scrapy', which is slow to import
+            value = self.values.get(name)
+            if value is None:
+                value = self.values[name] = get_package_version(name.split('_')[0].lower())
+            return value
+        return self.init(phase)[name]
+
+
+runtime = Runtime()
+
+
+def init(until=PHASE_DATABASE):
+    """Resolve all lazy names at once, e.g. on startup, and return the timings of the init phases"""
+    runtime.init(until)
+    return dict(runtime.timings)
+
+
+def __getattr__(name):
+    if name in LAZY_NAMES:
+        value = globals()[name] = runtime.get(name)
+        return value
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
 
 # For check_app_config() and BaseView
 ALLOWED_SCRAPYD_LOG_EXTENSIONS = ['.log', '.log.gz', '.txt', '.gz', '']
@@ -108,9 +205,6 @@ DIRECTORY_PATTERN = re.compile(r"""
 DIRECTORY_KEYS = ['odd_even', 'filename', 'size', 'last_modified', 'content_type', 'content_encoding']
 HREF_NAME_PATTERN = re.compile(r'href="(.+?)">(.+?)<')
 
-# For JobsView
-jobs_table_map = {}
-
 # For Timer Tasks
 # STATE_STOPPED = 0, STATE_RUNNING = 1, STATE_PAUSED = 2
 SCHEDULER_STATE_DICT = {
@@ -121,6 +215,9 @@ SCHEDULER_STATE_DICT = {
 
 
 def setup_logfile(delete=False):
+    values = runtime.init(PHASE_PATHS)
+    RUN_SPIDER_HISTORY_LOG = values['RUN_SPIDER_HISTORY_LOG']
+    TIMER_TASKS_HISTORY_LOG = values['TIMER_TASKS_HISTORY_LOG']
     if delete:
         for logfile in [RUN_SPIDER_HISTORY_LOG, TIMER_TASKS_HISTORY_LOG]:
             if os.path.exists(logfile):
@@ -133,6 +230,3 @@ def setup_logfile(delete=False):
     if not os.path.exists(TIMER_TASKS_HISTORY_LOG):
         with io.open(TIMER_TASKS_HISTORY_LOG, 'w', encoding='utf-8') as f:
             f.write(u'%s\n%s\n\n' % (TIMER_TASKS_HISTORY_LOG, '#' * 50))
-
-
-setup_logfile(delete=False)
@@ -118,3 +118,16 @@ def client(app):
 @pytest.fixture
 def runner(app):
     return app.test_cli_runner()
+
+
+@pytest.fixture
+def artifact_store(tmp_path):
+    """An artifact store in tmp_path with an in-memory database, so that deploys in tests leave DEPLOY_PATH alone"""
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from sqlalchemy.pool import StaticPool
+
+    from scrapydash.artifact_store import ArtifactStore
+
+    engine = create_engine('sqlite://', connect_args=dict(check_same_thread=False), poolclass=StaticPool)
+    return ArtifactStore(str(tmp_path / 'artifacts'), sessionmaker(bind=engine))
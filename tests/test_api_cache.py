@@ -0,0 +1,97 @@
+# coding: utf-8
+"""
+Tests for the cache of read-only Scrapyd API calls
+"""
+import asyncio
+import json
+
+import httpx
+from fastapi.testclient import TestClient
+
+from scrapydash.api_cache import ApiCache
+from scrapydash.app import create_app
+from scrapydash.scrapyd_client import ScrapydClient
+
+
+def test_single_flight():
+    """Test that concurrent misses on the same key share one fetch"""
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return 200, {'status': 'ok'}
+
+    async def run():
+        cache = ApiCache()
+        key = (1, 'daemonstatus', None, None)
+        results = await asyncio.gather(*[cache.get_or_fetch(key, fetch) for __ in range(20)])
+        assert all(result == (200, {'status': 'ok'}) for result in results)
+        assert await cache.get_or_fetch(key, fetch) == (200, {'status': 'ok'})
+        return cache
+
+    cache = asyncio.run(run())
+    assert len(calls) == 1
+    assert (cache.misses, cache.coalesced, cache.hits) == (1, 19, 1)
+
+
+def test_errors_are_not_cached():
+    """Test that failed calls are fetched again"""
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        return 500, {'status': 'error'}
+
+    async def run():
+        cache = ApiCache()
+        for __ in range(2):
+            await cache.get_or_fetch((1, 'listprojects', None, None), fetch)
+
+    asyncio.run(run())
+    assert len(calls) == 2
+
+
+def test_lru_memory_cap():
+    """Test that the least recently used entries are evicted beyond max_bytes"""
+    value = (200, {'status': 'ok', 'projects': ['x' * 20]})
+    max_bytes = len(json.dumps(value)) * 2 + 1  # Room for two entries
+    cache = ApiCache(max_bytes=max_bytes)
+    cache.set((1, 'listprojects', None, None), value)
+    cache.set((2, 'listprojects', None, None), value)
+    assert cache.get((1, 'listprojects', None, None)) == value  # Now the most recently used
+    cache.set((3, 'listprojects', None, None), value)
+    assert cache.get((2, 'listprojects', None, None)) is None
+    assert cache.get((1, 'listprojects', None, None)) == value
+    assert cache.size <= max_bytes
+
+
+def test_invalidate():
+    """Test that a change of project drops the affected keys of the node only"""
+    cache = ApiCache()
+    value = (200, {'status': 'ok'})
+    keys = [(1, 'listprojects', None, None), (1, 'listversions', 'demo', None),
+            (1, 'listversions', 'other', None), (2, 'listversions', 'demo', None)]
+    for key in keys:
+        cache.set(key, value)
+    cache.invalidate(1, 'demo')
+    assert [cache.get(key) for key in keys] == [None, None, value, value]
+
+
+def test_api_endpoint_cache():
+    """Test that api_endpoint serves read-only opts from the cache until a mutating opt"""
+    calls = []
+
+    def handler(request):
+        calls.append(request.url.path)
+        return httpx.Response(200, json={'status': 'ok', 'versions': ['v1']})
+
+    app = create_app()
+    app.state.scrapyd_client = ScrapydClient(app.state.config, transport=httpx.MockTransport(handler))
+    client = TestClient(app)
+    for __ in range(3):
+        assert client.get('/api/1/api/listversions/demo').json()['versions'] == ['v1']
+    assert calls == ['/listversions.json']
+    client.post('/api/1/api/delversion/demo/v1')
+    client.get('/api/1/api/listversions/demo')
+    assert calls == ['/listversions.json', '/delversion.json', '/listversions.json']
@@ -0,0 +1,101 @@
+# coding: utf-8
+"""
+Tests for the artifact store of the eggs deployed
+"""
+import json
+import os
+
+from fastapi.testclient import TestClient
+import httpx
+
+from scrapydash.app import create_app
+from scrapydash.scrapyd_client import ScrapydClient
+
+
+def list_blobs(store):
+    return sorted(os.listdir(store.path))
+
+
+def test_put_and_get(tmp_path, artifact_store):
+    """Test that the versions with the same egg share a blob, and that replaced blobs are dropped"""
+    store = artifact_store
+    v1 = store.put('demo', 'v1', b'egg 1')
+    assert v1['new'] and store.put('demo', 'v2', b'egg 1') == dict(v1, version='v2', new=False)
+    path = tmp_path / 'demo.egg'
+    path.write_bytes(b'egg 3')
+    v3 = store.put('other', 'v1', str(path))
+    assert len(list_blobs(store)) == 2 and v3['size'] == 5
+
+    egg = store.get('demo', 'v2')
+    with open(egg['path'], 'rb') as f:
+        assert f.read() == b'egg 1'
+    assert store.get('demo', 'v3') is None
+
+    store.put('demo', 'v1', b'egg 1 rebuilt')
+    store.put('demo', 'v2', b'egg 1 rebuilt')
+    assert len(list_blobs(store)) == 2
+    assert [v['version'] for v in store.list_versions('demo')] == ['v2', 'v1']
+
+
+def test_prune(artifact_store):
+    """Test that the oldest versions beyond max_versions are dropped, except those still deployed"""
+    store = artifact_store
+    store.max_versions = 2
+    digests = {}
+    for version in ['v1', 'v2', 'v3']:
+        digests[version] = store.put('demo', version, version.encode())['digest']
+        if version == 'v1':
+            store.record_deployment(1, 'demo', 'v1', digests['v1'])
+    assert [v['version'] for v in store.list_versions()] == ['v3', 'v2', 'v1']
+    store.put('demo', 'v4', b'v4')
+    assert [(v['version'], v['nodes']) for v in store.list_versions()] == [('v4', []), ('v3', []), ('v1', [1])]
+    assert digests['v2'] + '.egg' not in list_blobs(store) and len(list_blobs(store)) == 3
+
+
+def test_drift(artifact_store):
+    """Test the current version of each node, as recorded on deploys"""
+    store = artifact_store
+    digest = store.put('demo', 'v1', b'v1')['digest']
+    for node in [1, 2]:
+        store.record_deployment(node, 'demo', 'v1', digest)
+    store.record_deployment(1, 'demo', 'v2', store.put('demo', 'v2', b'v2')['digest'])
+    drift = store.drift([1, 2, 3])
+    assert drift == dict(demo=dict(latest='v2', nodes={1: 'v2', 2: 'v1', 3: None}, behind=[2], missing=[3]))
+    assert store.drift([1], project='other') == {}
+
+
+def test_redeploy_route(artifact_store):
+    """Test redeploying a kept version to a group of nodes, and rolling back to it as a new version"""
+    uploads = []
+
+    def handler(request):
+        uploads.append((request.url.port, request.read()))
+        if request.url.port == 6802:
+            return httpx.Response(200, json=dict(status='error', message='Invalid egg'))
+        return httpx.Response(200, json=dict(status='ok', spiders=1))
+
+    app = create_app()
+    app.state.config.update(SCRAPYD_SERVERS=['127.0.0.1:%s' % port for port in range(6800, 6803)],
+                            SCRAPYD_SERVERS_AUTHS=[None] * 3, SCRAPYD_SERVERS_GROUPS=['', 'a', 'a'])
+    app.state.scrapyd_client = ScrapydClient(transport=httpx.MockTransport(handler))
+    app.state.artifact_store = artifact_store
+    client = TestClient(app)
+    digest = artifact_store.put('demo', 'v1', b'egg of v1')['digest']
+    artifact_store.put('demo', 'v2', b'egg of v2')
+
+    js = json.loads(client.post('/api/cluster/redeploy/demo/v1', params=dict(group='a')).text)
+    assert (js['version'], js['egg']['digest'], js['ok'], js['error']) == ('v1', digest, 1, 1)
+    assert sorted(port for port, __ in uploads) == [6801, 6802]
+    assert all(b'egg of v1' in content for __, content in uploads)
+
+    js = json.loads(client.post('/api/cluster/redeploy/demo/v1', params=dict(nodes='1', as_version='v1 rollback')).text)
+    assert (js['version'], js['egg']['version'], js['ok']) == ('v1-rollback', 'v1', 1)
+    versions = client.get('/api/deploy/versions', params=dict(project='demo')).json()['versions']
+    assert [(v['version'], v['nodes']) for v in versions] == [('v1-rollback', [1]), ('v2', []), ('v1', [2])]
+    assert versions[0]['digest'] == digest and len(list_blobs(artifact_store)) == 2
+
+    js = client.get('/api/deploy/drift').json()
+    assert js['drifted'] == ['demo']
+    assert js['projects']['demo'] == dict(latest='v1-rollback', nodes={'1': 'v1-rollback', '2': 'v1', '3': None},
+                                          behind=[2], missing=[3])
+    assert client.post('/api/cluster/redeploy/demo/v3').status_code == 404
@@ -0,0 +1,101 @@
+# coding: utf-8
+"""
+Tests for deploying an egg to multiple nodes concurrently
+"""
+import asyncio
+import json
+
+from fastapi.testclient import TestClient
+import httpx
+
+from scrapydash import deploy, egg_cache
+from scrapydash.app import create_app
+from scrapydash.deploy import add_version_with_retries, clean_project_name, clean_version
+from scrapydash.egg_cache import EggCache
+from scrapydash.scrapyd_client import ScrapydClient
+
+
+def make_project(root):
+    path = root / 'demo'
+    (path / 'demo').mkdir(parents=True)
+    (path / 'scrapy.cfg').write_text('[settings]\ndefault = demo.settings\n')
+    (path / 'demo' / '__init__.py').write_text('')
+
+
+def fake_build(project_path, files, egg_path):
+    with open(egg_path, 'wb') as f:
+        f.write(b'egg' * 1000)
+
+
+def test_clean_names():
+    assert clean_project_name('my-project 1') == 'my_project_1'
+    assert clean_version('2026-01-01 00:00') == '2026-01-01-00-00'
+
+
+def test_retries():
+    """Test that unreachable nodes and 5xx are retried, unlike an egg rejected by Scrapyd"""
+    answers = [httpx.ConnectError('refused'), httpx.Response(503),
+               httpx.Response(200, json=dict(status='ok', spiders=1)),
+               httpx.Response(200, json=dict(status='error', message='invalid egg'))]
+
+    def handler(request):
+        answer = answers.pop(0)
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+    client = ScrapydClient(transport=httpx.MockTransport(handler))
+    config = dict(SCRAPYD_SERVERS=['127.0.0.1:6800'])
+    status_code, js = asyncio.run(add_version_with_retries(client, config, 1, 'demo', 'v1', b'egg', retry_delay=0))
+    assert (status_code, js['status'], js['attempts']) == (200, 'ok', 3)
+    status_code, js = asyncio.run(add_version_with_retries(client, config, 1, 'demo', 'v1', b'egg', retry_delay=0))
+    assert (js['status'], js['attempts']) == ('error', 1)
+
+    answers[:] = [httpx.Response(500)] * 2
+    status_code, js = asyncio.run(add_version_with_retries(client, config, 1, 'demo', 'v1', b'egg', retries=1,
+                                                           retry_delay=0))
+    assert (status_code, js['status'], js['attempts']) == (500, 'error', 2)
+
+
+def test_cluster_deploy(tmp_path, monkeypatch, artifact_store):
+    """Test that the egg is uploaded to the nodes concurrently, with the results streamed as they come"""
+    monkeypatch.setattr(egg_cache, 'build_egg', fake_build)
+    monkeypatch.setattr(deploy, 'RETRY_DELAY', 0)
+    make_project(tmp_path / 'projects')
+    in_flight = [0, 0]
+    failures = {6803: 1, 6804: 10}
+
+    async def handler(request):
+        in_flight[0] += 1
+        in_flight[1] = max(in_flight)
+        await asyncio.sleep(0.05)
+        in_flight[0] -= 1
+        port = request.url.port
+        assert b'egg' * 1000 in request.content
+        if failures.get(port):
+            failures[port] -= 1
+            return httpx.Response(502)
+        return httpx.Response(200, json=dict(status='ok', project='demo', version='v1', spiders=1))
+
+    app = create_app()
+    app.state.config.update(SCRAPYD_SERVERS=['127.0.0.1:%s' % port for port in range(6800, 6806)],
+                            SCRAPYD_SERVERS_AUTHS=[None] * 6, SCRAPY_PROJECTS_DIR=str(tmp_path / 'projects'),
+                            SCRAPYD_FANOUT_CONCURRENCY=3, DEPLOY_RETRIES=2)
+    app.state.scrapyd_client = ScrapydClient(transport=httpx.MockTransport(handler))
+    app.state.egg_cache = EggCache(str(tmp_path / 'cache'))
+    app.state.artifact_store = artifact_store
+    client = TestClient(app)
+
+    r = client.post('/api/cluster/deploy', params=dict(nodes='1,2,3,4,5,6'),
+                    data=dict(folder='demo', project='demo', version='v1'))
+    js = json.loads(r.text)
+    assert (js['project'], js['version'], js['egg']['hit']) == ('demo', 'v1', False)
+    assert sorted(js['nodes']) == ['1', '2', '3', '4', '5', '6']
+    assert (js['ok'], js['error']) == (5, 1)
+    assert (js['nodes']['4']['attempts'], js['nodes']['4']['status']) == (2, 'ok')
+    assert (js['nodes']['5']['attempts'], js['nodes']['5']['status_code']) == (3, 502)
+    assert in_flight[1] == 3
+
+    r = client.post('/api/cluster/deploy', params=dict(nodes='1'), data=dict(folder='demo', project='demo'))
+    assert json.loads(r.text)['egg']['hit'] is True
+    assert client.post('/api/cluster/deploy', params=dict(nodes='7'), data=dict(folder='demo')).status_code == 404
@@ -0,0 +1,175 @@
+# coding: utf-8
+"""
+Tests for the uploads of eggs and project archives on the Deploy page
+"""
+import asyncio
+import io
+import os
+import tarfile
+import zipfile
+
+from fastapi.testclient import TestClient
+import httpx
+import pytest
+
+from scrapydash import egg_cache
+from scrapydash.app import create_app
+from scrapydash.deploy_upload import UploadError, check_member_name, extract_project, limit_stream
+from scrapydash.egg_cache import EggCache, hash_project
+from scrapydash.scrapyd_client import ScrapydClient
+
+PROJECT_FILES = {
+    'demo-master/README.md': b'readme',
+    'demo-master/scrapy.cfg': b'[settings]\ndefault = demo.settings\n\n[deploy]\nproject = demo\n',
+    'demo-master/setup.py': b'# Written by scrapyd-deploy',
+    'demo-master/demo/__init__.py': b'',
+    'demo-master/demo/settings.py': b"BOT_NAME = 'demo'\n",
+    'demo-master/demo/__pycache__/settings.cpython-311.pyc': b'\0',
+    'demo-master/demo/spiders/test.py': b'name = "test"\n',
+    'demo-master/demo/spiders/test.pyc': b'\0',
+    'demo-master/build/lib/demo/__init__.py': b'',
+    'demo-master/tests/scrapy.cfg': b'[settings]\ndefault = tests.settings\n',
+    'other/file.txt': b'outside of the project',
+}
+EXTRACTED = ['README.md', 'demo/__init__.py', 'demo/settings.py', 'demo/spiders/test.py', 'scrapy.cfg',
+             'tests/scrapy.cfg']
+
+
+def make_zip(files):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, 'w') as f:
+        for name, content in files.items():
+            f.writestr(name, content)
+    return buf.getvalue()
+
+
+def make_tar(files, links=()):
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode='w:gz') as f:
+        for name, content in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            f.addfile(info, io.BytesIO(content))
+        for name, target in links:
+            info = tarfile.TarInfo(name)
+            info.type = tarfile.SYMTYPE
+            info.linkname = target
+            f.addfile(info)
+    return buf.getvalue()
+
+
+def list_files(path):
+    return sorted(os.path.relpath(os.path.join(dirpath, filename), str(path)).replace(os.sep, '/')
+                  for dirpath, __, filenames in os.walk(str(path)) for filename in filenames)
+
+
+def test_check_member_name():
+    """Test that the members pointing outside the archive are rejected"""
+    assert check_member_name('demo/./spiders//test.py') == 'demo/spiders/test.py'
+    assert check_member_name('demo\\settings.py') == 'demo/settings.py'
+    for name in ['../evil.py', 'demo/../../evil.py', '/etc/passwd', 'C:/evil.py', '..\\evil.py']:
+        with pytest.raises(UploadError):
+            check_member_name(name)
+
+
+def test_limit_stream():
+    """Test that a body without Content-Length is cut off once beyond the limit"""
+    async def body():
+        for __ in range(10):
+            yield b'x' * 10
+
+    async def read(max_bytes):
+        return [chunk async for chunk in limit_stream(body(), max_bytes)]
+
+    assert len(asyncio.run(read(100))) == 10
+    with pytest.raises(UploadError) as err:
+        asyncio.run(read(99))
+    assert err.value.status_code == 413
+
+
+@pytest.mark.parametrize('make_archive', [make_zip, make_tar])
+def test_extract_project(tmp_path, make_archive):
+    """Test that only the files to build the egg are extracted, with scrapy.cfg right in dest"""
+    dest = tmp_path / 'project'
+    assert extract_project(io.BytesIO(make_archive(PROJECT_FILES)), str(dest)) == len(EXTRACTED)
+    assert list_files(dest) == EXTRACTED
+    assert (dest / 'demo' / 'settings.py').read_bytes() == b"BOT_NAME = 'demo'\n"
+
+
+def test_extract_unsafe(tmp_path):
+    """Test that archives with paths outside dest are rejected, and that links are skipped"""
+    dest = tmp_path / 'project'
+    for data in [make_zip({'scrapy.cfg': b'', '../evil.py': b''}), make_tar({'scrapy.cfg': b'', '/evil.py': b''})]:
+        with pytest.raises(UploadError, match='Illegal path'):
+            extract_project(io.BytesIO(data), str(dest))
+    assert not os.path.exists(str(tmp_path / 'evil.py')) and not os.path.exists(str(dest))
+
+    data = make_tar({'scrapy.cfg': b''}, links=[('demo/passwd', '/etc/passwd')])
+    extract_project(io.BytesIO(data), str(dest))
+    assert list_files(dest) == ['scrapy.cfg']
+
+
+def test_extract_limits(tmp_path):
+    """Test the limits of the extracted bytes and members, and the errors of invalid archives"""
+    data = make_zip({'scrapy.cfg': b'', 'big.py': b'x' * 1000})
+    with pytest.raises(UploadError) as err:
+        extract_project(io.BytesIO(data), str(tmp_path / 'a'), max_bytes=999)
+    assert err.value.status_code == 413
+    with pytest.raises(UploadError) as err:
+        extract_project(io.BytesIO(data), str(tmp_path / 'b'), max_members=1)
+    assert err.value.status_code == 413
+    with pytest.raises(UploadError) as err:
+        extract_project(io.BytesIO(make_zip({'demo.py': b''})), str(tmp_path / 'c'))
+    assert err.value.status_code == 404
+    with pytest.raises(UploadError, match='Fail to extract'):
+        extract_project(io.BytesIO(b'not an archive'), str(tmp_path / 'd'))
+
+
+def test_deploy_upload_route(tmp_path, monkeypatch, artifact_store):
+    """Test deploying an uploaded archive, built via the egg cache, and an uploaded egg as is"""
+    built = []
+
+    def build_egg(project_path, files, egg_path):
+        built.append([relpath for relpath, __ in files])
+        with open(egg_path, 'wb') as f:
+            f.write(b'egg of %s' % hash_project(files).encode())
+
+    monkeypatch.setattr(egg_cache, 'build_egg', build_egg)
+    uploads = []
+
+    def handler(request):
+        assert request.url.path == '/addversion.json'
+        uploads.append(request.read())
+        return httpx.Response(200, json=dict(status='ok', spiders=1))
+
+    app = create_app()
+    app.state.config.update(SCRAPYD_SERVERS=['127.0.0.1:6800'], SCRAPYD_SERVERS_AUTHS=[None])
+    app.state.scrapyd_client = ScrapydClient(transport=httpx.MockTransport(handler))
+    app.state.egg_cache = EggCache(str(tmp_path / 'cache'))
+    app.state.artifact_store = artifact_store
+    client = TestClient(app)
+
+    files = dict(file=('demo-master.tar.gz', make_tar(PROJECT_FILES)))
+    js = client.post('/api/1/deploy/upload', data=dict(version='v1'), files=files).json()
+    assert js['status'] == 'ok' and js['project'] == 'demo_master' and js['version'] == 'v1'
+    assert js['egg']['hit'] is False and built == [EXTRACTED]
+    files = dict(file=('demo.zip', make_zip(PROJECT_FILES)))
+    js = client.post('/api/1/deploy/upload', data=dict(project='demo', version='v2'), files=files).json()
+    assert js['project'] == 'demo' and js['egg']['hit'] is True and len(built) == 1
+    assert b'name="version"\r\n\r\nv2' in uploads[1] and b'egg of ' in uploads[1]
+
+    egg = make_zip({'demo/__init__.py': b'', 'EGG-INFO/entry_points.txt': b'[scrapy]\n'})
+    js = client.post('/api/1/deploy/upload', files=dict(file=('demo.egg', egg))).json()
+    assert js['status'] == 'ok' and js['egg']['size'] == len(egg) and egg in uploads[2]
+
+    r = client.post('/api/1/deploy/upload', files=dict(file=('demo.egg', b'not a zip')))
+    assert r.status_code == 400
+    r = client.post('/api/1/deploy/upload', files=dict(file=('demo.rar', b'')))
+    assert r.status_code == 400
+    r = client.post('/api/1/deploy/upload', files=dict(file=('evil.zip', make_zip({'../scrapy.cfg': b''}))))
+    assert r.status_code == 400 and 'Illegal path' in r.json()['detail']
+    assert client.post('/api/2/deploy/upload', files=dict(file=('demo.egg', egg))).status_code == 404
+
+    app.state.config.update(DEPLOY_UPLOAD_MAX_BYTES=len(egg))
+    assert client.post('/api/1/deploy/upload', files=dict(file=('demo.egg', egg))).status_code == 413
+    assert len(uploads) == 3
@@ -0,0 +1,139 @@
+# coding: utf-8
+"""
+Tests for the egg cache of the deploy pipeline
+"""
+import asyncio
+import os
+import time
+import zipfile
+
+from fastapi.testclient import TestClient
+import httpx
+import pytest
+
+from scrapydash import egg_cache
+from scrapydash.app import create_app
+from scrapydash.egg_cache import BuildError, EggCache, hash_project, list_project_files
+from scrapydash.scrapyd_client import ScrapydClient
+
+
+def make_project(root, folder='demo'):
+    path = root / folder
+    (path / 'demo' / 'spiders').mkdir(parents=True)
+    (path / 'scrapy.cfg').write_text('[settings]\ndefault = demo.settings\n\n[deploy]\nproject = demo\n')
+    (path / 'demo' / '__init__.py').write_text('')
+    (path / 'demo' / 'settings.py').write_text("BOT_NAME = 'demo'\n")
+    (path / 'demo' / 'spiders' / '__init__.py').write_text('')
+    (path / 'demo' / 'spiders' / 'test.py').write_text('name = "test"\n')
+    return path
+
+
+def fake_build(calls):
+    def build_egg(project_path, files, egg_path):
+        calls.append(project_path)
+        with open(egg_path, 'wb') as f:
+            f.write(b'egg of %s' % hash_project(files).encode())
+    return build_egg
+
+
+def test_hash_project(tmp_path):
+    """Test that the hash only depends on the files to build the egg from"""
+    path = make_project(tmp_path)
+    key = hash_project(list_project_files(str(path)))
+    (path / 'setup.py').write_text('# Created by the build')
+    (path / 'build').mkdir()
+    (path / 'build' / 'x.py').write_text('')
+    (path / 'demo' / '__pycache__').mkdir()
+    (path / 'demo' / '__pycache__' / 'settings.cpython-311.pyc').write_bytes(b'\0')
+    assert hash_project(list_project_files(str(path))) == key
+
+    (path / 'scrapy.cfg').write_text('[settings]\ndefault = demo.other_settings\n')
+    key_cfg = hash_project(list_project_files(str(path)))
+    assert key_cfg != key
+    (path / 'demo' / 'spiders' / 'test.py').write_text('name = "test2"\n')
+    assert hash_project(list_project_files(str(path))) not in (key, key_cfg)
+
+
+def test_build_egg(tmp_path):
+    """Test a real build, which leaves the project untouched, then the reuse of the egg"""
+    path = make_project(tmp_path)
+    cache = EggCache(str(tmp_path / 'cache'))
+    egg = asyncio.run(cache.get_egg(str(path)))
+    assert not egg['hit'] and egg['size'] > 0
+    with zipfile.ZipFile(egg['path']) as f:
+        names = f.namelist()
+        assert 'demo/settings.py' in names
+        assert b'settings = demo.settings' in f.read('EGG-INFO/entry_points.txt')
+    assert sorted(os.listdir(str(path))) == ['demo', 'scrapy.cfg']
+
+    assert asyncio.run(cache.get_egg(str(path))) == dict(egg, hit=True)
+    assert (cache.stats['hits'], cache.stats['misses'], cache.stats['builds']) == (1, 1, 1)
+
+    (path / 'scrapy.cfg').write_text('[deploy]\nproject = demo\n')
+    (path / 'demo' / 'spiders' / 'test.py').write_text('name = "changed"\n')
+    with pytest.raises(BuildError):
+        asyncio.run(cache.get_egg(str(path)))
+
+
+def test_concurrent_builds(tmp_path, monkeypatch):
+    """Test that deploying the same project to several nodes at once builds it only once"""
+    calls = []
+    monkeypatch.setattr(egg_cache, 'build_egg', fake_build(calls))
+    path = make_project(tmp_path)
+    cache = EggCache(str(tmp_path / 'cache'))
+
+    async def main():
+        return await asyncio.gather(*[cache.get_egg(str(path)) for __ in range(5)])
+
+    eggs = asyncio.run(main())
+    assert len(calls) == 1
+    assert sorted(egg['hit'] for egg in eggs) == [False] + [True] * 4
+    assert cache.get_stats()['hit_ratio'] == 0.8
+
+
+def test_evict(tmp_path):
+    """Test that the eggs unused for too long are dropped, then the least recently used beyond the size"""
+    cache = EggCache(str(tmp_path), max_bytes=250, max_age=1)
+    now = time.time()
+    for name, age in [('a', 2 * 86400), ('b', 300), ('c', 200), ('d', 100)]:
+        path = str(tmp_path / (name + '.egg'))
+        with open(path, 'wb') as f:
+            f.write(b'x' * 100)
+        os.utime(path, (now - age, now - age))
+    assert cache.evict(now=now, keep=str(tmp_path / 'b.egg')) == 2
+    assert sorted(os.listdir(str(tmp_path))) == ['b.egg', 'd.egg']
+    assert cache.get_stats()['bytes'] == 200 and cache.stats['evictions'] == 2
+
+
+def test_deploy_route(tmp_path, monkeypatch, artifact_store):
+    """Test that redeploying the same version to another node reuses the egg"""
+    calls = []
+    monkeypatch.setattr(egg_cache, 'build_egg', fake_build(calls))
+    make_project(tmp_path / 'projects')
+    uploads = []
+
+    def handler(request):
+        assert request.url.path == '/addversion.json'
+        uploads.append((request.url.port, request.content))
+        return httpx.Response(200, json=dict(status='ok', project='demo', version='v1', spiders=1))
+
+    app = create_app()
+    app.state.config.update(SCRAPYD_SERVERS=['127.0.0.1:6800', '127.0.0.1:6801'], SCRAPYD_SERVERS_AUTHS=[None] * 2,
+                            SCRAPY_PROJECTS_DIR=str(tmp_path / 'projects'))
+    app.state.scrapyd_client = ScrapydClient(transport=httpx.MockTransport(handler))
+    app.state.egg_cache = EggCache(str(tmp_path / 'cache'))
+    app.state.artifact_store = artifact_store
+    client = TestClient(app)
+
+    data = dict(folder='demo', project='demo', version='v1')
+    js = client.post('/api/1/deploy', data=data).json()
+    assert js['status'] == 'ok' and js['egg']['hit'] is False
+    js = client.post('/api/2/deploy', data=data).json()
+    assert js['status'] == 'ok' and js['egg']['hit'] is True
+    assert len(calls) == 1 and [port for port, __ in uploads] == [6800, 6801]
+    assert b'name="version"\r\n\r\nv1' in uploads[0][1] and b'egg of ' in uploads[0][1]
+
+    js = client.get('/api/deploy/cache').json()
+    assert (js['hits'], js['misses'], js['eggs']) == (1, 1, 1)
+    assert client.post('/api/1/deploy', data=dict(folder='..')).status_code == 404
+    assert client.post('/api/1/deploy', data=dict(folder='other')).status_code == 404
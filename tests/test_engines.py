@@ -0,0 +1,64 @@
+# coding: utf-8
+"""
+Tests for the engine registry shared by all sessions
+"""
+import threading
+
+from sqlalchemy import insert, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
+
+from scrapydash.engines import BIND_APSCHEDULER, EngineRegistry, RoutingSession, create_pooled_engine
+from scrapydash.models import Job, Metadata, Task, db, ensure_table
+
+
+def test_sqlite_engine(tmp_path):
+    """Test that SQLite databases get WAL, synchronous=NORMAL and a busy timeout"""
+    engine = create_pooled_engine('sqlite:///%s' % (tmp_path / 'test.db'), pool_size=3, busy_timeout=5)
+    assert isinstance(engine.pool, QueuePool) and engine.pool.size() == 3
+    with engine.connect() as conn:
+        assert conn.execute(text('PRAGMA journal_mode')).scalar() == 'wal'
+        assert conn.execute(text('PRAGMA synchronous')).scalar() == 1  # NORMAL
+        assert conn.execute(text('PRAGMA busy_timeout')).scalar() == 5000
+    engine.dispose()
+
+
+def test_routing_session(tmp_path):
+    """Test that each model goes to the database of its bind key, for ORM and Core statements"""
+    uris = {None: 'sqlite:///%s' % (tmp_path / 'timer_tasks.db'),
+            'metadata': 'sqlite:///%s' % (tmp_path / 'metadata.db'),
+            'jobs': 'sqlite:///%s' % (tmp_path / 'jobs.db'),
+            BIND_APSCHEDULER: 'sqlite:///%s' % (tmp_path / 'timer_tasks.db')}
+    engine_registry = EngineRegistry(uris)
+    Session = sessionmaker(class_=RoutingSession, engine_registry=engine_registry)
+    assert engine_registry.get_engine(BIND_APSCHEDULER) is engine_registry.get_engine()
+    session = Session()
+    for model in (Metadata, Task, Job):
+        ensure_table(model.__table__, session.get_bind(model))
+    session.add(Metadata(version='test'))
+    session.execute(insert(Job.__table__),
+                    [dict(node=1, project='demo', spider='test', job='job', status='0', deleted='0')])
+    session.commit()
+    assert session.query(Metadata.version).scalar() == 'test'
+    assert session.query(Job).count() == 1
+    session.close()
+
+    tables = {}
+    for bind_key in [None, 'metadata', 'jobs']:
+        with engine_registry.get_engine(bind_key).connect() as conn:
+            tables[bind_key] = sorted(conn.execute(text("SELECT name FROM sqlite_master WHERE type='table'")).scalars())
+    assert tables == {None: ['task'], 'metadata': ['metadata'], 'jobs': ['job']}
+    engine_registry.dispose()
+    assert not engine_registry.engines
+
+
+def test_session_per_thread():
+    """Test that the legacy db.session is no longer shared between threads"""
+    sessions = []
+    threads = [threading.Thread(target=lambda: sessions.append(db.session())) for __ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sessions[0] is not sessions[1]
+    assert db.Session() is not db.Session()
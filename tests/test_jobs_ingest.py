@@ -0,0 +1,126 @@
+# coding: utf-8
+"""
+Tests for the incremental jobs ingestion
+"""
+import asyncio
+
+import httpx
+
+from scrapydash.utils.jobs_ingest import MODE_HTML, MODE_JSON, JobsHTMLParser, JobsIngestor
+
+
+JOBS_PAGE = """<html><head><title>Scrapyd</title></head><body><h1>Jobs</h1><p><a href='..'>Go up</a></p>
+<table border='1'>
+<thead><tr><th>Project</th><th>Spider</th><th>Job</th><th>PID</th><th>Start</th><th>Runtime</th><th>Finish</th>
+<th>Log</th><th>Items</th></tr></thead>
+<tr><th colspan='9' style='background-color: #ddd'>Pending</th></tr>
+<tr><td>demo</td><td>test</td><td>pending_job</td><td></td><td></td><td></td><td></td><td></td><td></td></tr>
+<tr><th colspan='9' style='background-color: #ddd'>Running</th></tr>
+<tr><td>demo</td><td>test</td><td>running_job</td><td>123</td><td>2026-01-01 00:00:00</td><td>0:01:00</td><td></td>
+<td><a href='/logs/demo/test/running_job.log'>Log</a></td><td></td></tr>
+<tr><th colspan='9' style='background-color: #ddd'>Finished</th></tr>
+<tr><td>demo</td><td>test</td><td>finished_job</td><td></td><td>2026-01-01 00:00:00</td><td>0:01:00</td>
+<td>2026-01-01 00:01:00</td><td><a href='/logs/demo/test/finished_job.log'>Log</a></td>
+<td><a href='/items/demo/test/finished_job.jl'>Items</a></td></tr>
+</table></body></html>
+"""
+LISTJOBS = dict(
+    status='ok',
+    pending=[dict(project='demo', spider='test', id='pending_job')],
+    running=[dict(project='demo', spider='test', id='running_job', pid=123,
+                  start_time='2026-01-01 00:00:00.123456')],
+    finished=[dict(project='demo', spider='test', id='finished_job', start_time='2026-01-01 00:00:00.123456',
+                   end_time='2026-01-01 00:01:00.654321', log_url='/logs/demo/test/finished_job.log',
+                   items_url='/items/demo/test/finished_job.jl')],
+)
+
+
+def test_html_parser_in_chunks():
+    """Test that the Jobs page is tokenized the same way whatever the chunks"""
+    parser = JobsHTMLParser()
+    for i in range(0, len(JOBS_PAGE), 7):
+        parser.feed(JOBS_PAGE[i:i + 7])
+    parser.close()
+    assert parser.found_title
+    assert [job['job'] for job in parser.jobs] == ['pending_job', 'running_job', 'finished_job']
+    finished_job = parser.jobs[-1]
+    assert finished_job['finish'] == '2026-01-01 00:01:00'
+    assert finished_job['href_log'] == '/logs/demo/test/finished_job.log'
+    assert finished_job['href_items'] == '/items/demo/test/finished_job.jl'
+    assert parser.jobs[1]['pid'] == '123'
+
+
+def run_polls(handler, rounds):
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            ingestor = JobsIngestor(client)
+            return [await ingestor.poll(1, 'http://127.0.0.1:6800') for __ in range(rounds)]
+    return asyncio.run(run())
+
+
+def test_listjobs():
+    """Test that listjobs.json is preferred and converted like the Jobs page"""
+    paths = []
+
+    def handler(request):
+        paths.append(request.url.path)
+        return httpx.Response(200, json=LISTJOBS)
+
+    delta, = run_polls(handler, 1)
+    assert paths == ['/listjobs.json']
+    assert delta.mode == MODE_JSON
+    assert [job['job'] for job in delta.added] == ['pending_job', 'running_job', 'finished_job']
+    finished_job = delta.jobs[-1]
+    assert finished_job['start'] == '2026-01-01 00:00:00'
+    assert finished_job['runtime'] == '0:01:00'
+    assert delta.jobs[1]['pid'] == '123'
+
+
+def test_fall_back_to_jobs_page():
+    """Test that the Jobs page is used, without retrying listjobs.json, if the 'project' parameter is required"""
+    paths = []
+
+    def handler(request):
+        paths.append(request.url.path)
+        if request.url.path == '/listjobs.json':
+            return httpx.Response(200, json={'status': 'error', 'message': "'project'"})
+        return httpx.Response(200, text=JOBS_PAGE)
+
+    deltas = run_polls(handler, 2)
+    assert paths == ['/listjobs.json', '/jobs', '/jobs']
+    assert deltas[0].mode == MODE_HTML and len(deltas[0].added) == 3
+    assert deltas[1].unchanged
+
+
+def test_delta():
+    """Test that only added, changed and removed jobs are emitted"""
+    snapshots = [
+        LISTJOBS,
+        dict(status='ok', pending=[],
+             running=[dict(project='demo', spider='test', id='pending_job', pid=456,
+                           start_time='2026-01-01 00:02:00.000000')],
+             finished=LISTJOBS['finished'] + [dict(project='demo', spider='test', id='running_job',
+                                                   start_time='2026-01-01 00:00:00.123456',
+                                                   end_time='2026-01-01 00:03:00.000000')]),
+    ]
+
+    def handler(request):
+        return httpx.Response(200, json=snapshots.pop(0) if len(snapshots) > 1 else snapshots[0])
+
+    first, second, third = run_polls(handler, 3)
+    assert len(first.added) == 3 and not first.changed and not first.removed
+    assert not second.added
+    assert sorted(job['job'] for job in second.changed) == ['pending_job', 'running_job']
+    assert not second.removed
+    assert third.unchanged and len(third.jobs) == 3
+
+
+def test_removed_jobs():
+    """Test that jobs missing from the new snapshot, e.g. after Scrapyd restarts, are emitted as removed"""
+    ingestor = JobsIngestor(None)
+    job = dict(project='demo', spider='test', job='a', pid='', start='', runtime='', finish='',
+               href_log='', href_items='')
+    ingestor.diff(1, [job, dict(job, job='b')])
+    delta = ingestor.diff(1, [job])
+    assert delta.removed == [('demo', 'test', 'b')]
+    assert not ingestor.diff(2, [job]).removed
@@ -0,0 +1,56 @@
+# coding: utf-8
+"""
+Tests for the migration of the legacy Job tables into the Job table keyed by node
+"""
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from scrapydash.jobs_migrate import get_legacy_tablename, migrate_legacy_jobs_tables
+from scrapydash.models import Job
+
+
+def make_legacy_table(engine, tablename, jobs):
+    with engine.begin() as conn:
+        conn.execute(text('CREATE TABLE "%s" (id INTEGER PRIMARY KEY, project VARCHAR(255), spider VARCHAR(255), '
+                          'job VARCHAR(255), status VARCHAR(1), deleted VARCHAR(1), create_time DATETIME, '
+                          'update_time DATETIME, pages INTEGER, items INTEGER, pid INTEGER, start DATETIME, '
+                          'runtime VARCHAR(20), finish DATETIME, href_log TEXT, href_items TEXT)' % tablename))
+        for job in jobs:
+            conn.execute(text('INSERT INTO "%s" (project, spider, job, status, deleted, create_time, update_time) '
+                              "VALUES ('demo', 'test', :job, '2', '0', '2026-01-01 00:00:00', '2026-01-01 00:00:00')"
+                              % tablename), dict(job=job))
+
+
+def test_get_legacy_tablename():
+    """Test that auth and group are dropped, as in the table names of the old releases"""
+    assert get_legacy_tablename('127.0.0.1:6800') == '127_0_0_1_6800'
+    assert get_legacy_tablename('admin:pw@127.0.0.1:6801#group') == '127_0_0_1_6801'
+
+
+def test_migrate_legacy_jobs_tables():
+    """Test that the rows of each legacy table are copied under its node, and that a rerun is a no-op"""
+    engine = create_engine('sqlite://', connect_args=dict(check_same_thread=False), poolclass=StaticPool)
+    make_legacy_table(engine, '127_0_0_1_6800', ['a', 'b'])
+    make_legacy_table(engine, '127_0_0_1_6801', ['a'])
+    servers = ['127.0.0.1:6800', 'admin:pw@127.0.0.1:6801#group', '127.0.0.1:6802']
+    assert migrate_legacy_jobs_tables(engine, servers) == {1: 2, 2: 1}
+
+    session = sessionmaker(bind=engine)()
+    assert sorted((job.node, job.job, job.status) for job in session.query(Job)) == [
+        (1, 'a', '2'), (1, 'b', '2'), (2, 'a', '2')]
+    session.close()
+    tablenames = set(inspect(engine).get_table_names())
+    assert {'127_0_0_1_6800_migrated', '127_0_0_1_6801_migrated'} <= tablenames
+    assert '127_0_0_1_6800' not in tablenames
+    assert migrate_legacy_jobs_tables(engine, servers) == {}
+
+
+def test_cluster_wide_query_uses_index():
+    """Test that a query across all nodes by spider and status is served by an index"""
+    engine = create_engine('sqlite://')
+    Job.__table__.create(engine)
+    with engine.connect() as conn:
+        plan = conn.exec_driver_sql("EXPLAIN QUERY PLAN SELECT * FROM job WHERE project = 'demo' "
+                                    "AND spider = 'test' AND status = '1'").fetchall()
+    assert 'ix_job_project_spider_status' in str(plan)
@@ -0,0 +1,167 @@
+# coding: utf-8
+"""
+Tests for the cluster-wide job search and the aggregation of jobs via JobRollup
+"""
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from scrapydash.app import create_app
+from scrapydash.jobs_migrate import backfill_job_rollups
+from scrapydash.jobs_sync import rebuild_job_rollups, sync_jobs
+from scrapydash.models import Job, JobRollup, get_session
+
+
+def make_job(job, start='', finish='', spider='test'):
+    return dict(project='demo', spider=spider, job=job, pid='1' if start else '', start=start, runtime='',
+                finish=finish, href_log='', href_items='')
+
+
+def make_stats(**items):
+    return dict(demo=dict((spider, dict((job, dict(pages=10, items=count)) for job, count in jobs.items()))
+                          for spider, jobs in items.items()))
+
+
+def make_engine():
+    engine = create_engine('sqlite://', connect_args=dict(check_same_thread=False), poolclass=StaticPool)
+    for model in (Job, JobRollup):
+        model.__table__.create(engine)
+    return engine
+
+
+def sync_cluster(session):
+    node_1 = [make_job('a', '2026-01-01 08:10:00'),
+              make_job('b', '2026-01-01 08:00:00', '2026-01-01 08:30:00'),
+              make_job('c', '2026-01-01 09:00:00', '2026-01-01 09:15:00')]
+    sync_jobs(session, 1, node_1, make_stats(test=dict(a=1, b=7, c=0)))
+    node_2 = [make_job('d', '2026-01-01 08:40:00', '2026-01-01 08:45:00', spider='other')]
+    sync_jobs(session, 2, node_2, make_stats(other=dict(d=5)))
+    return node_1, node_2
+
+
+def get_rollups(session):
+    return sorted((r.node, r.spider, str(r.hour), r.jobs, r.pages, r.items, r.runtime, r.max_runtime)
+                  for r in session.query(JobRollup))
+
+
+def test_rollups_maintained_by_sync():
+    """Test that the rollups follow the jobs finishing, without counting a job twice on a resync"""
+    session = sessionmaker(bind=make_engine())()
+    node_1, __ = sync_cluster(session)
+    expected = [(1, 'test', '2026-01-01 08:00:00', 1, 10, 7, 1800, 1800),
+                (1, 'test', '2026-01-01 09:00:00', 1, 10, 0, 900, 900),
+                (2, 'other', '2026-01-01 08:00:00', 1, 10, 5, 300, 300)]
+    assert get_rollups(session) == expected
+
+    sync_jobs(session, 1, node_1, make_stats(test=dict(a=1, b=7, c=0)))
+    assert get_rollups(session) == expected
+
+    node_1[0]['finish'] = '2026-01-01 09:20:00'
+    sync_jobs(session, 1, node_1, make_stats(test=dict(a=3, b=7, c=0)))
+    expected[1] = (1, 'test', '2026-01-01 09:00:00', 2, 20, 3, 900 + 4200, 4200)
+    assert get_rollups(session) == expected
+
+    assert rebuild_job_rollups(session) == 3
+    assert get_rollups(session) == expected
+
+
+def test_backfill_job_rollups():
+    """Test that the rollups of the existing jobs are built once on startup"""
+    engine = make_engine()
+    session = sessionmaker(bind=engine)()
+    sync_cluster(session)
+    expected = get_rollups(session)
+    session.query(JobRollup).delete()
+    session.commit()
+    assert backfill_job_rollups(engine) == 3
+    assert get_rollups(session) == expected
+    assert backfill_job_rollups(engine) == 0
+
+
+def make_client():
+    engine = make_engine()
+    Session = sessionmaker(bind=engine)
+    session = Session()
+    sync_cluster(session)
+    session.close()
+
+    def override_get_session():
+        session = Session()
+        try:
+            yield session
+        finally:
+            session.close()
+
+    app = create_app()
+    app.state.config['SCRAPYD_SERVERS'] = ['127.0.0.1:6800', '127.0.0.1:6801']
+    app.dependency_overrides[get_session] = override_get_session
+    return TestClient(app)
+
+
+def test_search_jobs():
+    """Test filters and sorts of the job search across nodes"""
+    client = make_client()
+
+    def search(**params):
+        js = client.get('/api/jobs/search', params=params).json()
+        return [(item['node'], item['job']) for item in js['items']]
+
+    items = client.get('/api/jobs/search').json()['items']
+    assert sorted(item['job'] for item in items) == ['a', 'b', 'c', 'd']
+    assert [item['id'] for item in items] == sorted([item['id'] for item in items], reverse=True)
+    assert search(status='running', sort='start') == [(1, 'a')]
+    assert search(status='finished', sort='finish') == [(1, 'c'), (2, 'd'), (1, 'b')]
+    assert search(status='finished', max_items=0) == [(1, 'c')]
+    assert search(since='2026-01-01T08:40:00', until='2026-01-01T09:00:00') == [(2, 'd')]
+    assert search(since='2026-01-01T08:05:00', time_field='start', sort='start') == [(1, 'a'), (2, 'd'), (1, 'c')]
+    assert search(spider='test', status='0,1') == [(1, 'a')]
+    assert search(nodes='2') == [(2, 'd')]
+
+    js = client.get('/api/jobs/search', params=dict(sort='finish', limit=2)).json()
+    assert [item['job'] for item in js['items']] == ['c', 'd']
+    js = client.get('/api/jobs/search', params=dict(sort='finish', limit=2, cursor=js['next_cursor'])).json()
+    assert [item['job'] for item in js['items']] == ['b'] and js['next_cursor'] is None
+
+    assert client.get('/api/jobs/search', params=dict(status='failed')).status_code == 400
+    assert client.get('/api/jobs/search', params=dict(sort='pid')).status_code == 400
+    assert client.get('/api/jobs/search', params=dict(nodes='3')).status_code == 404
+
+
+def test_job_stats():
+    """Test the aggregation of the rollups by node, spider and time"""
+    client = make_client()
+
+    def stats(**params):
+        js = client.get('/api/jobs/stats', params=params)
+        assert js.status_code == 200, js.text
+        return js.json()['items']
+
+    assert stats() == [dict(jobs=3, pages=30, items=12, runtime=3000, max_runtime=1800)]
+    assert stats(group_by='spider,day') == [
+        dict(spider='other', day='2026-01-01', jobs=1, pages=10, items=5, runtime=300, max_runtime=300),
+        dict(spider='test', day='2026-01-01', jobs=2, pages=20, items=7, runtime=2700, max_runtime=1800)]
+    assert [(item['node'], item['hour'], item['items']) for item in stats(group_by=['node', 'hour'])] == [
+        (1, '2026-01-01 08:00:00', 7), (1, '2026-01-01 09:00:00', 0), (2, '2026-01-01 08:00:00', 5)]
+    assert [item['spider'] for item in stats(group_by='spider', order_by='items')] == ['test', 'other']
+    assert stats(since='2026-01-01T09:30:00') == [dict(jobs=1, pages=10, items=0, runtime=900, max_runtime=900)]
+    assert stats(until='2026-01-01T08:00:00') == []
+    assert stats(group_by='node', nodes='2')[0]['node'] == 2
+
+    assert client.get('/api/jobs/stats', params=dict(group_by='status')).status_code == 400
+    assert client.get('/api/jobs/stats', params=dict(order_by='node')).status_code == 400
+
+
+def test_indexes():
+    """Test that the search by spider and time and the aggregation by day are served by indexes"""
+    engine = make_engine()
+    with engine.connect() as conn:
+        plan = conn.exec_driver_sql(
+            "EXPLAIN QUERY PLAN SELECT * FROM job WHERE deleted = '0' AND project = 'demo' AND spider = 'test' "
+            "AND finish >= '2026-01-01 08:00:00' ORDER BY finish DESC, id DESC LIMIT 101").fetchall()
+        assert 'ix_job_project_spider_finish' in str(plan)
+        assert 'TEMP B-TREE' not in str(plan)
+        plan = conn.exec_driver_sql(
+            "EXPLAIN QUERY PLAN SELECT spider, day, sum(items) FROM job_rollup "
+            "WHERE hour >= '2026-01-01 00:00:00' GROUP BY spider, day").fetchall()
+        assert 'ix_job_rollup_hour' in str(plan)
@@ -0,0 +1,82 @@
+# coding: utf-8
+"""
+Tests for the background jobs snapshot worker
+"""
+import asyncio
+
+import httpx
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from scrapydash.app import create_app
+from scrapydash.jobs_snapshot import JobsSnapshotWorker
+from scrapydash.models import Job
+from scrapydash.scrapyd_client import ScrapydClient
+
+
+LISTJOBS = dict(
+    status='ok', pending=[],
+    running=[dict(project='demo', spider='test', id='running_job', pid=123, start_time='2026-01-01 00:00:00.1')],
+    finished=[dict(project='demo', spider='test', id='finished_job', start_time='2026-01-01 00:00:00.1',
+                   end_time='2026-01-01 00:01:00.1', log_url='/logs/demo/test/finished_job.log')],
+)
+CONFIG = dict(SCRAPYD_SERVERS=['127.0.0.1:6800', '127.0.0.1:6801'], SCRAPYD_SERVERS_AUTHS=[None, None],
+              JOBS_SNAPSHOT_INTERVAL=300)
+
+
+def handler(request):
+    if request.url.port == 6801:
+        raise httpx.ConnectError('refused', request=request)
+    return httpx.Response(200, json=LISTJOBS)
+
+
+def make_worker(**kwargs):
+    engine = create_engine('sqlite://', connect_args=dict(check_same_thread=False), poolclass=StaticPool)
+    config = dict(CONFIG, **kwargs)
+    client = ScrapydClient(config, transport=httpx.MockTransport(handler))
+    return JobsSnapshotWorker(config, client, session_factory=sessionmaker(bind=engine)), engine
+
+
+def test_sync_node():
+    """Test that a sync persists the jobs of a node and records its freshness"""
+    worker, engine = make_worker()
+    freshness = asyncio.run(worker.sync_node(1))
+    assert freshness['ok'] and freshness['jobs'] == 2 and freshness['added'] == 2
+    assert freshness['server'] == '127.0.0.1:6800' and freshness['last_sync']
+    session = sessionmaker(bind=engine)()
+    assert sorted((record.node, record.job) for record in session.query(Job)) == [
+        (1, 'finished_job'), (1, 'running_job')]
+
+    try:
+        asyncio.run(worker.sync_node(2))
+    except httpx.ConnectError:
+        pass
+    status = worker.get_freshness()
+    assert status['nodes'][2]['ok'] is False and status['nodes'][2]['last_sync'] is None
+    assert status['nodes'][1]['age'] >= 0
+
+
+def test_start_and_stop():
+    """Test that each node is synced by its own task, until stopped"""
+    worker, __ = make_worker(JOBS_SNAPSHOT_INTERVAL=1)
+
+    async def run():
+        worker.start()
+        await asyncio.sleep(0.3)  # The first round is delayed by up to 10% of the interval
+        assert worker.get_freshness()['running']
+        await worker.stop()
+
+    asyncio.run(run())
+    nodes = worker.get_freshness()['nodes']
+    assert nodes[1]['ok'] and nodes[2]['ok'] is False
+    assert not worker.get_freshness()['running']
+
+
+def test_jobs_snapshot_endpoint():
+    """Test the freshness endpoint without lifespan"""
+    client = TestClient(create_app())
+    js = client.get('/api/jobs/snapshot').json()
+    assert js['status'] == 'ok' and js['running'] is False
+    assert sorted(js['nodes']) == ['1', '2', '3']
@@ -0,0 +1,108 @@
+# coding: utf-8
+"""
+Tests for the bulk sync of jobs into the Job table
+"""
+from sqlalchemy import create_engine, event
+from sqlalchemy.dialects import mysql, postgresql
+from sqlalchemy.orm import sessionmaker
+
+from scrapydash.jobs_sync import (DELETED, STATUS_FINISHED, STATUS_RUNNING, build_upsert, sync_jobs,
+                                  sync_jobs_delta)
+from scrapydash.models import Job, JobRollup
+from scrapydash.utils.jobs_ingest import JobsIngestor
+
+
+def make_session():
+    engine = create_engine('sqlite://')
+    Job.__table__.create(engine)
+    JobRollup.__table__.create(engine)
+    statements = []
+    event.listen(engine, 'before_cursor_execute',
+                 lambda conn, cursor, statement, *args: statements.append(statement))
+    return sessionmaker(bind=engine)(), statements
+
+
+def make_job(job, start='', finish='', pid=''):
+    return dict(project='demo', spider='test', job=job, pid=pid, start=start, runtime='', finish=finish,
+                href_log="<a href='/logs/demo/test/%s.log'>Log</a>" % job if start else '', href_items='')
+
+
+def test_sync_jobs():
+    """Test insert, update and deletion of stale pending jobs"""
+    session, __ = make_session()
+    stats = sync_jobs(session, 1, [make_job('a'), make_job('b'), make_job('c', '2026-01-01 00:00:00', pid='1')])
+    assert (stats['inserted'], stats['updated'], stats['deleted']) == (3, 0, 0)
+
+    # Pending, running, finished, like the Jobs page of Scrapyd
+    jobs = [make_job('b'), make_job('a', '2026-01-01 00:02:00', pid='2'),
+            make_job('c', '2026-01-01 00:00:00', '2026-01-01 00:01:00')]
+    stats = sync_jobs(session, 1, jobs, {'demo': {'test': {'c': dict(pages=10, items=20)}}})
+    assert (stats['inserted'], stats['updated'], stats['deleted']) == (0, 3, 0)
+    records = dict((record.job, record) for record in session.query(Job))
+    assert records['a'].status == STATUS_RUNNING and records['a'].pid == 2
+    assert records['c'].status == STATUS_FINISHED and (records['c'].pages, records['c'].items) == (10, 20)
+    assert records['c'].href_log == '/logs/demo/test/c.log'
+
+    stats = sync_jobs(session, 1, jobs[1:])  # b has been cancelled
+    assert stats['deleted'] == 1
+    assert sorted(record.job for record in session.query(Job)) == ['a', 'c']
+    # pages and items are kept if liststats_datas is not available
+    assert session.query(Job).filter_by(job='c').one().items == 20
+
+
+def test_deleted_jobs():
+    """Test that a deleted finished job is ignored unless it has been run again"""
+    session, __ = make_session()
+    finished = make_job('a', '2026-01-01 00:00:00', '2026-01-01 00:01:00')
+    sync_jobs(session, 1, [finished])
+    session.query(Job).update(dict(deleted=DELETED))
+    session.commit()
+    assert sync_jobs(session, 1, [finished])['ignored'] == 1
+    assert sync_jobs(session, 1, [make_job('a', '2026-01-02 00:00:00', pid='1')])['recovered'] == 1
+    assert session.query(Job).one().deleted == '0'
+
+
+def test_one_transaction_for_large_snapshot():
+    """Test that the number of statements does not grow with the number of jobs"""
+    session, statements = make_session()
+    jobs = [make_job('job_%s' % i, '2026-01-01 00:00:00', '2026-01-01 00:01:00') for i in range(5000)]
+    sync_jobs(session, 1, jobs)
+    statements.clear()
+    sync_jobs(session, 1, jobs)
+    # 10 chunked SELECT for existing keys, 1 executemany upsert, 1 SELECT of pending jobs
+    assert len(statements) <= 15
+    assert session.query(Job).count() == 5000
+
+
+def test_dialect_native_upsert():
+    """Test the upsert statement of each dialect"""
+    columns = ['node', 'project', 'spider', 'job', 'status', 'create_time']
+    sql = str(build_upsert('postgresql', columns).compile(dialect=postgresql.dialect()))
+    assert 'ON CONFLICT (node, project, spider, job) DO UPDATE' in sql
+    assert 'create_time = excluded.create_time' not in sql and 'node = excluded.node' not in sql
+    sql = str(build_upsert('mysql', columns).compile(dialect=mysql.dialect()))
+    assert 'ON DUPLICATE KEY UPDATE' in sql
+    assert build_upsert('oracle', columns) is None
+
+
+def test_sync_jobs_delta():
+    """Test that only the delta of a JobsIngestor is written"""
+    session, statements = make_session()
+    ingestor = JobsIngestor(None)
+    jobs = [make_job('a'), make_job('b', '2026-01-01 00:00:00', '2026-01-01 00:01:00')]
+    assert sync_jobs_delta(session, ingestor.diff(1, jobs))['inserted'] == 2
+    statements.clear()
+    assert sync_jobs_delta(session, ingestor.diff(1, jobs))['inserted'] == 0
+    assert statements == []
+    stats = sync_jobs_delta(session, ingestor.diff(1, jobs[1:]))
+    assert stats['deleted'] == 1
+    assert [record.job for record in session.query(Job)] == ['b']
+
+
+def test_jobs_of_nodes_kept_apart():
+    """Test that the same job on two nodes makes two rows, and a snapshot only touches its own node"""
+    session, __ = make_session()
+    sync_jobs(session, 1, [make_job('a'), make_job('b', '2026-01-01 00:00:00', pid='1')])
+    sync_jobs(session, 2, [make_job('a')])
+    assert sync_jobs(session, 2, [])['deleted'] == 1
+    assert sorted((record.node, record.job) for record in session.query(Job)) == [(1, 'a'), (1, 'b')]
@@ -0,0 +1,179 @@
+# coding: utf-8
+"""
+Tests for streaming byte ranges and tails of Scrapy logfiles
+"""
+import asyncio
+
+from fastapi.testclient import TestClient
+import httpx
+
+from scrapydash.app import create_app
+from scrapydash.log_reader import (CHUNK_SIZE, LocalLog, RemoteLog, find_tail_offset, open_log,
+                                   parse_range_header, resolved_urls, stream_log)
+from scrapydash.scrapyd_client import ScrapydClient
+
+
+LOG = b''.join(b'2026-01-01 00:00:00 [scrapy] INFO: line %d\n' % i for i in range(50000))  # About 2 MB
+
+
+def make_scrapyd(body=LOG, support_range=True, requests=None):
+    """Serve body at /logs/demo/test/job.log like the static files of Scrapyd"""
+    def handler(request):
+        if requests is not None:
+            requests.append((request.method, request.url.path, request.headers.get('range')))
+        if not request.url.path.endswith('/job.log'):
+            return httpx.Response(404)
+        if request.method == 'HEAD':
+            return httpx.Response(200, headers={'Content-Length': str(len(body))})
+        range_header = request.headers.get('range')
+        if support_range and range_header:
+            start, end = parse_range_header(range_header, len(body))
+            return httpx.Response(206, content=body[start:end],
+                                  headers={'Content-Range': 'bytes %s-%s/%s' % (start, end - 1, len(body))})
+        return httpx.Response(200, content=body)
+    return handler
+
+
+async def collect(chunks):
+    return b''.join([chunk async for chunk in chunks])
+
+
+def test_find_tail_offset():
+    """Test that a trailing newline does not count as a line"""
+    assert find_tail_offset(b'a\nb\nc\n', 2) == 2
+    assert find_tail_offset(b'a\nb\nc', 1) == 4
+    assert find_tail_offset(b'a\nb\nc\n', 3) is None
+    assert parse_range_header('bytes=-4', 10) == (6, 10)
+    assert parse_range_header('bytes=2-', 10) == (2, 10)
+    assert parse_range_header('bytes=2-100', 10) == (2, 10)
+
+
+def test_local_log(tmp_path):
+    """Test the tail and ranges of a local logfile, read in chunks"""
+    path = tmp_path / 'job.log'
+    path.write_bytes(LOG)
+    log = LocalLog(str(path))
+
+    async def main():
+        offset = await log.tail_offset(2)
+        assert LOG[offset:] == b''.join(LOG.splitlines(True)[-2:])
+        chunks = [chunk async for chunk in log.iter_range(10, len(LOG) - 10)]
+        assert max(len(chunk) for chunk in chunks) <= CHUNK_SIZE
+        assert b''.join(chunks) == LOG[10:-10]
+        assert await log.tail_offset(10 ** 6) == 0
+        assert await log.tail_offset(0) == len(LOG)
+
+    asyncio.run(main())
+
+
+def test_remote_log():
+    """Test that the tail is located with a small suffix range instead of downloading the whole logfile"""
+    requests = []
+    client = ScrapydClient(transport=httpx.MockTransport(make_scrapyd(requests=requests)))
+    log = RemoteLog(client, 'http://127.0.0.1:6800/logs/demo/test/job.log')
+
+    async def main():
+        offset = await log.tail_offset(3)
+        assert LOG[offset:] == b''.join(LOG.splitlines(True)[-3:])
+        assert await collect(log.iter_range(100, 200)) == LOG[100:200]
+
+    asyncio.run(main())
+    ranges = [r for method, path, r in requests if method == 'GET']
+    assert ranges == ['bytes=%s-%s' % (len(LOG) - 3 * 256, len(LOG) - 1), 'bytes=100-199']
+
+    # Lines longer than expected make the window grow
+    body = b'x' * 1000 + b'\n'
+    client = ScrapydClient(transport=httpx.MockTransport(make_scrapyd(body * 100)))
+    log = RemoteLog(client, 'http://127.0.0.1:6800/logs/demo/test/job.log')
+    assert asyncio.run(log.tail_offset(5)) == len(body) * 95
+
+    # Scrapyd servers which ignore Range
+    client = ScrapydClient(transport=httpx.MockTransport(make_scrapyd(support_range=False)))
+    log = RemoteLog(client, 'http://127.0.0.1:6800/logs/demo/test/job.log')
+    assert asyncio.run(collect(log.iter_range(100, 200))) == LOG[100:200]
+
+
+def test_open_log(tmp_path):
+    """Test that the local logfile is preferred, and that extensions are probed at once and remembered"""
+    requests = []
+    client = ScrapydClient(transport=httpx.MockTransport(make_scrapyd(requests=requests)))
+    config = dict(SCRAPYD_SERVERS=['127.0.0.1:6800', '127.0.0.1:6801'], SCRAPYD_LOG_EXTENSIONS=['.txt', '.log'],
+                  LOCAL_SCRAPYD_SERVER='127.0.0.1:6801', LOCAL_SCRAPYD_LOGS_DIR=str(tmp_path))
+    (tmp_path / 'demo' / 'test').mkdir(parents=True)
+    (tmp_path / 'demo' / 'test' / 'job.log').write_bytes(LOG)
+    resolved_urls.clear()
+
+    log = asyncio.run(open_log(client, config, 2, 'demo', 'test', 'job'))
+    assert isinstance(log, LocalLog) and log.path.endswith('job.log')
+    assert not requests
+    log = asyncio.run(open_log(client, config, 1, 'demo', 'test', 'job'))
+    assert log.url == 'http://127.0.0.1:6800/logs/demo/test/job.log'
+    assert sorted(path for __, path, __ in requests) == ['/logs/demo/test/job.log', '/logs/demo/test/job.txt']
+    asyncio.run(open_log(client, config, 1, 'demo', 'test', 'job'))
+    assert len(requests) == 2
+
+
+def test_follow(tmp_path):
+    """Test that the lines appended to a logfile are pushed until the browser disconnects"""
+    path = tmp_path / 'job.log'
+    path.write_bytes(b'a\n')
+    calls = []
+
+    async def is_disconnected():
+        calls.append(None)
+        return len(calls) > 3
+
+    async def main():
+        received = []
+        async for chunk in stream_log(LocalLog(str(path)), follow=True, interval=0.01, timeout=10,
+                                      is_disconnected=is_disconnected):
+            received.append(chunk)
+            if len(received) == 1:
+                with open(str(path), 'ab') as f:
+                    f.write(b'b\n')
+        return received
+
+    assert asyncio.run(main()) == [b'a\n', b'b\n']
+
+
+def test_log_stream_route():
+    """Test the last N lines and the Range requests of the route"""
+    app = create_app()
+    app.state.config.update(SCRAPYD_SERVERS=['127.0.0.1:6800'], SCRAPYD_SERVERS_AUTHS=[None],
+                            SCRAPYD_LOG_EXTENSIONS=['.log'])
+    app.state.scrapyd_client = ScrapydClient(transport=httpx.MockTransport(make_scrapyd()))
+    resolved_urls.clear()
+    client = TestClient(app)
+
+    r = client.get('/api/1/log/demo/test/job', params=dict(lines=2))
+    assert r.status_code == 200 and r.content == b''.join(LOG.splitlines(True)[-2:])
+    assert int(r.headers['x-log-offset']) == len(LOG) - len(r.content)
+    assert r.headers['x-log-source'] == 'http://127.0.0.1:6800/logs/demo/test/job.log'
+
+    r = client.get('/api/1/log/demo/test/job', headers=dict(Range='bytes=10-19'))
+    assert r.status_code == 206 and r.content == LOG[10:20]
+    assert r.headers['content-range'] == 'bytes 10-19/%s' % len(LOG)
+    assert client.get('/api/1/log/demo/test/job', headers=dict(Range='bytes=%s-' % len(LOG))).status_code == 416
+    assert client.get('/api/1/log/demo/test/job').content == LOG
+    assert client.get('/api/1/log/demo/test/other').status_code == 404
+    assert client.get('/api/9/log/demo/test/job').status_code == 404
+
+
+def test_log_path_traversal(tmp_path):
+    """Test that project, spider and job like '..' never lead outside LOCAL_SCRAPYD_LOGS_DIR"""
+    logs_dir = tmp_path / 'a' / 'b' / 'logs'
+    logs_dir.mkdir(parents=True)
+    (tmp_path / 'a' / 'secret.txt').write_bytes(b'secret')
+    requests = []
+    app = create_app()
+    app.state.config.update(SCRAPYD_SERVERS=['127.0.0.1:6800'], SCRAPYD_SERVERS_AUTHS=[None],
+                            LOCAL_SCRAPYD_SERVER='127.0.0.1:6800', LOCAL_SCRAPYD_LOGS_DIR=str(logs_dir))
+    app.state.scrapyd_client = ScrapydClient(transport=httpx.MockTransport(make_scrapyd(requests=requests)))
+    client = TestClient(app)
+    for url in ['/api/1/log/%2e%2e/%2e%2e/secret.txt?with_ext=true', '/api/1/log/demo/%2e%2e/..%2Fsecret.txt',
+                '/api/1/log/demo/test/..%5C..%5Csecret.txt?with_ext=true']:
+        r = client.get(url)
+        assert r.status_code == 404 and r.content != b'secret'
+    app.state.config.update(LOCAL_SCRAPYD_LOGS_DIR='')
+    assert client.get('/api/1/log/%2e%2e/%2e%2e/secret.txt?with_ext=true').status_code == 404
+    assert not requests
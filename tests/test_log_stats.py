@@ -0,0 +1,157 @@
+# coding: utf-8
+"""
+Tests for the incremental parsing of Scrapy logfiles with checkpoints
+"""
+import asyncio
+import json
+
+from fastapi.testclient import TestClient
+import httpx
+from logparser import parse
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from scrapydash import log_stats
+from scrapydash.app import create_app
+from scrapydash.log_reader import LocalLog, parse_range_header, resolved_urls
+from scrapydash.log_stats import LogStatsEngine, find_parsable_size
+from scrapydash.report_store import ReportStore
+from scrapydash.scrapyd_client import ScrapydClient
+
+
+ENDING = """2026-01-01 00:59:00 [scrapy.core.engine] INFO: Closing spider (finished)
+2026-01-01 00:59:00 [scrapy.statscollectors] INFO: Dumping Scrapy stats:
+{'downloader/response_status_count/200': %(pages)s,
+ 'finish_reason': 'finished',
+ 'item_scraped_count': %(items)s,
+ 'log_count/ERROR': %(count)s,
+ 'log_count/WARNING': %(count)s,
+ 'response_received_count': %(pages)s}
+2026-01-01 00:59:00 [scrapy.core.engine] INFO: Spider closed (finished)
+"""
+
+
+def make_log(first, last, ending=False):
+    """The lines of the minutes in [first, last), each with a traceback at the end"""
+    lines = []
+    if first == 0:
+        lines.append('2026-01-01 00:00:00 [scrapy.utils.log] INFO: Scrapy 2.11.0 started (bot: demo)')
+    for i in range(max(first, 1), last):
+        t = '2026-01-01 00:%02d:00' % i
+        lines.append('%s [scrapy.extensions.logstats] INFO: Crawled %d pages (at 10 pages/min), '
+                     'scraped %d items (at 5 items/min)' % (t, i * 10, i * 5))
+        lines.append('%s [test] WARNING: warning %d' % (t, i))
+        lines.append('%s [scrapy.core.scraper] ERROR: Spider error processing <GET http://demo/%d>\n'
+                     'Traceback (most recent call last):\n  File "demo.py", line 1\nValueError: %d' % (t, i, i))
+    text = '\n'.join(lines) + '\n'
+    if ending:
+        text += ENDING % dict(pages=(last - 1) * 10, items=(last - 1) * 5, count=last - 1)
+    return text.encode('utf-8')
+
+
+class CountingLog(LocalLog):
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.bytes_read = 0
+
+    async def iter_range(self, start=0, end=None):
+        async for chunk in super().iter_range(start, end):
+            self.bytes_read += len(chunk)
+            yield chunk
+
+
+def summarize(stats):
+    summary = dict((k, stats[k]) for k in ['pages', 'items', 'first_log_time', 'latest_log_time', 'runtime',
+                                           'finish_reason'])
+    summary.update((k, v['count']) for k, v in stats['log_categories'].items())
+    return summary
+
+
+def test_find_parsable_size():
+    """Test that the last record is kept for the next round until the log ending is found"""
+    buf = make_log(0, 3)
+    size = find_parsable_size(buf)
+    assert buf[size:].startswith(b'2026-01-01 00:02:00 [scrapy.core.scraper] ERROR')
+    assert find_parsable_size(buf[:size] + b'2026-01-01 00:02:00 [test] INFO: incomplete') == size
+    assert find_parsable_size(buf, final=True) == len(buf)
+    buf = make_log(0, 3, ending=True)
+    assert find_parsable_size(buf) == len(buf)
+
+
+def test_incremental_stats(tmp_path, monkeypatch):
+    """Test that each request only reads the appended bytes, and ends up with the stats of a full parse"""
+    # Blocks smaller than a round to merge several blocks per round as well
+    monkeypatch.setattr(log_stats, 'PARSE_CHUNK_SIZE', 1024)
+    path = tmp_path / 'job.log'
+    path.write_bytes(make_log(0, 20))
+    checkpoint_path = str(tmp_path / 'stats' / 'job.checkpoint.json')
+    engine = LogStatsEngine(str(tmp_path / 'stats'))
+
+    log = CountingLog(str(path))
+    stats = asyncio.run(engine.get_stats(log, checkpoint_path))
+    assert (stats['pages'], stats['items'], stats['log_categories']['error_logs']['count']) == (190, 95, 18)
+    position = json.loads(open(checkpoint_path).read())['position']
+    assert log.bytes_read == path.stat().st_size and position < path.stat().st_size
+
+    with open(str(path), 'ab') as f:
+        f.write(make_log(20, 40))
+    log = CountingLog(str(path))
+    stats = asyncio.run(engine.get_stats(log, checkpoint_path))
+    assert log.bytes_read == path.stat().st_size - position
+    assert (stats['pages'], stats['log_categories']['error_logs']['count']) == (390, 38)
+
+    with open(str(path), 'ab') as f:
+        f.write(make_log(40, 50, ending=True))
+    stats = asyncio.run(engine.get_stats(LocalLog(str(path)), checkpoint_path))
+    expected = parse(path.read_text())
+    assert summarize(stats) == summarize(expected)
+    assert stats['tail'].split('\n')[-1] == expected['tail'].split('\n')[-1]
+
+    # A new process resumes from the checkpoint without reading the logfile
+    log = CountingLog(str(path))
+    assert summarize(asyncio.run(LogStatsEngine(str(tmp_path / 'stats')).get_stats(log, checkpoint_path))) == \
+        summarize(expected)
+    assert log.bytes_read == 0
+
+    # A logfile which has been replaced is parsed again
+    path.write_bytes(make_log(0, 5))
+    stats = asyncio.run(engine.get_stats(LocalLog(str(path)), checkpoint_path, final=True))
+    assert (stats['pages'], stats['log_categories']['error_logs']['count']) == (40, 4)
+
+
+def test_log_stats_route(tmp_path):
+    """Test that the requests of the poll subprocess only fetch the appended bytes from Scrapyd"""
+    body = [make_log(0, 10)]
+    ranges = []
+
+    def handler(request):
+        if not request.url.path.endswith('/job.log'):
+            return httpx.Response(404)
+        if request.method == 'HEAD':
+            return httpx.Response(200, headers={'Content-Length': str(len(body[0]))})
+        ranges.append(request.headers.get('range'))
+        start, end = parse_range_header(request.headers['range'], len(body[0]))
+        return httpx.Response(206, content=body[0][start:end])
+
+    app = create_app()
+    app.state.config.update(SCRAPYD_SERVERS=['127.0.0.1:6800'], SCRAPYD_SERVERS_AUTHS=[None],
+                            SCRAPYD_LOG_EXTENSIONS=['.log'])
+    app.state.scrapyd_client = ScrapydClient(transport=httpx.MockTransport(handler))
+    app.state.log_stats_engine = LogStatsEngine(str(tmp_path))
+    engine = create_engine('sqlite://', connect_args=dict(check_same_thread=False), poolclass=StaticPool)
+    app.state.report_store = ReportStore(sessionmaker(bind=engine))
+    resolved_urls.clear()
+    client = TestClient(app)
+
+    js = client.post('/api/1/log/demo/test/job/stats', params=dict(job_finished='false')).json()
+    assert js['pages'] == 90 and js['source'] == 'http://127.0.0.1:6800/logs/demo/test/job.log'
+    checkpoint = json.loads((tmp_path / '127_0_0_1_6800' / 'demo' / 'test' / 'job.checkpoint.json').read_text())
+    body[0] += make_log(10, 12, ending=True)
+    js = client.post('/api/1/log/demo/test/job/stats', params=dict(job_finished='true')).json()
+    assert js['pages'] == 110 and js['finish_reason'] == 'finished'
+    assert app.state.report_store.get(1, 'demo', 'test', 'job')['pages'] == 110
+    assert ranges == ['bytes=0-%s' % (len(make_log(0, 10)) - 1),
+                      'bytes=%s-%s' % (checkpoint['position'], len(body[0]) - 1)]
+    assert client.get('/api/1/log/demo/test/other/stats').status_code == 404
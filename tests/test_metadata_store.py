@@ -0,0 +1,84 @@
+# coding: utf-8
+"""
+Tests for serving metadata from memory with write-behind persistence
+"""
+import asyncio
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from scrapydash.__version__ import __version__
+from scrapydash.metadata_store import MetadataStore
+from scrapydash.models import Metadata
+
+
+def make_session_factory():
+    engine = create_engine('sqlite://', connect_args=dict(check_same_thread=False), poolclass=StaticPool)
+    statements = []
+    event.listen(engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+    return sessionmaker(bind=engine), statements
+
+
+def get_row(Session):
+    session = Session()
+    try:
+        return session.query(Metadata).filter_by(version=__version__).first()
+    finally:
+        session.close()
+
+
+def test_reads_from_memory():
+    """Test that only the first read hits the database"""
+    Session, statements = make_session_factory()
+    store = MetadataStore(Session)
+    store.set('main_pid', 233)
+    assert get_row(Session).main_pid == 233  # Written at once without a running sync task
+    store = MetadataStore(Session)
+    assert store.get('main_pid') == 233
+    del statements[:]
+    for __ in range(10):
+        assert store.get_all()['main_pid'] == 233
+    assert statements == []
+
+
+def test_write_behind():
+    """Test that writes are coalesced until the next sync, and flushed on stop"""
+    Session, statements = make_session_factory()
+    store = MetadataStore(Session, interval=60)
+
+    async def main():
+        store.start()
+        await asyncio.sleep(0.1)
+        del statements[:]
+        for pid in range(10):
+            store.set('poll_pid', pid)
+        store.set('scheduler_state', 2)
+        assert store.get('poll_pid') == 9
+        assert statements == []
+        await store.stop()
+
+    asyncio.run(main())
+    assert not store.running
+    assert len([s for s in statements if s.startswith('INSERT') or s.startswith('UPDATE')]) == 1
+    row = get_row(Session)
+    assert (row.poll_pid, row.scheduler_state) == (9, 2)
+
+
+def test_sync_picks_up_other_workers():
+    """Test that sync() flushes local writes and reloads those of another worker"""
+    Session, __ = make_session_factory()
+    store_a = MetadataStore(Session)
+    store_b = MetadataStore(Session)
+    store_a.set('main_pid', 1)
+    assert store_b.get('main_pid') == 1
+    store_a._task = store_b._task = object()  # As if the sync tasks were running
+    store_a.set('logparser_pid', 2)
+    store_b.set('scheduler_state', 2)
+    assert store_a.get('scheduler_state') != 2
+    store_b.sync()
+    store_a.sync()
+    store_b.sync()
+    assert store_a.get('scheduler_state') == 2
+    assert store_b.get('logparser_pid') == 2
+    assert get_row(Session).logparser_pid == 2
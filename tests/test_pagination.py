@@ -0,0 +1,127 @@
+# coding: utf-8
+"""
+Tests for the keyset pagination of jobs and timer tasks
+"""
+from datetime import datetime, timedelta
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from scrapydash.app import create_app
+from scrapydash.models import Job, Task, TaskJobResult, TaskResult, ensure_table, get_session
+from scrapydash.pagination import decode_cursor, encode_cursor
+from scrapydash.task_summary import get_task_scheduler
+
+
+def make_client():
+    engine = create_engine('sqlite://', connect_args=dict(check_same_thread=False), poolclass=StaticPool)
+    Session = sessionmaker(bind=engine)
+
+    def override_get_session():
+        session = Session()
+        try:
+            yield session
+        finally:
+            session.close()
+
+    app = create_app()
+    app.dependency_overrides[get_session] = override_get_session
+    app.dependency_overrides[get_task_scheduler] = lambda: None
+    return TestClient(app), Session
+
+
+def fetch_all(client, url, limit):
+    items, cursor, pages = [], None, 0
+    while True:
+        js = client.get(url, params=dict(limit=limit, cursor=cursor) if cursor else dict(limit=limit)).json()
+        items.extend(js['items'])
+        pages += 1
+        cursor = js['next_cursor']
+        if not cursor:
+            return items, pages
+
+
+def test_cursor():
+    """Test that cursors round-trip and are bound to their listing"""
+    values = [1, datetime(2026, 1, 1, 12, 30), None, 'x']
+    assert decode_cursor('jobs', encode_cursor('jobs', values), 4) == values
+    for name, size in [('tasks', 4), ('jobs', 3)]:
+        try:
+            decode_cursor(name, encode_cursor('jobs', values), size)
+        except ValueError:
+            pass
+        else:
+            assert False, "Cursor should be invalid"
+
+
+def test_list_jobs():
+    """Test that paging through jobs gives the same order as the Jobs page"""
+    client, Session = make_client()
+    session = Session()
+    ensure_table(Job.__table__, session.get_bind(Job))
+    base = datetime(2026, 1, 1)
+    for i in range(5):  # Pending
+        session.add(Job(node=1, project='demo', spider='test', job='pending_%s' % i, status='0'))
+    for i in range(4):  # Running, some started at the same time
+        session.add(Job(node=1, project='demo', spider='test', job='running_%s' % i, status='1',
+                        start=base + timedelta(minutes=i // 2)))
+    for i in range(7):  # Finished
+        session.add(Job(node=1, project='demo', spider='test', job='finished_%s' % i, status='2',
+                        start=base, finish=base + timedelta(minutes=i % 3)))
+    session.add(Job(node=2, project='demo', spider='test', job='other_node', status='0'))
+    session.add(Job(node=1, project='demo', spider='test', job='deleted', status='2', deleted='1', start=base, finish=base))
+    session.commit()
+
+    expected = [job.job for job in session.query(Job).filter_by(node=1, deleted='0').order_by(
+        Job.status.asc(), Job.finish.desc(), Job.start.asc(), Job.id.asc())]
+    for limit in (1, 3, 100):
+        items, pages = fetch_all(client, '/api/1/jobs', limit)
+        assert [item['job'] for item in items] == expected
+        assert pages == -(-len(expected) // limit)  # No trailing empty page
+
+    assert client.get('/api/1/jobs', params=dict(cursor='invalid')).status_code == 400
+    assert client.get('/api/9/jobs').status_code == 404
+
+
+def test_list_tasks():
+    """Test tasks, task results and task job results"""
+    client, Session = make_client()
+    session = Session()
+    for model in (Task, TaskResult, TaskJobResult):
+        ensure_table(model.__table__, session.get_bind())
+    kwargs = dict(trigger='cron', project='demo', version='v1', spider='test', jobid='', settings_arguments='{}',
+                  selected_nodes='[1, 2]', year='*', month='*', day='*', week='*', day_of_week='*', hour='*',
+                  minute='0', second='0', jitter=0, coalesce='True', max_instances=1)
+    tasks = [Task(name='task_%s' % i, **kwargs) for i in range(5)]
+    session.add_all(tasks)
+    session.flush()
+    results = [TaskResult(task_id=tasks[0].id) for __ in range(4)]
+    session.add_all(results)
+    session.flush()
+    for node in (2, 1, 3):
+        session.add(TaskJobResult(task_result_id=results[0].id, node=node, server='127.0.0.1:680%s' % node,
+                                  status_code=200, status='ok', result='jobid'))
+    session.commit()
+
+    items, __ = fetch_all(client, '/api/tasks', 2)
+    assert [item['name'] for item in items] == ['task_%s' % i for i in range(4, -1, -1)]
+    assert [item['summary']['run_times'] for item in items] == [0, 0, 0, 0, 4]
+    items, __ = fetch_all(client, '/api/tasks/%s/results' % tasks[0].id, 3)
+    assert [item['id'] for item in items] == sorted([r.id for r in results], reverse=True)
+    items, __ = fetch_all(client, '/api/tasks/%s/results/%s/jobs' % (tasks[0].id, results[0].id), 2)
+    assert [item['node'] for item in items] == [1, 2, 3]
+    assert client.get('/api/tasks/%s/results/%s/jobs' % (tasks[1].id, results[0].id)).status_code == 404
+
+
+def test_keyset_index():
+    """Test that the listing of jobs can be served by the composite index"""
+    engine = create_engine('sqlite://')
+    ensure_table(Job.__table__, engine)
+    with engine.connect() as conn:
+        plan = conn.exec_driver_sql(
+            "EXPLAIN QUERY PLAN SELECT * FROM job WHERE node = 1 AND deleted = '0' "
+            "ORDER BY status, finish DESC, start, id LIMIT 101").fetchall()
+    assert 'ix_job_keyset' in str(plan)
+    assert 'TEMP B-TREE' not in str(plan)
@@ -0,0 +1,157 @@
+# coding: utf-8
+"""
+Tests for the poll subprocess used by Monitor & Alert
+"""
+import asyncio
+import os
+import time
+
+import httpx
+
+from scrapydash.utils.poll import NodeRateLimiter, Poll
+
+
+RUNNING_ROW = ("<tr><td>demo</td><td>test</td><td>running</td><td>123</td><td>2026-01-01 00:00:00</td><td>0:01:00</td>"
+               "<td></td><td><a href='/logs/demo/test/running.log'>Log</a></td></tr>")
+JOBS_HTML = """
+<h1>Jobs</h1>
+<table>
+<thead><tr><th>Project</th><th>Spider</th><th>Job</th><th>PID</th><th>Start</th><th>Runtime</th><th>Finish</th>
+<th>Log</th></tr></thead>
+%s
+</table>
+""" % (RUNNING_ROW + '\n%s')
+FINISHED_ROW = ("<tr><td>demo</td><td>test</td><td>%s</td><td></td><td>2026-01-01 00:00:00</td><td>0:01:00</td>"
+                "<td>2026-01-01 00:01:00</td><td><a href='/logs/demo/test/%s.log'>Log</a></td></tr>")
+
+
+def make_poll(handler, **kwargs):
+    params = dict(url_scrapydash='http://127.0.0.1:5000', username='', password='',
+                  scrapyd_servers=['127.0.0.1:6800', '127.0.0.1:6801'], scrapyd_servers_auths=[None, None],
+                  poll_round_interval=300, poll_request_interval=0, main_pid=os.getpid(), verbose=False,
+                  transport=httpx.MockTransport(handler))
+    params.update(kwargs)
+    return Poll(**params)
+
+
+def run_rounds(poll, rounds):
+    async def run():
+        poll.client = poll.ingestor.client = httpx.AsyncClient(transport=poll.transport)
+        try:
+            for __ in range(rounds):
+                await poll.run()
+        finally:
+            await poll.client.aclose()
+    asyncio.run(run())
+
+
+def test_finished_jobs():
+    """Test that finished jobs found in the first round are ignored, and new ones are fetched once"""
+    finished = ['old']
+    stats_requests = []
+
+    def handler(request):
+        if request.url.path == '/listjobs.json':  # Scrapyd < 1.3 requires the 'project' parameter
+            return httpx.Response(200, json={'status': 'error', 'message': "'project'"})
+        if request.url.path == '/jobs':
+            return httpx.Response(200, text=JOBS_HTML % ''.join(FINISHED_ROW % (job, job) for job in finished))
+        assert request.method == 'GET'
+        stats_requests.append((request.url.path.split('/')[2], request.url.path.split('/')[-2],
+                               request.url.params.get('job_finished')))
+        return httpx.Response(200, json={})
+
+    poll = make_poll(handler)
+    run_rounds(poll, 1)
+    assert poll.ignore_finished_bool_list == [False, False]
+    assert sorted(stats_requests) == [('1', 'running', 'false'), ('2', 'running', 'false')]
+    assert poll.finished_jobs_dict == {1: {('demo', 'test', 'old')}, 2: {('demo', 'test', 'old')}}
+
+    stats_requests.clear()
+    finished.append('new')
+    run_rounds(poll, 1)
+    assert sorted(stats_requests) == [('1', 'new', 'true'), ('1', 'running', 'false'),
+                                      ('2', 'new', 'true'), ('2', 'running', 'false')]
+    assert set(poll.round_timing['nodes']) == {1, 2}
+    assert all(timing['ok'] and timing['jobs'] == 2 for timing in poll.round_timing['nodes'].values())
+
+
+def test_retry_failed_stats():
+    """Test that a finished job is fetched again in the next round if fetch_stats failed"""
+    finished = []
+    fail = [True]
+
+    def handler(request):
+        if request.url.path == '/jobs':
+            return httpx.Response(200, text=JOBS_HTML % ''.join(FINISHED_ROW % (job, job) for job in finished))
+        if fail[0] and request.url.path.split('/')[-2] == 'new':
+            return httpx.Response(500)
+        return httpx.Response(200, json={})
+
+    poll = make_poll(handler, scrapyd_servers=['127.0.0.1:6800'], scrapyd_servers_auths=[None])
+    run_rounds(poll, 1)
+    finished.append('new')
+    run_rounds(poll, 1)
+    assert poll.finished_jobs_dict[1] == set()
+    fail[0] = False
+    run_rounds(poll, 1)
+    assert poll.finished_jobs_dict[1] == {('demo', 'test', 'new')}
+
+
+def test_jobs_delta():
+    """Test that a job is fetched as finished once it finishes, and that unchanged rounds fetch running jobs only"""
+    finished = [False]
+    stats_requests = []
+
+    def handler(request):
+        if request.url.path == '/listjobs.json':
+            return httpx.Response(404)
+        if request.url.path == '/jobs':
+            html = JOBS_HTML % ''
+            if finished[0]:
+                html = html.replace(RUNNING_ROW, FINISHED_ROW % ('running', 'running'))
+            return httpx.Response(200, text=html)
+        stats_requests.append((request.url.path.split('/')[-2], request.url.params.get('job_finished')))
+        return httpx.Response(200, json={})
+
+    poll = make_poll(handler, scrapyd_servers=['127.0.0.1:6800'], scrapyd_servers_auths=[None])
+    run_rounds(poll, 2)
+    assert stats_requests == [('running', 'false')] * 2
+    stats_requests.clear()
+    finished[0] = True
+    run_rounds(poll, 2)
+    assert stats_requests == [('running', 'true')]
+    assert poll.finished_jobs_dict[1] == {('demo', 'test', 'running')}
+
+
+def test_nodes_in_parallel():
+    """Test that a slow or unreachable node does not hold up the other nodes"""
+    async def handler(request):
+        if request.url.port == 6801:
+            raise httpx.ConnectError('refused', request=request)
+        await asyncio.sleep(0.2)
+        return httpx.Response(200, text=JOBS_HTML % '')
+
+    poll = make_poll(handler, scrapyd_servers=['127.0.0.1:6800', '127.0.0.1:6801', '127.0.0.1:6802'],
+                     scrapyd_servers_auths=[None] * 3)
+    run_rounds(poll, 1)
+    nodes = poll.round_timing['nodes']
+    assert [nodes[node]['ok'] for node in (1, 2, 3)] == [True, False, True]
+    # 3 requests per reachable node: listjobs.json, the Jobs page and stats of the running job
+    assert poll.round_timing['elapsed'] < 0.6 * 1.5
+
+
+def test_node_rate_limiter():
+    """Test that requests of a node are spaced by interval"""
+    async def run():
+        limiter = NodeRateLimiter(0.1)
+        starts = []
+
+        async def request():
+            async with limiter:
+                starts.append(time.monotonic())
+
+        await asyncio.gather(*[request() for __ in range(3)])
+        return starts
+
+    starts = asyncio.run(run())
+    assert all(b - a >= 0.09 for a, b in zip(starts, starts[1:]))
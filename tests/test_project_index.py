@@ -0,0 +1,85 @@
+# coding: utf-8
+"""
+Tests for the project index of the Deploy page
+"""
+import os
+import shutil
+import time
+
+from fastapi.testclient import TestClient
+
+from scrapydash.app import create_app
+from scrapydash.project_index import ProjectIndex
+
+
+def make_project(root, folder, project=None, nested=False):
+    path = root / folder
+    cfg_dir = path / folder if nested else path
+    (cfg_dir / folder / 'spiders').mkdir(parents=True)
+    (cfg_dir / 'scrapy.cfg').write_text('[settings]\ndefault = %s.settings\n\n[deploy]\nproject = %s\n'
+                                        % (folder, project or folder))
+    (cfg_dir / folder / '__init__.py').write_text('')
+    (cfg_dir / folder / 'spiders' / '__init__.py').write_text('')
+    return cfg_dir
+
+
+def test_list_projects(tmp_path):
+    """Test that the projects are found along with the directory of scrapy.cfg and the project name"""
+    make_project(tmp_path, 'demo')
+    nested = make_project(tmp_path, 'Nested', project='other', nested=True)
+    (tmp_path / 'not_a_project').mkdir()
+    index = ProjectIndex(str(tmp_path))
+    projects = index.list_projects()
+    assert [(p['folder'], p['project'], p['cfg_dir']) for p in projects] == [
+        ('demo', 'demo', str(tmp_path / 'demo')), ('Nested', 'other', str(nested))]
+    assert index.get_cfg_dir('Nested') == str(nested)
+    assert index.get_cfg_dir('not_a_project') == '' and index.get_cfg_dir('..') == ''
+
+
+def test_ignored_dirs(tmp_path):
+    """Test that virtualenvs and VCS directories are neither scanned nor taken as projects"""
+    path = make_project(tmp_path, 'demo')
+    for name in ['.git', 'venv', 'demo.egg-info']:
+        (path / name / 'deep').mkdir(parents=True)
+        (path / name / 'deep' / 'scrapy.cfg').write_text('')
+    index = ProjectIndex(str(tmp_path))
+    index.refresh()
+    assert sorted(index.entries['demo'].dirs) == [str(path), str(path / 'demo'), str(path / 'demo' / 'spiders')]
+
+
+def test_incremental_refresh(tmp_path):
+    """Test that a refresh only scans the directories with entries added or removed"""
+    make_project(tmp_path, 'a')
+    path = make_project(tmp_path, 'b')
+    index = ProjectIndex(str(tmp_path), refresh_interval=0)
+    index.refresh()
+    assert index.stats['scanned_dirs'] == 6
+    index.refresh()
+    assert index.stats['scanned_dirs'] == 6
+
+    later = time.time() + 10
+    (path / 'b' / 'spiders' / 'new.py').write_text('')
+    os.utime(str(path / 'b' / 'spiders' / 'new.py'), (later, later))
+    index.refresh()
+    assert index.stats['scanned_dirs'] == 7
+    assert index.entries['b'].latest == later
+
+    (path / 'scrapy.cfg').write_text('[deploy]\nproject = renamed\n')
+    os.utime(str(path / 'scrapy.cfg'), (later + 1, later + 1))
+    index.refresh(full=True)
+    assert [p['project'] for p in index.list_projects()] == ['a', 'renamed']
+
+    shutil.rmtree(str(tmp_path / 'a'))
+    make_project(tmp_path, 'c')
+    assert [p['folder'] for p in index.list_projects()] == ['b', 'c']
+
+
+def test_deploy_projects_route(tmp_path):
+    """Test the projects listed by the API"""
+    make_project(tmp_path, 'demo')
+    app = create_app()
+    app.state.config.update(SCRAPY_PROJECTS_DIR=str(tmp_path))
+    client = TestClient(app)
+    js = client.get('/api/deploy/projects').json()
+    assert js['status'] == 'ok' and [p['folder'] for p in js['projects']] == ['demo']
+    assert js['index']['refreshes'] == 1
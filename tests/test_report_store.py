@@ -0,0 +1,237 @@
+# coding: utf-8
+"""
+Tests for the report store of finished jobs and the reports of a job across the cluster
+"""
+import asyncio
+import json
+from datetime import datetime, timedelta
+
+from fastapi.testclient import TestClient
+import httpx
+import pytest
+from logparser import __version__ as LOGPARSER_VERSION
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from scrapydash import report_store
+from scrapydash.app import create_app
+from scrapydash.log_reader import LogNotFound, parse_range_header, resolved_urls
+from scrapydash.log_stats import LogStatsEngine, request_logparser_stats
+from scrapydash.models import JobReport
+from scrapydash.report_store import REPORT_KEYS_SET, ReportStore, make_report, merge_reports
+from scrapydash.scrapyd_client import ScrapydClient
+
+
+def make_session_factory():
+    engine = create_engine('sqlite://', connect_args=dict(check_same_thread=False), poolclass=StaticPool)
+    return sessionmaker(bind=engine)
+
+
+def make_stats(pages, finish_reason='finished'):
+    return dict(pages=pages, items=pages // 2, shutdown_reason='N/A', finish_reason=finish_reason,
+                runtime='0:01:00', first_log_time='2026-01-01 00:00:00', latest_log_time='2026-01-01 00:01:00',
+                log_categories=dict(error_logs=dict(count=2, details=['a', 'b'])),
+                latest_matches=dict(latest_item="{'a': 1}", latest_crawl='Crawled'), head='...', tail='...')
+
+
+def test_make_report():
+    """Test that only the keys for the reports are kept"""
+    report = make_report(make_stats(10))
+    assert set(report) == REPORT_KEYS_SET
+    assert report['log_categories'] == dict(error_logs=dict(count=2))
+    assert report['latest_matches'] == dict(latest_item="{'a': 1}")
+
+
+def test_store_survives_restart():
+    """Test that the reports are loaded from the database by a new store, and cached afterwards"""
+    Session = make_session_factory()
+    store = ReportStore(Session)
+    store.put(1, 'demo', 'test', 'a', make_stats(10))
+    store.put(2, 'demo', 'test', 'a', make_stats(20))
+    store.put(1, 'demo', 'test', 'b', make_stats(30))
+    store.put(1, 'demo', 'test', 'b', make_stats(40))
+
+    store = ReportStore(Session)
+    assert store.get(1, 'demo', 'test', 'b')['pages'] == 40
+    assert store.get(1, 'demo', 'test', 'c') is None
+    reports = store.get_many('demo', 'test', 'a', [1, 2, 3])
+    assert dict((node, report['pages']) for node, report in reports.items()) == {1: 10, 2: 20}
+    assert len(store.cache) == 3
+    assert [(item['job'], item['pages']) for item in store.list(1)] == [('b', 40), ('a', 10)]
+    assert store.list(1, spider='other') == []
+
+
+def test_compact(monkeypatch):
+    """Test that the reports beyond the limits of size and age are dropped, from the LRU as well"""
+    monkeypatch.setattr(report_store, 'DELETE_BATCH', 2)
+    Session = make_session_factory()
+    store = ReportStore(Session, limit=3, max_age=30)
+    for i in range(6):
+        store.put(1, 'demo', 'test', str(i), make_stats(i))
+    session = Session()
+    session.query(JobReport).filter_by(job='5').update(dict(update_time=datetime.now() - timedelta(days=31)))
+    session.commit()
+
+    assert store.compact() == 3
+    assert sorted(row.job for row in session.query(JobReport)) == ['2', '3', '4']
+    assert store.get(1, 'demo', 'test', '0') is None and store.get(1, 'demo', 'test', '5') is None
+    assert store.compact() == 0
+    assert store.compact(now=datetime.now() + timedelta(days=31)) == 3
+
+
+def test_report_route(tmp_path):
+    """Test that the report of a finished job is parsed once, then served from the store after a restart"""
+    Session = make_session_factory()
+    body = (b'2026-01-01 00:00:00 [scrapy.utils.log] INFO: Scrapy 2.11.0 started (bot: demo)\n'
+            b'2026-01-01 00:01:00 [scrapy.extensions.logstats] INFO: Crawled 10 pages (at 10 pages/min), '
+            b'scraped 5 items (at 5 items/min)\n'
+            b'2026-01-01 00:02:00 [scrapy.statscollectors] INFO: Dumping Scrapy stats:\n'
+            b"{'finish_reason': 'finished',\n 'item_scraped_count': 5,\n 'response_received_count': 10}\n"
+            b'2026-01-01 00:02:00 [scrapy.core.engine] INFO: Spider closed (finished)\n')
+    requests = []
+
+    def handler(request):
+        requests.append(request.method)
+        if request.method == 'HEAD':
+            return httpx.Response(200, headers={'Content-Length': str(len(body))})
+        start, end = parse_range_header(request.headers['range'], len(body))
+        return httpx.Response(206, content=body[start:end])
+
+    def make_client():
+        app = create_app()
+        app.state.config.update(SCRAPYD_SERVERS=['127.0.0.1:6800'], SCRAPYD_SERVERS_AUTHS=[None],
+                                SCRAPYD_LOG_EXTENSIONS=['.log'])
+        app.state.scrapyd_client = ScrapydClient(transport=httpx.MockTransport(handler))
+        app.state.log_stats_engine = LogStatsEngine(str(tmp_path))
+        app.state.report_store = ReportStore(Session)
+        return TestClient(app)
+
+    resolved_urls.clear()
+    client = make_client()
+    js = client.get('/api/1/log/demo/test/job/report', params=dict(job_finished='true')).json()
+    assert (js['pages'], js['finish_reason'], js['from_memory']) == (10, 'finished', False)
+    count = len(requests)
+
+    client = make_client()
+    js = client.get('/api/1/log/demo/test/job/report').json()
+    assert (js['pages'], js['finish_reason'], js['from_memory']) == (10, 'finished', True)
+    assert len(requests) == count
+    js = client.get('/api/1/reports').json()
+    assert [(item['job'], item['items']) for item in js['items']] == [('job', 5)]
+    assert client.get('/api/2/reports').status_code == 404
+
+
+def test_merge_reports():
+    """Test the totals of the reports of a job on multiple nodes"""
+    reports = [make_report(make_stats(10)), make_report(make_stats(20, finish_reason='shutdown')),
+               make_report(make_stats(30, finish_reason='N/A'))]
+    reports[2].update(pages=None, first_log_time='2025-12-31 23:00:00')
+    totals = merge_reports(reports)
+    assert (totals['nodes'], totals['finished'], totals['pages'], totals['items']) == (3, 2, 30, 30)
+    assert totals['log_categories'] == dict(error_logs=6)
+    assert totals['finish_reasons'] == dict(finished=1, shutdown=1)
+    assert (totals['first_log_time'], totals['latest_log_time']) == ('2025-12-31 23:00:00', '2026-01-01 00:01:00')
+
+
+def test_cluster_reports_route(tmp_path):
+    """Test that the reports of the nodes are gathered concurrently from the store, LogParser and the logfiles"""
+    Session = make_session_factory()
+    logparser_stats = dict(make_stats(20), logparser_version=LOGPARSER_VERSION)
+    body = (b'2026-01-01 00:00:00 [scrapy.utils.log] INFO: Scrapy 2.11.0 started (bot: demo)\n'
+            b'2026-01-01 00:01:00 [scrapy.extensions.logstats] INFO: Crawled 30 pages (at 30 pages/min), '
+            b'scraped 15 items (at 15 items/min)\n'
+            b'2026-01-01 00:02:00 [test] WARNING: warning\n')
+    in_flight = [0, 0]
+
+    async def handler(request):
+        in_flight[0] += 1
+        in_flight[1] = max(in_flight)
+        await asyncio.sleep(0.05)
+        in_flight[0] -= 1
+        port, path = request.url.port, request.url.path
+        if port == 6802 and path.endswith('/job.json'):
+            return httpx.Response(200, json=logparser_stats)
+        if port == 6803 and path.endswith('/job.log'):
+            if request.method == 'HEAD':
+                return httpx.Response(200, headers={'Content-Length': str(len(body))})
+            start, end = parse_range_header(request.headers['range'], len(body))
+            return httpx.Response(206, content=body[start:end])
+        return httpx.Response(404)
+
+    app = create_app()
+    app.state.config.update(SCRAPYD_SERVERS=['127.0.0.1:%s' % port for port in range(6801, 6805)],
+                            SCRAPYD_SERVERS_AUTHS=[None] * 4, SCRAPYD_LOG_EXTENSIONS=['.log'])
+    app.state.scrapyd_client = ScrapydClient(transport=httpx.MockTransport(handler))
+    app.state.log_stats_engine = LogStatsEngine(str(tmp_path))
+    app.state.report_store = ReportStore(Session)
+    app.state.report_store.put(1, 'demo', 'test', 'job', make_stats(10))
+    resolved_urls.clear()
+    client = TestClient(app)
+
+    js = client.get('/api/cluster/reports/demo/test/job', params=dict(job_finished='true')).json()
+    assert [(node, report['status'], report.get('source')) for node, report in js['nodes'].items()] == [
+        ('1', 'ok', 'store'), ('2', 'ok', 'logparser'), ('3', 'ok', 'log'), ('4', 'error', None)]
+    assert js['nodes']['4']['status_code'] == 404
+    assert (js['ok'], js['error']) == (3, 1)
+    assert (js['totals']['pages'], js['totals']['items']) == (60, 30)
+    assert js['totals']['log_categories']['warning_logs'] == 1
+    assert in_flight[1] > 1
+    # The report of LogParser is kept for the next time
+    assert app.state.report_store.get(2, 'demo', 'test', 'job')['pages'] == 20
+
+    js = client.get('/api/cluster/reports/demo/test/job', params=dict(nodes='1,2')).json()
+    assert [report['source'] for report in js['nodes'].values()] == ['store', 'store']
+    assert client.get('/api/cluster/reports/demo/test/job', params=dict(nodes='5')).status_code == 404
+
+
+def test_logparser_stats_invalid(tmp_path):
+    """Test that stats still being written by LogParser are taken as not available, falling back to the logfile"""
+    body = b'2026-01-01 00:00:00 [scrapy.utils.log] INFO: Scrapy 2.11.0 started (bot: demo)\n'
+
+    def handler(request):
+        if request.url.path.endswith('/job.json'):
+            return httpx.Response(200, content=b'{"pages": 20, "logparser_ver')
+        if request.method == 'HEAD':
+            return httpx.Response(200, headers={'Content-Length': str(len(body))})
+        start, end = parse_range_header(request.headers['range'], len(body))
+        return httpx.Response(206, content=body[start:end])
+
+    client = ScrapydClient(transport=httpx.MockTransport(handler))
+    config = dict(SCRAPYD_SERVERS=['127.0.0.1:6800'], SCRAPYD_SERVERS_AUTHS=[None], SCRAPYD_LOG_EXTENSIONS=['.log'])
+    assert asyncio.run(request_logparser_stats(client, config, 1, 'demo', 'test', 'job')) is None
+    logs_dir = tmp_path / 'logs'
+    (logs_dir / 'demo' / 'test').mkdir(parents=True)
+    (logs_dir / 'demo' / 'test' / 'job.json').write_bytes(b'{"pages": 20, "logparser_ver')
+    local_config = dict(config, LOCAL_SCRAPYD_SERVER='127.0.0.1:6800', LOCAL_SCRAPYD_LOGS_DIR=str(logs_dir))
+    assert asyncio.run(request_logparser_stats(client, local_config, 1, 'demo', 'test', 'job')) is None
+
+    app = create_app()
+    app.state.config.update(config)
+    app.state.scrapyd_client = client
+    app.state.log_stats_engine = LogStatsEngine(str(tmp_path / 'stats'))
+    app.state.report_store = ReportStore(make_session_factory())
+    resolved_urls.clear()
+    js = TestClient(app).get('/api/cluster/reports/demo/test/job').json()
+    assert (js['nodes']['1']['status'], js['nodes']['1']['source']) == ('ok', 'log')
+
+
+def test_logparser_stats_path_traversal(tmp_path):
+    """Test that the stats of LogParser are never read outside LOCAL_SCRAPYD_LOGS_DIR"""
+    logs_dir = tmp_path / 'a' / 'b' / 'logs'
+    logs_dir.mkdir(parents=True)
+    (tmp_path / 'a' / 'secret.json').write_text(json.dumps(dict(make_stats(10), logparser_version=LOGPARSER_VERSION)))
+    client = ScrapydClient(transport=httpx.MockTransport(lambda request: httpx.Response(404)))
+    config = dict(SCRAPYD_SERVERS=['127.0.0.1:6800'], SCRAPYD_SERVERS_AUTHS=[None],
+                  LOCAL_SCRAPYD_SERVER='127.0.0.1:6800', LOCAL_SCRAPYD_LOGS_DIR=str(logs_dir))
+    with pytest.raises(LogNotFound):
+        asyncio.run(request_logparser_stats(client, config, 1, '..', '..', 'secret'))
+
+    app = create_app()
+    app.state.config.update(config)
+    app.state.scrapyd_client = client
+    app.state.log_stats_engine = LogStatsEngine(str(tmp_path / 'stats'))
+    app.state.report_store = ReportStore(make_session_factory())
+    js = TestClient(app).get('/api/cluster/reports/%2e%2e/%2e%2e/secret').json()
+    assert js['nodes']['1']['status_code'] == 404 and js['ok'] == 0
+    assert TestClient(app).get('/api/1/log/%2e%2e/%2e%2e/secret/stats').status_code == 404
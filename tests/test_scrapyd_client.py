@@ -0,0 +1,95 @@
+# coding: utf-8
+"""
+Tests for the pooled async Scrapyd client and the API proxy built on it
+"""
+import asyncio
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from scrapydash.app import create_app
+from scrapydash.scrapyd_client import ScrapydClient, get_scrapyd_server, parse_scrapyd_server
+
+
+def test_parse_scrapyd_server():
+    """Test parsing of inline auth and scheme"""
+    assert parse_scrapyd_server('127.0.0.1:6800') == ('http://127.0.0.1:6800', None)
+    assert parse_scrapyd_server('admin:12345@127.0.0.1:6800') == ('http://127.0.0.1:6800', ('admin', '12345'))
+    assert parse_scrapyd_server('https://a.b.com/', ['admin', '12345']) == ('https://a.b.com', ('admin', '12345'))
+
+
+def test_get_scrapyd_server():
+    """Test node lookup with SCRAPYD_SERVERS_AUTHS"""
+    config = dict(SCRAPYD_SERVERS=['127.0.0.1:6800', '127.0.0.1:6801'],
+                  SCRAPYD_SERVERS_AUTHS=[None, ('admin', '12345')])
+    assert get_scrapyd_server(config, 1) == ('http://127.0.0.1:6800', None)
+    assert get_scrapyd_server(config, 2) == ('http://127.0.0.1:6801', ('admin', '12345'))
+    with pytest.raises(IndexError):
+        get_scrapyd_server(config, 3)
+
+
+def test_one_pool_per_node():
+    """Test that each Scrapyd server gets its own connection pool"""
+    async def run():
+        client = ScrapydClient()
+        first = client.get_client('http://127.0.0.1:6800/listprojects.json')
+        assert client.get_client('http://127.0.0.1:6800/daemonstatus.json') is first
+        assert client.get_client('http://127.0.0.1:6801/daemonstatus.json') is not first
+        await client.aclose()
+        assert client.closed
+    asyncio.run(run())
+
+
+def test_api_endpoint_proxy():
+    """Test that api_endpoint proxies via the shared client"""
+    def handler(request):
+        assert request.url.path == '/listversions.json'
+        assert request.url.params['project'] == 'demo'
+        return httpx.Response(200, json={'status': 'ok', 'versions': ['v1']})
+
+    app = create_app()
+    app.state.scrapyd_client = ScrapydClient(app.state.config, transport=httpx.MockTransport(handler))
+    response = TestClient(app).get('/api/1/api/listversions/demo')
+    assert response.status_code == 200
+    assert response.json() == {'status': 'ok', 'versions': ['v1']}
+
+
+def test_api_endpoint_connect_error():
+    """Test that an unreachable node returns an error instead of raising"""
+    def handler(request):
+        raise httpx.ConnectError('Connection refused', request=request)
+
+    app = create_app()
+    app.state.scrapyd_client = ScrapydClient(app.state.config, transport=httpx.MockTransport(handler))
+    response = TestClient(app).get('/api/2/api/daemonstatus')
+    assert response.status_code == 500
+    assert response.json()['status'] == 'error'
+    assert response.json()['server'] == 'http://127.0.0.1:6801'
+
+
+def test_cluster_api_endpoint():
+    """Test that the cluster endpoint merges the answers of all selected nodes"""
+    def handler(request):
+        if request.url.port == 6801:
+            raise httpx.ConnectError('Connection refused', request=request)
+        return httpx.Response(200, json={'status': 'ok', 'running': request.url.port - 6800})
+
+    app = create_app()
+    app.state.config['SCRAPYD_SERVERS_GROUPS'] = ['group', '', 'group']
+    app.state.scrapyd_client = ScrapydClient(app.state.config, transport=httpx.MockTransport(handler))
+    client = TestClient(app)
+
+    js = client.get('/api/cluster/api/daemonstatus').json()
+    assert js['opt'] == 'daemonstatus'
+    assert sorted(js['nodes']) == ['1', '2', '3']
+    assert js['nodes']['3']['running'] == 2
+    assert js['nodes']['2']['status'] == 'error'
+    assert (js['ok'], js['error']) == (2, 1)
+
+    js = client.get('/api/cluster/api/daemonstatus?group=group').json()
+    assert sorted(js['nodes']) == ['1', '3']
+    js = client.get('/api/cluster/api/daemonstatus?nodes=1,2').json()
+    assert sorted(js['nodes']) == ['1', '2']
+    assert client.get('/api/cluster/api/daemonstatus?nodes=4').status_code == 404
+    assert client.get('/api/cluster/api/daemonstatus?group=fake').status_code == 404
@@ -0,0 +1,70 @@
+# coding: utf-8
+"""
+Tests for dispatching timer tasks to Scrapyd directly
+"""
+import asyncio
+import base64
+from datetime import datetime
+from types import SimpleNamespace
+from urllib.parse import parse_qs
+
+import httpx
+
+from scrapydash.scrapyd_client import ScrapydClient
+from scrapydash.task_dispatch import DEFAULT_LATEST_VERSION, TaskDispatcher, build_schedule_payload
+
+
+def make_task(**kwargs):
+    task = dict(id=1, project='demo', version='v1', spider='test', update_time=datetime(2019, 1, 1),
+                settings_arguments='{"arg1": "val1", "setting": ["CLOSESPIDER_PAGECOUNT=10", "LOG_LEVEL=INFO"]}')
+    task.update(kwargs)
+    return SimpleNamespace(**task)
+
+
+def test_build_schedule_payload():
+    """Test that the payload matches what the schedule.task view used to send"""
+    payload = build_schedule_payload(make_task())
+    assert payload == dict(project='demo', _version='v1', spider='test', arg1='val1',
+                           setting=['CLOSESPIDER_PAGECOUNT=10', 'LOG_LEVEL=INFO'])
+    assert '_version' not in build_schedule_payload(make_task(version=DEFAULT_LATEST_VERSION))
+
+
+def test_payload_cached_until_task_updated():
+    """Test that the payload is built once per version of the task"""
+    dispatcher = TaskDispatcher()
+    task = make_task()
+    payload = dispatcher.get_payload(task)
+    assert dispatcher.get_payload(make_task()) is payload
+    updated = make_task(update_time=datetime(2019, 1, 2), settings_arguments='{"setting": []}')
+    assert dispatcher.get_payload(updated) == dict(project='demo', _version='v1', spider='test', setting=[])
+    dispatcher.invalidate(task.id)
+    assert task.id not in dispatcher.payloads
+
+
+def test_dispatch():
+    """Test that the task is posted to schedule.json of the node with auth"""
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        return httpx.Response(200, json=dict(node_name='scrapyd2', status='ok', jobid='task_1_2019'))
+
+    config = dict(SCRAPYD_SERVERS=['127.0.0.1:6800', 'admin:12345@127.0.0.1:6801'])
+    dispatcher = TaskDispatcher(config, ScrapydClient(config, transport=httpx.MockTransport(handler)))
+    payload = dispatcher.get_payload(make_task())
+
+    async def main():
+        try:
+            return await dispatcher.dispatch(2, payload, 'task_1_2019')
+        finally:
+            await dispatcher.scrapyd_client.aclose()
+
+    js = asyncio.run(main())
+    assert js == dict(node_name='scrapyd2', status='ok', jobid='task_1_2019',
+                      url='http://127.0.0.1:6801/schedule.json', status_code=200)
+    assert str(requests[0].url) == 'http://127.0.0.1:6801/schedule.json'
+    assert requests[0].headers['Authorization'] == 'Basic %s' % base64.b64encode(b'admin:12345').decode()
+    data = parse_qs(requests[0].content.decode())
+    assert data['setting'] == ['CLOSESPIDER_PAGECOUNT=10', 'LOG_LEVEL=INFO']
+    assert data['jobid'] == ['task_1_2019'] and data['_version'] == ['v1']
+    assert 'jobid' not in payload
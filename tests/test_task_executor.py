@@ -0,0 +1,166 @@
+# coding: utf-8
+"""
+Tests for the concurrent execution of timer tasks
+"""
+import asyncio
+import threading
+import time
+
+from apscheduler.schedulers.background import BackgroundScheduler
+
+import httpx
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from scrapydash import task_dispatch
+from scrapydash.models import Task, TaskJobResult, TaskResult, db, ensure_table
+from scrapydash.scrapyd_client import ScrapydClient
+from scrapydash.task_dispatch import TaskDispatcher, build_schedule_payload
+from scrapydash.task_executor import TaskExecutor, execute_task, task_runner
+
+
+SCRAPYD_SERVERS = ['127.0.0.1:%s' % (6800 + i) for i in range(1, 21)]
+TASK_KWARGS = dict(trigger='cron', project='demo', version='v1', spider='test', jobid='', settings_arguments='{}',
+                   selected_nodes='[1, 2]', year='*', month='*', day='*', week='*', day_of_week='*', hour='*',
+                   minute='0', second='0', jitter=0, coalesce='True', max_instances=1)
+
+
+def make_session_factory():
+    engine = create_engine('sqlite://', connect_args=dict(check_same_thread=False), poolclass=StaticPool)
+    for model in (Task, TaskResult, TaskJobResult):
+        ensure_table(model.__table__, engine)
+    return sessionmaker(bind=engine)
+
+
+def add_task(Session):
+    session = Session()
+    task = Task(name='task', **TASK_KWARGS)
+    session.add(task)
+    session.commit()
+    task_id = task.id
+    session.close()
+    return task_id
+
+
+def make_executor(Session, task_id, nodes, handler):
+    session = Session()
+    payload = build_schedule_payload(session.get(Task, task_id))
+    session.close()
+    dispatcher = TaskDispatcher(dict(SCRAPYD_SERVERS=SCRAPYD_SERVERS),
+                                ScrapydClient(transport=httpx.MockTransport(handler)))
+    executor = TaskExecutor(task_id, 'task', nodes, payload, dispatcher=dispatcher, session_factory=Session)
+    executor.sleep_seconds_before_retry = 0.01
+    return executor
+
+
+def test_execute_task_concurrently():
+    """Test that all nodes are fired at once, and failed nodes are retried"""
+    attempts = {}
+
+    async def handler(request):
+        node = request.url.port - 6800
+        assert request.url.path == '/schedule.json'
+        attempts[node] = attempts.get(node, 0) + 1
+        await asyncio.sleep(0.1)
+        if node == 3 and attempts[node] == 1:
+            raise httpx.ConnectError('refused', request=request)
+        if node == 4:
+            return httpx.Response(200, json=dict(status='error', message='spider not found'))
+        return httpx.Response(200, json=dict(status='ok', jobid='jobid'))
+
+    Session = make_session_factory()
+    task_id = add_task(Session)
+    executor = make_executor(Session, task_id, list(range(1, 21)), handler)
+    start = time.monotonic()
+    asyncio.run(executor.main())
+    # 3 rounds at most: the first attempt and 2 retries
+    assert time.monotonic() - start < 0.1 * 3 + 0.01 * 3 + 0.5
+    assert attempts[1] == 1 and attempts[3] == 2 and attempts[4] == 3
+    assert (executor.pass_count, executor.fail_count) == (19, 1)
+
+    session = Session()
+    task_result = session.query(TaskResult).one()
+    assert (task_result.pass_count, task_result.fail_count) == (19, 1)
+    task_job_results = dict((r.node, r) for r in session.query(TaskJobResult))
+    assert len(task_job_results) == 20
+    assert task_job_results[3].status == 'ok' and task_job_results[3].server == '127.0.0.1:6803'
+    assert task_job_results[4].status == 'error' and task_job_results[4].result == 'spider not found'
+
+
+def test_execute_deleted_task():
+    """Test that the task_result is discarded if the task has been deleted meanwhile"""
+    Session = make_session_factory()
+    task_id = add_task(Session)
+
+    async def handler(request):
+        session = Session()
+        session.query(Task).delete()
+        session.commit()
+        session.close()
+        return httpx.Response(200, json=dict(status='ok', jobid='jobid'))
+
+    asyncio.run(make_executor(Session, task_id, [1], handler).main())
+    session = Session()
+    assert session.query(TaskResult).count() == 0
+    assert session.query(TaskJobResult).count() == 0
+
+
+def test_execute_task_without_overlap(monkeypatch):
+    """Test that the trigger firing during a slow run is skipped, as the run holds the slot of max_instances"""
+    Session = make_session_factory()
+    task_id = add_task(Session)
+    monkeypatch.setattr(db, 'Session', Session)
+    requests = []
+
+    async def handler(request):
+        requests.append(request.url.port)
+        await asyncio.sleep(1)
+        return httpx.Response(200, json=dict(status='ok', jobid='jobid'))
+
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    scheduler = BackgroundScheduler(job_defaults=dict(coalesce=True, max_instances=1))
+    try:
+        task_runner.attach(loop, ScrapydClient(transport=httpx.MockTransport(handler)),
+                           dict(SCRAPYD_SERVERS=SCRAPYD_SERVERS))
+        scheduler.add_job(execute_task, 'interval', args=[task_id], seconds=0.2)
+        scheduler.start()
+        time.sleep(1)  # The trigger fires 4 times or so during the first run
+        scheduler.shutdown(wait=True)
+    finally:
+        task_runner.detach()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+    assert sorted(requests) == [6801, 6802]
+    session = Session()
+    task_result = session.query(TaskResult).one()
+    assert (task_result.pass_count, task_result.fail_count) == (2, 0)
+
+
+def test_execute_task_detached(monkeypatch):
+    """Test that a task fired while the app is detached goes to the servers in the config of the app"""
+    Session = make_session_factory()
+    task_id = add_task(Session)
+    monkeypatch.setattr(db, 'Session', Session)
+    requests = []
+
+    def handler(request):
+        requests.append((request.url.port, request.read()))
+        return httpx.Response(200, json=dict(status='ok', jobid='jobid'))
+
+    monkeypatch.setattr(task_dispatch, 'ScrapydClient',
+                        lambda config: ScrapydClient(config, transport=httpx.MockTransport(handler)))
+    monkeypatch.setattr(task_runner, 'config', {})
+    task_runner.detach()
+    with pytest.raises(RuntimeError, match='SCRAPYD_SERVERS'):
+        execute_task(task_id)
+    monkeypatch.setattr(task_runner, 'config', dict(SCRAPYD_SERVERS=SCRAPYD_SERVERS))
+    execute_task(task_id)
+    assert sorted(port for port, __ in requests) == [6801, 6802]
+    assert all(b'project=demo' in content and b'spider=test' in content for __, content in requests)
+    session = Session()
+    assert session.query(TaskResult).one().pass_count == 2
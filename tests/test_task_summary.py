@@ -0,0 +1,83 @@
+# coding: utf-8
+"""
+Tests for the summary of timer tasks
+"""
+from datetime import datetime
+import random
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from scrapydash.models import Task, TaskJobResult, TaskResult, ensure_table
+from scrapydash.task_summary import summarize_tasks
+
+
+TASK_KWARGS = dict(trigger='cron', project='demo', version='v1', spider='test', jobid='', settings_arguments='{}',
+                   selected_nodes='[1, 2]', year='*', month='*', day='*', week='*', day_of_week='*', hour='*',
+                   minute='0', second='0', jitter=0, coalesce='True', max_instances=1)
+
+
+class FakeApschedulerJob(object):
+    def __init__(self, id, next_run_time):
+        self.id = id
+        self.next_run_time = next_run_time
+
+
+class FakeScheduler(object):
+    def __init__(self, jobs):
+        self.jobs = jobs
+
+    def get_jobs(self, jobstore=None):
+        return self.jobs
+
+
+def test_summarize_tasks():
+    """Test that a page of 100 tasks is summarized with a single query, like the per-task queries of TasksView"""
+    engine = create_engine('sqlite://')
+    session = sessionmaker(bind=engine)()
+    for model in (Task, TaskResult, TaskJobResult):
+        ensure_table(model.__table__, engine)
+    rng = random.Random(0)
+    tasks = [Task(name='task_%s' % i, **TASK_KWARGS) for i in range(100)]
+    session.add_all(tasks)
+    session.flush()
+    for task in tasks:
+        for __ in range(rng.randint(0, 4)):
+            fail_count = rng.randint(0, 1)
+            task_result = TaskResult(task_id=task.id, fail_count=fail_count, pass_count=1 - fail_count)
+            session.add(task_result)
+            session.flush()
+            for node in (1, 2)[:rng.randint(1, 2)]:
+                session.add(TaskJobResult(task_result_id=task_result.id, node=node, server='127.0.0.1:680%s' % node,
+                                          status_code=200, status='ok',
+                                          result='task_%s_2026-01-01T00_00_0%s' % (task.id, node)))
+    session.commit()
+    tasks = session.query(Task).order_by(Task.id.desc()).limit(100).all()  # The page
+
+    statements = []
+    event.listen(engine, 'before_cursor_execute', lambda conn, cursor, statement, *args: statements.append(statement))
+    scheduler = FakeScheduler([FakeApschedulerJob(str(tasks[0].id), datetime(2026, 1, 1)),
+                               FakeApschedulerJob(str(tasks[1].id), None)])  # Its jobstore query is not counted
+    summaries = summarize_tasks(session, tasks, scheduler)
+    assert len(statements) == 1
+
+    for task in tasks:
+        summary = summaries[task.id]
+        task_results = session.query(TaskResult).filter_by(task_id=task.id).order_by(TaskResult.id.desc()).all()
+        assert summary['run_times'] == len(task_results)
+        assert summary['fail_times'] == sum([int(t.fail_count > 0) for t in task_results])
+        if not task_results:
+            assert summary['prev_run_result'] is None
+            continue
+        latest = task_results[0]
+        if latest.fail_count == 0 and latest.pass_count == 1:
+            task_job_result = session.query(TaskJobResult).filter_by(task_result_id=latest.id).order_by(
+                TaskJobResult.id.desc()).first()
+            assert summary['prev_run_result'] == task_job_result.result[-19:]
+            assert summary['prev_run_node'] == task_job_result.node
+        else:
+            assert summary['prev_run_result'] == 'FAIL 1, PASS 0'
+    assert summaries[tasks[0].id]['status'] == 'Running'
+    assert summaries[tasks[0].id]['next_run_time'] == '2026-01-01 00:00:00'
+    assert summaries[tasks[1].id]['status'] == 'Paused'
+    assert summaries[tasks[2].id]['status'] == 'Finished'
@@ -0,0 +1,61 @@
+# coding: utf-8
+"""
+Tests for the lazy initialization of scrapydash.vars
+"""
+import json
+import os
+import re
+import subprocess
+import sys
+
+# Upper bound of the cumulative time of 'import scrapydash', in seconds
+IMPORT_TIME_BUDGET = float(os.environ.get('SCRAPYDASH_IMPORT_TIME_BUDGET', 3))
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_python(code, cwd):
+    env = dict(os.environ, DATA_PATH=os.path.join(str(cwd), 'data'), PYTHONPATH=PACKAGE_DIR)
+    return subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=str(cwd), env=env,
+                          capture_output=True, text=True, check=True)
+
+
+def test_import_without_io(tmp_path):
+    """Test that importing scrapydash creates no file, and measure how long it takes"""
+    result = run_python("import sys, scrapydash; print(sorted(m for m in sys.modules if m in ['scrapy', 'scrapyd']))",
+                        tmp_path)
+    assert os.listdir(str(tmp_path)) == []
+    assert result.stdout.strip() == '[]'
+    # import time:     self [us] | cumulative | imported package
+    m = re.search(r'import time:\s+\d+ \|\s+(\d+) \| scrapydash$', result.stderr, re.M)
+    seconds = int(m.group(1)) / 1e6
+    assert seconds < IMPORT_TIME_BUDGET, "import scrapydash took %.3fs" % seconds
+
+
+def test_import_app_without_scrapy(tmp_path):
+    """Test that importing the app, along with all its routers, imports neither scrapy nor scrapyd"""
+    code = '\n'.join([
+        "import sys, scrapydash.app",
+        "from scrapydash import vars",
+        # Checked even if scrapy is not installed, in which case the lookup would not show up in sys.modules
+        "assert not [name for name in ['SCRAPY_VERSION', 'SCRAPYD_VERSION'] if name in vars.runtime.values]",
+        "print(sorted(m for m in sys.modules if m.split('.')[0] in ['scrapy', 'scrapyd']))",
+    ])
+    assert run_python(code, tmp_path).stdout.strip() == '[]'
+
+
+def test_init_phases(tmp_path):
+    """Test that the names are resolved on first access, running only the phases they depend on"""
+    code = '\n'.join([
+        "import json, os",
+        "from scrapydash import vars",
+        "assert vars.DATABASE_URL.startswith('sqlite:///')",
+        "assert vars.runtime.phases_done == ['settings'] and not os.path.exists(vars.runtime.values['DATA_PATH'])",
+        "stats_path = vars.STATS_PATH",
+        "assert vars.runtime.phases_done == ['settings', 'paths'] and os.path.isdir(stats_path)",
+        "assert os.path.isfile(vars.RUN_SPIDER_HISTORY_LOG)",
+        "print(json.dumps(vars.init()))",
+    ])
+    timings = json.loads(run_python(code, tmp_path).stdout)
+    assert list(timings) == ['settings', 'paths', 'database']
+    assert sorted(os.listdir(str(tmp_path / 'data'))) == ['database', 'demo_projects', 'deploy', 'history_log',
+                                                          'parse', 'schedule', 'stats']